@@ -31,13 +31,22 @@
 
 import asyncio
 import argparse
+import array
 import base64
+import bisect
+import concurrent.futures
+import contextlib
 import copy
 import csv
+import functools
 import glob as globmod
+import hashlib
+import io
 import http.client
 import ipaddress
+import itertools
 import json
+import operator
 import os
 import platform as _platform
 import random
@@ -46,7 +55,6 @@ import shutil
 import signal
 import socket
 import ssl
-import statistics
 import subprocess
 import sys
 import time
@@ -56,7 +64,7 @@ import urllib.request
 import zipfile
 from collections import defaultdict
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 
 VERSION = "1.2"
@@ -73,13 +81,15 @@ SPEED_TIMEOUT = 30.0
 CDN_FALLBACK = ("cloudflaremirrors.com", "/archlinux/iso/latest/archlinux-x86_64.iso")
 
 # Cloudflare published IPv4 ranges (https://www.cloudflare.com/ips-v4/)
-CF_SUBNETS = [
+# A tuple, like --subnets after _load_subnets(), so either one is used
+# directly as the _blocks_24() cache key
+CF_SUBNETS = (
     "173.245.48.0/20", "103.21.244.0/22", "103.22.200.0/22",
     "103.31.4.0/22", "141.101.64.0/18", "108.162.192.0/18",
     "190.93.240.0/20", "188.114.96.0/20", "197.234.240.0/22",
     "198.41.128.0/17", "162.158.0.0/15", "104.16.0.0/13",
     "104.24.0.0/14", "172.64.0.0/13",
-]
+)
 
 CF_HTTPS_PORTS = [443, 8443, 2053, 2083, 2087, 2096]
 
@@ -126,12 +136,17 @@ def _generate_random_cf_ips(count: int = 100) -> List[str]:
     random.shuffle(blocks)
     ips: List[str] = []
     for blk in blocks[:count]:
-        hosts = list(blk.hosts())
-        ips.append(str(random.choice(hosts)))
+        # Same pick as random.choice(list(blk.hosts())) without building
+        # the host list: usable hosts skip network/broadcast except in /31, /32
+        n = 1 << (32 - blk.prefixlen)
+        first = 1 if n > 2 else 0
+        base = int(blk.network_address) + first
+        ips.append(str(ipaddress.IPv4Address(base + random.randrange(n - 2 * first))))
     return ips
 
 
 CF_TEST_IPS = _generate_random_cf_ips(6666)
+MAX_CUSTOM_IPS = 6666  # custom IP/CIDR sets larger than this are sampled
 _CF_NETS = [ipaddress.IPv4Network(s, strict=False) for s in CF_SUBNETS]
 
 
@@ -202,6 +217,34 @@ DEPLOY_XRAY_CONFIG_DIR = "/usr/local/etc/xray"
 DEPLOY_XRAY_SHARE = "/usr/local/share/xray"
 DEPLOY_XRAY_SERVICE = "/etc/systemd/system/xray.service"
 DEPLOY_XRAY_BACKUP_DIR = "/usr/local/etc/xray/backups"
+# Constant leaves of generated server configs. Shared by reference:
+# they are only ever serialised, never mutated in place.
+_SNIFFING_DEST_OVERRIDE = ["http", "tls", "quic"]
+_SERVER_OUTBOUNDS = [
+    {"tag": "direct", "protocol": "freedom"},
+    {"tag": "block", "protocol": "blackhole"},
+]
+_SERVER_ROUTING = {
+    "domainStrategy": "AsIs",
+    "rules": [
+        {"type": "field", "ip": ["geoip:private"], "outboundTag": "block"},
+    ],
+}
+_TCP_HTTP_HEADER = {
+    "header": {
+        "type": "http",
+        "response": {
+            "version": "1.1",
+            "status": "200",
+            "reason": "OK",
+        },
+    },
+}
+# Server config temp files: close-on-exec so xray/systemctl children never
+# inherit the fd, and one buffer big enough to flush the JSON in one write
+_CONFIG_OPEN_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_CLOEXEC", 0)
+_CONFIG_WRITE_BUF = 1 << 20
+_DOMAIN_RE = re.compile(r'^[a-zA-Z0-9]([a-zA-Z0-9._-]{0,253}[a-zA-Z0-9])?$')
 
 DEPLOY_SYSTEMD_UNIT = """\
 [Unit]
@@ -285,6 +328,21 @@ class A:
 
 
 _ansi_re = re.compile(r"\033\[[^m]*m")
+_nonascii_re = re.compile(r"[^\x00-\x7f]+")
+_HTTP_URL_RE = re.compile(r"https?://", re.I)
+_json_encode = json.JSONEncoder().encode  # same output as json.dumps() defaults
+_JSON_PRETTY = json.JSONEncoder(indent=2, ensure_ascii=False)
+_sgr_run_re = re.compile(r"(?:\033\[[0-9;]*m){2,}")
+
+
+def _sgr_fuse(m) -> str:
+    params = m.group(0)[2:-1].split("m\033[")
+    return "\033[" + ";".join(p or "0" for p in params) + "m"
+
+
+def _sgr_merge(s: str) -> str:
+    """Fuse back-to-back SGR sequences (e.g. BOLD+CYN -> ESC[1;36m)."""
+    return _sgr_run_re.sub(_sgr_fuse, s)
 
 
 def _dbg(msg: str):
@@ -366,10 +424,61 @@ def _char_width(c: str) -> int:
     return 1
 
 
+@functools.lru_cache(maxsize=2048)
 def _vl(s: str) -> int:
-    """Visible length of a string, accounting for ANSI codes and wide chars."""
-    clean = _ansi_re.sub("", s)
-    return sum(_char_width(c) for c in clean)
+    """Visible length of a string, accounting for ANSI codes and wide chars.
+
+    Memoized: box closures measure the same title/help/separator lines on
+    every redraw.
+    """
+    # Strip the escapes in one regex pass; only non-ASCII runs need a
+    # per-character width lookup
+    t = _ansi_re.sub("", s)
+    n = len(t)
+    if not t.isascii():
+        for run in _nonascii_re.findall(t):
+            n += sum(map(_char_width, run)) - len(run)
+    return n
+
+
+def _vtrunc(s: str, limit: int) -> str:
+    """Prefix of `s` covering `limit` visible columns, escapes kept.
+
+    Walks the text between ANSI codes a segment at a time; ASCII segments
+    are cut with one slice instead of a per-character width check.
+    """
+    vis = 0
+    pos = 0
+    for m in itertools.chain(_ansi_re.finditer(s), (None,)):
+        seg = s[pos:m.start() if m else len(s)]
+        if seg.isascii():
+            take = min(len(seg), limit - vis)
+            vis += take
+            pos += take
+        else:
+            for c in seg:
+                if vis >= limit:
+                    break
+                vis += _char_width(c)
+                pos += 1
+        if m is None or vis >= limit:
+            break
+        pos = m.end()
+    return s[:pos]
+
+
+@functools.lru_cache(maxsize=4096)
+def _ellipsize(s: str, limit: int) -> str:
+    """`s` cut to `limit` chars with a trailing "...", cached per width so
+    reopening a popup reuses the cut strings."""
+    return s if len(s) <= limit else s[:limit - 3] + "..."
+
+
+@functools.lru_cache(maxsize=512)
+def _rep(ch: str, n: int) -> str:
+    """Return `ch * n` (empty for n <= 0), cached: box rules and padding
+    are rebuilt at the same few widths on every redraw."""
+    return ch * n
 
 
 def _w(text: str):
@@ -380,9 +489,97 @@ def _fl():
     sys.stdout.flush()
 
 
+def _wb(data: bytes):
+    """Write a pre-encoded frame to stdout's binary buffer and flush.
+
+    Pending text output is flushed first so ordering is preserved; falls
+    back to the text layer when stdout has no buffer (e.g. redirected to
+    a StringIO).
+    """
+    out = sys.stdout
+    buf = getattr(out, "buffer", None)
+    if buf is None:
+        out.write(data.decode("utf-8", errors="replace"))
+        out.flush()
+        return
+    out.flush()
+    if sys.platform != "win32" and out.isatty():
+        # Terminal: hand the frame straight to the fd, skipping BufferedWriter.
+        # Not on Windows: the console needs its text layer, not raw fd bytes
+        fd = out.fileno()
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[os.write(fd, view):]
+            except BlockingIOError:
+                # fd left non-blocking (e.g. by a child process): wait for room
+                import select
+                select.select([], [fd], [], 1.0)
+        return
+    buf.write(data)
+    buf.flush()
+
+
+def _tui_stdout_begin():
+    """Swap stdout for a 64 KiB block-buffered writer while the TUI runs.
+
+    Output then reaches the terminal at _fl(), key reads, input() or a
+    full buffer rather than at every newline. Returns the stream to hand
+    back to _tui_stdout_end(). Left alone off a TTY and on Windows, where
+    console output must stay on the original stream.
+    """
+    orig = sys.stdout
+    if sys.platform == "win32":
+        return orig
+    try:
+        if not orig.isatty():
+            return orig
+        orig.flush()
+        raw = io.FileIO(orig.fileno(), "w", closefd=False)
+        sys.stdout = io.TextIOWrapper(
+            io.BufferedWriter(raw, buffer_size=1 << 16),
+            encoding=orig.encoding, errors=orig.errors, line_buffering=False,
+        )
+    except (AttributeError, ValueError, OSError):
+        sys.stdout = orig
+    return orig
+
+
+def _tui_stdout_end(orig):
+    if sys.stdout is orig:
+        return
+    try:
+        sys.stdout.flush()
+    except (OSError, ValueError):
+        pass
+    sys.stdout = orig
+
+
+def _wframe(text: str):
+    """Write a whole TUI frame: SGR runs merged, encoded once, one write."""
+    _wb(_sgr_merge(text).encode("utf-8", errors="replace"))
+
+
+def _wframe_lines(lines: List[str], prefix: str = ""):
+    """_wframe() for a list of screen lines, each newline-terminated.
+
+    The frame text is assembled by one join instead of chained `+`, which
+    would copy the whole frame once per operand.
+    """
+    _wframe("".join((prefix, "\n".join(lines), "\n")))
+
+
+_ANSI_KICKED = [False]
+
+
 def enable_ansi():
+    """Turn on VT escape handling in the Windows console (no-op elsewhere).
+    The os.system("") kick spawns cmd.exe, so it runs once per process;
+    the console mode itself is re-set each call since children can clear it."""
     if sys.platform == "win32":
-        os.system("")
+        if not _ANSI_KICKED[0]:
+            os.system("")
+            _ANSI_KICKED[0] = True
         try:
             import ctypes
             k = ctypes.windll.kernel32
@@ -402,8 +599,35 @@ def term_size() -> Tuple[int, int]:
         return 80, 24
 
 
+_TERM_SIZE: List[Tuple[int, int]] = []  # cached term_size(), emptied on SIGWINCH
+_TERM_WINCH = False  # SIGWINCH handler installed
+
+
+def _on_winch(signum, frame):
+    _TERM_SIZE.clear()
+
+
+def _cached_term_size() -> Tuple[int, int]:
+    """term_size() measured once per resize instead of once per call.
+    Falls back to a fresh measurement where SIGWINCH is unavailable."""
+    global _TERM_WINCH
+    if _TERM_SIZE:
+        return _TERM_SIZE[0]
+    size = term_size()
+    if not _TERM_WINCH and hasattr(signal, "SIGWINCH"):
+        try:
+            signal.signal(signal.SIGWINCH, _on_winch)
+            _TERM_WINCH = True
+        except ValueError:  # not on the main thread
+            pass
+    if _TERM_WINCH:
+        _TERM_SIZE.append(size)
+    return size
+
+
 def _read_key_blocking() -> str:
     """Read a single key press (blocking). Returns key name."""
+    sys.stdout.flush()
     if sys.platform == "win32":
         import msvcrt
         try:
@@ -453,6 +677,7 @@ def _read_key_blocking() -> str:
 
 def _read_key_nb(timeout: float = 0.05) -> Optional[str]:
     """Non-blocking key read. Returns None if no key."""
+    sys.stdout.flush()
     if sys.platform == "win32":
         import msvcrt
         try:
@@ -513,6 +738,87 @@ def _wait_any_key():
             termios.tcsetattr(fd, termios.TCSADRAIN, old)
 
 
+def _pause(delay: float = 1.5):
+    """Hold the screen up to `delay` seconds; any keypress ends it early.
+    Without a terminal there is nothing to read, so no wait at all."""
+    _fl()
+    if sys.stdin.isatty():
+        try:
+            _read_key_nb(delay)
+        except (OSError, ValueError):
+            time.sleep(delay)
+
+
+def _flash_error(msg: str, delay: float = 1.0):
+    """Print a red error line and hold it up to `delay` seconds."""
+    _w(f" {A.RED}{msg}{A.RST}\n")
+    _pause(delay)
+
+
+def _confirm_key() -> bool:
+    """Answer a [y/N] prompt with one keypress; only y/Y confirms."""
+    try:
+        k = _read_key_blocking()
+    except (OSError, ValueError, EOFError):
+        k = ""
+    yes = isinstance(k, str) and k.lower() == "y"
+    _w("y\n" if yes else "n\n")
+    return yes
+
+
+async def _ainput() -> str:
+    """input() for coroutines: the event loop waits for the line instead of
+    blocking on it. Ctrl+C still raises KeyboardInterrupt here, so callers
+    keep their usual except clause. Windows consoles and non-TTY stdin
+    can't be watched by the loop and fall back to plain input()."""
+    if sys.platform == "win32" or not sys.stdin.isatty():
+        return input()
+    sys.stdout.flush()
+    loop = asyncio.get_running_loop()
+    fut = loop.create_future()
+    fd = sys.stdin.fileno()
+
+    def _done(res):
+        if not fut.done():
+            fut.set_result(res)
+
+    def _sig(signum, frame):
+        loop.call_soon_threadsafe(_done, None)
+
+    old_sigint = signal.signal(signal.SIGINT, _sig)
+    loop.add_reader(fd, _done, "")
+    try:
+        res = await fut
+    finally:
+        loop.remove_reader(fd)
+        signal.signal(signal.SIGINT, old_sigint)
+    if res is None:
+        raise KeyboardInterrupt
+    line = sys.stdin.readline()  # canonical mode: exactly one line is ready
+    if not line:
+        raise EOFError
+    return line.rstrip("\n")
+
+
+@contextlib.contextmanager
+def _intercept_sigint(task, state, finish: bool = True):
+    """While active, Ctrl+C flags state as interrupted (and finished) and
+    cancels task; the previous SIGINT handler is restored on exit."""
+    loop = asyncio.get_running_loop()
+
+    def _sig(sig, frame):
+        state.interrupted = True
+        if finish:
+            state.finished = True
+        loop.call_soon_threadsafe(task.cancel)
+
+    old_sigint = signal.signal(signal.SIGINT, _sig)
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGINT, old_sigint)
+
+
 def _prompt_number(prompt: str, max_val: int) -> Optional[int]:
     """Show prompt, read a number from user. Returns None if cancelled."""
     _w(A.SHOW)
@@ -640,6 +946,7 @@ class State:
         self.done_count = 0
         self.alive_n = 0
         self.dead_n = 0
+        self.alive_tls_sum = 0.0  # sum of tls_ms over alive IPs, for the average
         self.best_speed = 0.0
         self.start_time = 0.0
         self.notify = ""  # notification message shown in footer
@@ -655,6 +962,7 @@ class State:
         self.notify_url = ""
         self.geo_tag = False
         self.measure_jitter = False
+        self.sort_version = 0  # bumped by calc_scores() when scores change
 
 
 @dataclass
@@ -677,6 +985,12 @@ class XrayVariation:
     country: str = ""
     censorship_ok: bool = False
     udp_ok: bool = False
+    ip_label: str = field(init=False, default="")  # IP column for ip|sni|frag tags
+
+    def __post_init__(self):
+        parts = self.tag.split("|", 2)
+        ip = parts[0] if len(parts) >= 3 else ""
+        self.ip_label = (ip[:16] + "..") if len(ip) > 18 else ip
 
 
 class XrayTestState:
@@ -713,6 +1027,14 @@ class XrayTestState:
         self.preflight_is_cf: Optional[bool] = None
         self.preflight_warning: str = ""
         self.cf_origin_errors: int = 0
+        self.version = 0  # bumped when scores are (re)computed
+        self.unscored: List[XrayVariation] = []  # alive since the last draw, not live-scored yet
+        self.redraw_event: Optional[asyncio.Event] = None  # set by changed()
+
+    def changed(self):
+        """Wake the dashboard refresh loop (no-op when nothing is listening)."""
+        if self.redraw_event is not None:
+            self.redraw_event.set()
 
 
 @dataclass
@@ -728,7 +1050,7 @@ class PipelineConfig:
     max_snis_per_ip: int = 20
     configless: bool = False
     base_uris: List[Tuple[str, dict]] = field(default_factory=list)
-    custom_ips: List[str] = field(default_factory=list)
+    custom_ips: Optional["CidrSet"] = None
     probe_ports: List[int] = field(default_factory=lambda: [443])
 
 
@@ -740,6 +1062,7 @@ class DeployState:
         self.fresh_mode = False
 
         self.server_config: dict = {}
+        self.server_config_file = ""  # set once server_config is on disk
         self.client_uris: List[str] = []
 
         self.server_ip = ""
@@ -1671,10 +1994,17 @@ def _flush_stdin():
         except OSError:
             pass
     else:
-        import select
+        import select, termios
         fd = sys.stdin.fileno()
+        try:
+            # Terminal: discard the whole pending input queue in one call
+            termios.tcflush(fd, termios.TCIFLUSH)
+            return
+        except (OSError, termios.error):
+            pass
         while select.select([sys.stdin], [], [], 0.0)[0]:
-            os.read(fd, 4096)
+            if not os.read(fd, 4096):
+                break
 
 
 def _restore_console_input():
@@ -1705,7 +2035,25 @@ def _restore_console_input():
 
 
 def xray_find_binary(custom_path: Optional[str] = None) -> Optional[str]:
-    """Find xray binary. Search order: custom_path > PATH > ~/.cfray/bin/xray."""
+    """Find xray binary. Search order: custom_path > PATH > ~/.cfray/bin/xray.
+
+    The PATH walk is cached; a hit costs one stat to confirm the binary is
+    still there, and a vanished binary triggers a fresh search.
+    """
+    found = _xray_find_binary_cached(custom_path)
+    if found and not os.path.isfile(found):
+        _reset_xray_binary_cache()
+        found = _xray_find_binary_cached(custom_path)
+    return found
+
+
+def _reset_xray_binary_cache():
+    """Forget resolved xray paths (after install/uninstall)."""
+    _xray_find_binary_cached.cache_clear()
+
+
+@functools.lru_cache(maxsize=4)
+def _xray_find_binary_cached(custom_path: Optional[str]) -> Optional[str]:
     if custom_path and os.path.isfile(custom_path):
         return os.path.abspath(custom_path)
     xray_name = "xray.exe" if sys.platform == "win32" else "xray"
@@ -1745,7 +2093,7 @@ def xray_install() -> Optional[str]:
     url = f"https://github.com/XTLS/Xray-core/releases/latest/download/{asset_name}"
     zip_path = os.path.join(XRAY_BIN_DIR, asset_name)
 
-    print(f"  Downloading {asset_name}...")
+    print(f"  Downloading {asset_name}...", flush=True)  # TUI stdout is block-buffered
     try:
         req = urllib.request.Request(url, headers={"User-Agent": "Mozilla/5.0"})
         with urllib.request.urlopen(req, timeout=120) as resp:
@@ -1790,6 +2138,7 @@ def xray_install() -> Optional[str]:
             pass
     if os.path.isfile(bin_path):
         print(f"  Installed to {bin_path}")
+        _reset_xray_binary_cache()
         return bin_path
     return None
 
@@ -2667,7 +3016,91 @@ def generate_pipeline_variations(
     return variations
 
 
-def expand_custom_ips(raw_input: str) -> List[str]:
+class CidrSet:
+    """Custom probe IPs: listed single IPs in input order, plus CIDR host
+    ranges kept as merged (base, count) int pairs.
+
+    A /8 stays three ints instead of 16M strings; range IPs are only
+    formatted when iterated or sampled. Listed IPs always come first, so
+    a fastest-first clean_ips.txt keeps its order when capped.
+    """
+
+    def __init__(self, ranges: Iterable[range], singles: Iterable[int] = ()):
+        merged: List[List[int]] = []
+        for r in sorted((r.start, r.stop) for r in ranges if r):
+            if merged and r[0] <= merged[-1][1]:
+                if r[1] > merged[-1][1]:
+                    merged[-1][1] = r[1]
+            else:
+                merged.append([r[0], r[1]])
+        self.ranges: List[Tuple[int, int]] = [(a, b - a) for a, b in merged]
+        self._bases = [a for a, _ in self.ranges]
+        self._offsets = list(itertools.accumulate(c for _, c in self.ranges))
+        self.range_total = self._offsets[-1] if self._offsets else 0
+        self.singles: List[int] = list(dict.fromkeys(singles))  # dedup, keep order
+        self._single_set = set(self.singles)
+        # listed IPs that a range also covers are counted (and drawn) once
+        self._overlap = sum(1 for n in self.singles if self._in_ranges(n))
+        self.total = len(self.singles) + self.range_total - self._overlap
+
+    def __len__(self) -> int:
+        return self.total
+
+    def _in_ranges(self, n: int) -> bool:
+        i = bisect.bisect_right(self._bases, n) - 1
+        return i >= 0 and n < self.ranges[i][0] + self.ranges[i][1]
+
+    def __contains__(self, ip) -> bool:
+        try:
+            n = int(ipaddress.IPv4Address(ip))
+        except ValueError:
+            return False
+        return n in self._single_set or self._in_ranges(n)
+
+    def __iter__(self) -> Iterator[str]:
+        for n in self.singles:
+            yield _int_ip(n)
+        for base, count in self.ranges:
+            for n in range(base, base + count):
+                if n not in self._single_set:
+                    yield _int_ip(n)
+
+    def _at(self, idx: int) -> int:
+        i = bisect.bisect_right(self._offsets, idx)
+        base, count = self.ranges[i]
+        return base + idx - (self._offsets[i] - count)
+
+    def sample(self, k: int) -> List[str]:
+        """Up to k distinct IPs: the listed IPs in input order first, then
+        the rest drawn at random from the CIDR ranges."""
+        if k >= self.total:
+            return list(self)
+        out = [_int_ip(n) for n in self.singles[:k]]
+        need = k - len(out)
+        if need > 0:
+            # over-draw by the overlap so skipped listed IPs can't leave us short
+            for i in random.sample(range(self.range_total), need + self._overlap):
+                n = self._at(i)
+                if n not in self._single_set:
+                    out.append(_int_ip(n))
+                    if len(out) == k:
+                        break
+        return out
+
+
+def _custom_ips_label(ips: CidrSet) -> str:
+    """'N IPs', noting which subset will be probed when capped."""
+    if ips.total <= MAX_CUSTOM_IPS:
+        return f"{ips.total:,} IPs"
+    if len(ips.singles) >= MAX_CUSTOM_IPS:
+        return f"{ips.total:,} IPs (probing the first {MAX_CUSTOM_IPS:,})"
+    if ips.singles:
+        return (f"{ips.total:,} IPs (probing {len(ips.singles):,} listed"
+                f" + a random {MAX_CUSTOM_IPS - len(ips.singles):,} from ranges)")
+    return f"{ips.total:,} IPs (probing a random {MAX_CUSTOM_IPS:,})"
+
+
+def expand_custom_ips(raw_input: str) -> CidrSet:
     """Expand user input (IPs, CIDRs, or file path) into a list of individual IPs.
 
     Accepts:
@@ -2675,9 +3108,8 @@ def expand_custom_ips(raw_input: str) -> List[str]:
       - CIDR notation: "104.16.0.0/24"
       - Comma-separated mix: "1.2.3.4, 10.0.0.0/30"
       - File path (one IP/CIDR per line)
-    Returns deduplicated list of IPs (max 6666 to avoid memory issues).
+    Returns the deduplicated ranges; nothing is expanded up front.
     """
-    MAX_IPS = 6666
     entries: List[str] = []
 
     # Check if input is a file path
@@ -2685,10 +3117,7 @@ def expand_custom_ips(raw_input: str) -> List[str]:
     if os.path.isfile(raw):
         try:
             with open(raw, "r") as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith("#"):
-                        entries.append(line)
+                entries = _ip_file_entries(f.read())
         except OSError:
             pass
     else:
@@ -2697,53 +3126,75 @@ def expand_custom_ips(raw_input: str) -> List[str]:
             part = part.strip()
             if part:
                 entries.append(part)
+    return expand_custom_ips_from_list(entries)
 
-    seen: set = set()
-    result: List[str] = []
+
+def _ip_file_entries(text: str) -> List[str]:
+    """Non-empty, non-comment lines of an IP/CIDR list file."""
+    return [ln for ln in (l.strip() for l in text.splitlines())
+            if ln and not ln.startswith("#")]
+
+
+def _int_ip(n: int) -> str:
+    """Dotted-quad string for an IPv4 address held as an int."""
+    return socket.inet_ntoa(n.to_bytes(4, "big"))
+
+
+def _host_range(net: ipaddress.IPv4Network) -> range:
+    """Host addresses of `net` as an int range (same set as net.hosts())."""
+    base = int(net.network_address)
+    size = net.num_addresses
+    if size <= 2:  # /31 and /32 have no network/broadcast address
+        return range(base, base + size)
+    return range(base + 1, base + size - 1)
+
+
+def expand_custom_ips_from_list(entries: List[str]) -> CidrSet:
+    """Parse already-split IP/CIDR entries into a CidrSet; single IPs keep
+    their input order."""
+    ranges: List[range] = []
+    singles: List[int] = []
     for entry in entries:
         try:
             # Try as single IP first
-            ip = ipaddress.IPv4Address(entry)
-            if str(ip) not in seen:
-                seen.add(str(ip))
-                result.append(str(ip))
+            singles.append(int(ipaddress.IPv4Address(entry)))
         except ValueError:
             try:
-                # Try as CIDR
-                net = ipaddress.IPv4Network(entry, strict=False)
-                for host in net.hosts():
-                    if len(result) >= MAX_IPS:
-                        break
-                    s = str(host)
-                    if s not in seen:
-                        seen.add(s)
-                        result.append(s)
+                ranges.append(_host_range(ipaddress.IPv4Network(entry, strict=False)))
             except ValueError:
                 continue
-        if len(result) >= MAX_IPS:
-            break
-    return result
+    return CidrSet(ranges, singles)
 
 
 # ─── Xray Testing & Pipeline ─────────────────────────────────────────────
 
 
+def _xray_score(v: XrayVariation) -> float:
+    """Score one alive xray variation from its latency, TTFB and speed."""
+    cms = v.connect_ms if v.connect_ms >= 0 else 1000
+    tms = v.ttfb_ms if v.ttfb_ms >= 0 else 1000
+    lat = 100.0 - cms / 10.0
+    ttfb = 100.0 - tms / 5.0
+    if lat < 0.0:
+        lat = 0.0
+    if ttfb < 0.0:
+        ttfb = 0.0
+    if v.native_tested or v.speed_mbps < 0.01:
+        # Native VLESS test: no real speed data, score on latency only
+        return round(lat * 0.55 + ttfb * 0.45, 1)
+    spd = v.speed_mbps * 20.0
+    if spd > 100.0:
+        spd = 100.0
+    return round(lat * 0.35 + spd * 0.50 + ttfb * 0.15, 1)
+
+
 def _xray_calc_scores(xst: XrayTestState):
     """Calculate scores for xray variations."""
+    xst.version += 1
+    xst.changed()
+    score = _xray_score
     for v in xst.variations:
-        if not v.alive:
-            v.score = 0
-            continue
-        cms = v.connect_ms if v.connect_ms >= 0 else 1000
-        tms = v.ttfb_ms if v.ttfb_ms >= 0 else 1000
-        lat = max(0.0, 100.0 - cms / 10.0)
-        ttfb = max(0.0, 100.0 - tms / 5.0)
-        if v.native_tested or v.speed_mbps < 0.01:
-            # Native VLESS test: no real speed data, score on latency only
-            v.score = round(lat * 0.55 + ttfb * 0.45, 1)
-        else:
-            spd = min(100.0, v.speed_mbps * 20.0)
-            v.score = round(lat * 0.35 + spd * 0.50 + ttfb * 0.15, 1)
+        v.score = score(v) if v.alive else 0
 
 
 async def _test_single_variation(
@@ -2780,6 +3231,8 @@ async def _test_single_variation(
             var.native_tested = True
             var.ttfb_ms = ttfb_ms
             var.speed_mbps = mbps
+            if xst is not None:
+                xst.unscored.append(var)
             return True
         else:
             # For fragment variations: native test proves connectivity.
@@ -2831,6 +3284,8 @@ async def _test_single_variation(
                 var.censorship_ok = await loop.run_in_executor(None, test_censorship_probe, port)
             if xst and getattr(xst, "check_udp", False):
                 var.udp_ok = await loop.run_in_executor(None, test_udp_probe, port)
+            if xst is not None:
+                xst.unscored.append(var)
             return True
         else:
             _py_err = err or "no-data"
@@ -3106,6 +3561,7 @@ async def xray_pipeline_test(xst: XrayTestState, pcfg: PipelineConfig):
     # -- Stage 1: IP Scan --
     xst.pipeline_stage = 0
     xst.pipeline_stages[0]["status"] = "active"
+    xst.changed()
     xst.phase = "ip_scan"
 
     if _is_reality:
@@ -3116,7 +3572,8 @@ async def xray_pipeline_test(xst: XrayTestState, pcfg: PipelineConfig):
         probe_ports = [orig_port]
     else:
         # Cloudflare-fronted: probe CF IPs on configured ports
-        probe_ips = list(pcfg.custom_ips) if pcfg.custom_ips else list(CF_TEST_IPS)
+        probe_ips = (pcfg.custom_ips.sample(MAX_CUSTOM_IPS) if pcfg.custom_ips
+                     else list(CF_TEST_IPS))
         if orig_addr and orig_addr not in probe_ips:
             probe_ips.insert(0, orig_addr)
         probe_sni = "speed.cloudflare.com"
@@ -3156,12 +3613,14 @@ async def xray_pipeline_test(xst: XrayTestState, pcfg: PipelineConfig):
                 lat, is_cf, err = await _tls_probe(ip, probe_sni, timeout=4.0,
                                                     validate=True, port=port)
                 xst.done_count += 1
+                xst.changed()
                 if lat > 0 and is_cf:
                     if err.startswith("cf-origin-"):
                         xst.cf_origin_errors += 1
                     return (ip, port, lat)
             except Exception:
                 xst.done_count += 1
+                xst.changed()
             return None
 
     results = await asyncio.gather(*[_probe_one(ip, port) for ip, port in probe_pairs])
@@ -3177,9 +3636,10 @@ async def xray_pipeline_test(xst: XrayTestState, pcfg: PipelineConfig):
                 xst.live_ip_ports[ip] = []
             if port not in xst.live_ip_ports[ip]:
                 xst.live_ip_ports[ip].append(port)
-    xst.live_ips = sorted([(ip, lat) for ip, lat in _ip_best.items()], key=lambda x: x[1])
+    xst.live_ips = sorted(_ip_best.items(), key=_BY_LATENCY)
 
     xst.pipeline_stages[0]["status"] = "done"
+    xst.changed()
     _cf_count = len(xst.live_ips)
     _origin_warn = f" ({xst.cf_origin_errors} with origin errors)" if xst.cf_origin_errors else ""
     _port_info = f" on port {probe_ports[0]}" if len(probe_ports) == 1 else f" on ports {','.join(str(p) for p in probe_ports)}"
@@ -3187,6 +3647,7 @@ async def xray_pipeline_test(xst: XrayTestState, pcfg: PipelineConfig):
 
     if not xst.live_ips or xst.interrupted:
         xst.pipeline_stages[0]["status"] = "interrupted"
+        xst.changed()
         xst.finished = True
         if _is_cf:
             if xst.preflight_warning:
@@ -3201,6 +3662,7 @@ async def xray_pipeline_test(xst: XrayTestState, pcfg: PipelineConfig):
     # -- Stage 2: Base Connectivity --
     xst.pipeline_stage = 1
     xst.pipeline_stages[1]["status"] = "active"
+    xst.changed()
     xst.phase = "base_test"
 
     # For config-less mode: test each base URI on original IP first
@@ -3226,6 +3688,7 @@ async def xray_pipeline_test(xst: XrayTestState, pcfg: PipelineConfig):
             alive = await _test_single_variation(var, xst.xray_bin,
                                                  XRAY_QUICK_SIZE, XRAY_QUICK_TIMEOUT, xst)
             xst.done_count += 1
+            xst.changed()
             if alive:
                 working_uri = uri
                 working_parsed = parsed
@@ -3238,6 +3701,7 @@ async def xray_pipeline_test(xst: XrayTestState, pcfg: PipelineConfig):
 
         if not working_uri:
             xst.pipeline_stages[1]["status"] = "done"
+            xst.changed()
             xst.finished = True
             xst.phase_label = "No base config could connect -- server may not support ws/xhttp"
             _xray_calc_scores(xst)
@@ -3287,6 +3751,7 @@ async def xray_pipeline_test(xst: XrayTestState, pcfg: PipelineConfig):
             alive = await _test_single_variation(var, xst.xray_bin,
                                                  XRAY_QUICK_SIZE, XRAY_QUICK_TIMEOUT, xst)
             xst.done_count += 1
+            xst.changed()
             xst.variations.append(var)
             if alive:
                 if ip not in xst.working_ips:
@@ -3336,6 +3801,7 @@ async def xray_pipeline_test(xst: XrayTestState, pcfg: PipelineConfig):
                 break
 
     xst.pipeline_stages[1]["status"] = "interrupted" if xst.interrupted else "done"
+    xst.changed()
 
     # If base config failed but we have live CF IPs, don't give up --
     # proceed to expansion with different SNIs/fragments/transports.
@@ -3366,6 +3832,7 @@ async def xray_pipeline_test(xst: XrayTestState, pcfg: PipelineConfig):
     # -- Stage 3: Expansion --
     xst.pipeline_stage = 2
     xst.pipeline_stages[2]["status"] = "active"
+    xst.changed()
     xst.phase = "expansion"
 
     # When base config failed, use live CF IPs for expansion instead
@@ -3414,6 +3881,7 @@ async def xray_pipeline_test(xst: XrayTestState, pcfg: PipelineConfig):
             alive = await _test_single_variation(var, xst.xray_bin,
                                                  XRAY_QUICK_SIZE, XRAY_QUICK_TIMEOUT, xst)
             xst.done_count += 1
+            xst.changed()
             if alive:
                 xst.alive_count += 1
             else:
@@ -3432,6 +3900,7 @@ async def xray_pipeline_test(xst: XrayTestState, pcfg: PipelineConfig):
         xst.variations.extend(batch)
 
     xst.pipeline_stages[2]["status"] = "interrupted" if xst.interrupted else "done"
+    xst.changed()
     xst.quick_passed = xst.alive_count
 
     xst.finished = True
@@ -3470,7 +3939,7 @@ def load_input(path: str) -> List[ConfigEntry]:
 
 def fetch_sub(url: str) -> List[ConfigEntry]:
     """Fetch configs from a subscription URL (base64 or plain VLESS URIs)."""
-    if not url.lower().startswith(("http://", "https://")):
+    if not _HTTP_URL_RE.match(url):
         print(f"  Error: --sub only accepts http:// or https:// URLs")
         return []
     _dbg(f"Fetching subscription: {url}")
@@ -3497,12 +3966,30 @@ def fetch_sub(url: str) -> List[ConfigEntry]:
     return out
 
 
+# generate_from_template() patterns: template address, port, and #name
+_TPL_ADDR_RE = re.compile(r"(@)(\[[^\]]+\]|[^:]+)(:|$)")
+_TPL_HAS_PORT_RE = re.compile(r"@[^:/?#]+:\d+")
+_TPL_PORT_RE = re.compile(r"(@[^:/?#]+:)\d+")
+_TPL_NO_PORT_RE = re.compile(r"(@[^/?#]+)([?/#])")
+_TPL_NAME_RE = re.compile(r"#.*$")
+
+
 def generate_from_template(template: str, addresses: List[str]) -> List[ConfigEntry]:
     """Generate configs by substituting addresses into a VLESS/VMess template."""
     out = []
     parsed = parse_config(template)
     if not parsed:
         return out
+    # The address slot is found in the template alone, so split around it
+    # once; each URI is then head + address + tail
+    m = _TPL_ADDR_RE.search(template)
+    if m:
+        head, tail = template[:m.start(2)], template[m.end(2):]
+    # Plain addresses (no port override, nothing the #name regex could
+    # trip on) skip the regexes entirely: head + addr + tail up to '#' + name
+    frag = tail.find("#") if m else -1
+    fast = frag >= 0 and "#" not in head and "\n" not in template
+    tail_base = tail[:frag] if fast else ""
     for i, addr in enumerate(addresses):
         addr = addr.strip()
         if not addr:
@@ -3514,19 +4001,19 @@ def generate_from_template(template: str, addresses: List[str]) -> List[ConfigEn
             parts = addr.rsplit(":", 1)
             if parts[1].isdigit():
                 addr_ip, addr_port = parts[0], parts[1]
-        uri = re.sub(
-            r"(@)(\[[^\]]+\]|[^:]+)(:|$)",
-            lambda m: m.group(1) + addr_ip + m.group(3),
-            template,
-            count=1,
-        )
-        if addr_port:
-            # Replace existing port, or insert port if template had none
-            if re.search(r"@[^:/?#]+:\d+", uri):
-                uri = re.sub(r"(@[^:/?#]+:)\d+", lambda m: m.group(1) + addr_port, uri, count=1)
-            else:
-                uri = re.sub(r"(@[^/?#]+)([?/#])", lambda m: m.group(1) + ":" + addr_port + m.group(2), uri, count=1)
-        uri = re.sub(r"#.*$", f"#cfg-{i+1}-{addr_ip[:20]}", uri)
+        name = f"#cfg-{i+1}-{addr_ip[:20]}"
+        if (fast and addr_port is None and "#" not in addr_ip
+                and "\\" not in addr_ip and "\n" not in addr_ip):
+            uri = head + addr_ip + tail_base + name
+        else:
+            uri = head + addr_ip + tail if m else template
+            if addr_port:
+                # Replace existing port, or insert port if template had none
+                if _TPL_HAS_PORT_RE.search(uri):
+                    uri = _TPL_PORT_RE.sub(lambda m: m.group(1) + addr_port, uri, count=1)
+                else:
+                    uri = _TPL_NO_PORT_RE.sub(lambda m: m.group(1) + ":" + addr_port + m.group(2), uri, count=1)
+            uri = _TPL_NAME_RE.sub(name, uri)
         c = parse_config(uri)
         if c:
             out.append(c)
@@ -3554,6 +4041,22 @@ def load_addresses(path: str) -> List[str]:
     return [ln.strip() for ln in raw.splitlines() if ln.strip()]
 
 
+@functools.lru_cache(maxsize=8)
+def _load_subnets(spec: str) -> Tuple[str, ...]:
+    """CIDRs from a --subnets value: a file (one per line, # comments) or a
+    comma-separated list. Used as the argparse type, so it runs at parse
+    time; cached so repeated parses of the same value skip the file."""
+    if os.path.isfile(spec):
+        try:
+            with open(spec, encoding="utf-8") as f:
+                text = f.read()
+        except OSError as e:
+            raise argparse.ArgumentTypeError(f"cannot read {spec}: {e}")
+        return tuple(ln for ln in map(str.strip, text.splitlines())
+                     if ln and ln[0] != "#")
+    return tuple(s.strip() for s in spec.split(",") if s.strip())
+
+
 def _split_to_24s(subnets: List[str]) -> list:
     """Split CIDR subnets into /24 blocks, deduplicate."""
     seen = set()
@@ -3577,17 +4080,46 @@ def _split_to_24s(subnets: List[str]) -> list:
     return blocks
 
 
-def generate_cf_ips(subnets: List[str], sample_per_24: int = 0) -> List[str]:
-    """Generate IPs from CIDR subnets. sample_per_24=0 means all hosts."""
-    blocks = _split_to_24s(subnets)
+@functools.lru_cache(maxsize=8)
+def _blocks_24(subnets: Tuple[str, ...]) -> tuple:
+    """_split_to_24s() cached per subnet tuple: count_cf_ips() and
+    generate_cf_ips() both need the same blocks for one scan."""
+    return tuple(_split_to_24s(subnets))
+
+
+def _block_hosts(net) -> int:
+    """Number of usable hosts in a /24-or-smaller block."""
+    return 254 if net.prefixlen == 24 else sum(1 for _ in net.hosts())
+
+
+_OCTETS = tuple(str(i) for i in range(1, 255))  # host octets of a /24
+
+
+def count_cf_ips(subnets: Iterable[str], sample_per_24: int = 0) -> int:
+    """Number of IPs generate_cf_ips() will yield, without generating them."""
+    n = 0
+    for net in _blocks_24(tuple(subnets)):
+        h = _block_hosts(net)
+        n += min(h, sample_per_24) if sample_per_24 > 0 else h
+    return n
+
+
+def generate_cf_ips(subnets: Iterable[str], sample_per_24: int = 0) -> Iterator[str]:
+    """Yield IPs from CIDR subnets, /24 by /24 in random block order.
+    sample_per_24=0 means all hosts. Lazy: mega mode is millions of IPs,
+    so pair with count_cf_ips() when the total is needed up front."""
+    blocks = list(_blocks_24(tuple(subnets)))
     random.shuffle(blocks)
-    ips = []
     for net in blocks:
-        hosts = [str(ip) for ip in net.hosts()]
+        if net.prefixlen == 24:
+            # .1-.254 as strings, skipping 254 IPv4Address objects per block
+            pre = str(net.network_address)[:-1]
+            hosts = [pre + o for o in _OCTETS]
+        else:
+            hosts = [str(ip) for ip in net.hosts()]
         if sample_per_24 > 0 and sample_per_24 < len(hosts):
             hosts = random.sample(hosts, sample_per_24)
-        ips.extend(hosts)
-    return ips
+        yield from hosts
 
 
 async def _tls_probe(
@@ -3650,6 +4182,10 @@ async def _tls_probe(
                 pass
 
 
+_CLEAN_TOP_N = 15  # rows of the live "fastest" list in the progress view
+_BY_LATENCY = operator.itemgetter(1)  # sort key for (addr, latency_ms) pairs
+
+
 @dataclass
 class CleanScanState:
     """State for clean IP scanning progress."""
@@ -3657,64 +4193,134 @@ class CleanScanState:
     done: int = 0
     found: int = 0
     interrupted: bool = False
-    results: List[Tuple[str, float]] = field(default_factory=list)  # top 20 for display
-    all_results: List[Tuple[str, float]] = field(default_factory=list)  # full reference
+    results: List[Tuple[str, float]] = field(default_factory=list)  # fastest few, sorted, for display
+    # Every hit so far, column-wise: one str and 8 bytes per IP instead of
+    # a tuple and a float object, which matters once mega scans find millions
+    found_addrs: List[str] = field(default_factory=list)
+    found_lats: array.array = field(default_factory=lambda: array.array("d"))
+    all_results: Optional["CleanResults"] = None  # set once the scan completes
     start_time: float = 0.0
+    best: float = float("inf")  # lowest latency seen so far
+    last_draw: tuple = ()  # key of the last progress frame drawn
+    progress_evt: Optional[asyncio.Event] = None  # set every ~1% of probes, and at the end
+
+
+class CleanResults:
+    """Clean-scan hits, fastest first, read straight from the result columns.
+
+    Keeps the address list and latency array and an index array in latency
+    order, so a mega scan never materialises millions of (addr, latency)
+    tuples. Iterating, indexing or slicing yields pairs on demand; ties keep
+    discovery order like a stable tuple sort.
+    """
+
+    __slots__ = ("addrs", "lats", "order")
+
+    def __init__(self, addrs: List[str], lats: array.array):
+        self.addrs = addrs
+        self.lats = lats
+        self.order = array.array("L", sorted(range(len(lats)), key=lats.__getitem__))
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [(self.addrs[j], self.lats[j]) for j in self.order[i]]
+        j = self.order[i]
+        return self.addrs[j], self.lats[j]
+
+    def __iter__(self) -> Iterator[Tuple[str, float]]:
+        addrs, lats = self.addrs, self.lats
+        for j in self.order:
+            yield addrs[j], lats[j]
+
+    def iter_addrs(self) -> Iterator[str]:
+        """Addresses only, fastest first."""
+        return map(self.addrs.__getitem__, self.order)
+
+
+def _clean_partial_results(cs: CleanScanState) -> CleanResults:
+    """Results gathered before a scan was cut short, fastest first."""
+    if cs.all_results is not None:
+        return cs.all_results
+    if cs.found_lats:
+        return CleanResults(cs.found_addrs, cs.found_lats)
+    return CleanResults([ip for ip, _ in cs.results], array.array("d", [lat for _, lat in cs.results]))
 
 
 async def scan_clean_ips(
-    ips: List[str],
+    ips: Iterable[str],
     sni: str = "speed.cloudflare.com",
     workers: int = 500,
     timeout: float = 3.0,
     validate: bool = True,
     cs: Optional[CleanScanState] = None,
     ports: Optional[List[int]] = None,
-) -> List[Tuple[str, float]]:
-    """Scan IPs for TLS + optional CF validation. Returns [(addr, latency_ms)] sorted.
-    addr is 'ip' for port 443, or 'ip:port' for other ports."""
+    total: int = 0,
+) -> CleanResults:
+    """Scan IPs for TLS + optional CF validation. Returns (addr, latency_ms) hits sorted.
+    addr is 'ip' for port 443, or 'ip:port' for other ports.
+    `ips` may be a lazy iterator; pass `total` (IP count) for progress."""
     if ports is None:
         ports = [443]
-    sem = asyncio.Semaphore(workers)
-    results: List[Tuple[str, float]] = []
+    addrs: List[str] = []
+    lats = array.array("d")
     lock = asyncio.Lock()
 
-    total_probes = len(ips) * len(ports)
+    if not total and isinstance(ips, (list, tuple)):
+        total = len(ips)
+    total_probes = total * len(ports)
     if cs:
         cs.total = total_probes
         cs.done = 0
         cs.found = 0
         cs.start_time = time.monotonic()
+        cs.found_addrs, cs.found_lats = addrs, lats  # for Ctrl+C recovery
+    step = max(1, total_probes // 100)
 
-    async def probe(ip: str, port: int):
-        if cs and cs.interrupted:
-            return
-        async with sem:
+    top_lat: List[float] = []  # latencies of cs.results, kept sorted alongside it
+
+    async def worker(pending: Iterator[Tuple[str, int]]):
+        # Each worker pulls the next probe from the shared batch iterator,
+        # so `workers` coroutines cover the batch instead of one task
+        # (plus a semaphore wait) per probe
+        for ip, port in pending:
             if cs and cs.interrupted:
                 return
             lat, is_cf, _err = await _tls_probe(ip, sni, timeout, validate, port)
             if lat > 0 and is_cf:
                 addr = ip if port == 443 else f"{ip}:{port}"
                 async with lock:
-                    results.append((addr, lat))
+                    addrs.append(addr)
+                    lats.append(lat)
                     if cs:
                         cs.found += 1
-                        cs.all_results = results  # full reference for Ctrl+C recovery
-                        if cs.found % 10 == 0 or cs.found <= 20:
-                            cs.results = sorted(results, key=lambda x: x[1])[:20]
+                        if lat < cs.best:
+                            cs.best = lat
+                        if len(top_lat) < _CLEAN_TOP_N or lat < top_lat[-1]:
+                            i = bisect.bisect_right(top_lat, lat)
+                            top_lat.insert(i, lat)
+                            cs.results.insert(i, (addr, lat))
+                            if len(top_lat) > _CLEAN_TOP_N:
+                                top_lat.pop()
+                                cs.results.pop()
             if cs:
                 cs.done += 1
+                if cs.progress_evt is not None and cs.done % step == 0:
+                    cs.progress_evt.set()
 
-    # Build flat list of (ip, port) pairs
-    probes = [(ip, p) for ip in ips for p in ports]
-    random.shuffle(probes)  # spread ports across batches for better coverage
+    # Stream (ip, port) pairs in batches so only one batch is ever in memory
+    probes = ((ip, p) for ip in ips for p in ports)
 
     BATCH = 50_000
-    for i in range(0, len(probes), BATCH):
-        if cs and cs.interrupted:
+    while not (cs and cs.interrupted):
+        batch = list(itertools.islice(probes, BATCH))
+        if not batch:
             break
-        batch = probes[i : i + BATCH]
-        tasks = [asyncio.ensure_future(probe(ip, port)) for ip, port in batch]
+        random.shuffle(batch)  # spread ports across the batch for better coverage
+        pending = iter(batch)
+        tasks = [asyncio.ensure_future(worker(pending)) for _ in range(min(workers, len(batch)))]
         try:
             await asyncio.gather(*tasks, return_exceptions=True)
         except asyncio.CancelledError:
@@ -3724,7 +4330,11 @@ async def scan_clean_ips(
                 if not t.done():
                     t.cancel()
 
-    results.sort(key=lambda x: x[1])
+    if cs and cs.progress_evt is not None:
+        cs.progress_evt.set()
+    results = CleanResults(addrs, lats)
+    if cs:
+        cs.all_results = results
     return results
 
 
@@ -3804,22 +4414,53 @@ def find_config_files() -> List[Tuple[str, str, int]]:
     return results
 
 
+_DNS_TTL = 900.0
+_DNS_CACHE: Dict[str, Tuple[str, float]] = {}  # host -> (IPv4, monotonic expiry)
+
+
+@functools.lru_cache(maxsize=4096)
+def _ipv4_literal(host: str) -> str:
+    """`host` normalized if it is already an IPv4 address, else ""."""
+    try:
+        return str(ipaddress.IPv4Address(host))
+    except ValueError:
+        return ""
+
+
+def _dns_cached(host: str) -> str:
+    """IPv4 for `host` from a literal or an unexpired lookup, else ""."""
+    ip = _ipv4_literal(host)
+    if ip:
+        return ip
+    hit = _DNS_CACHE.get(host)
+    if hit and hit[1] > time.monotonic():
+        return hit[0]
+    return ""
+
+
 async def _resolve(e: ConfigEntry, sem: asyncio.Semaphore, counter: List[int], use_doh: bool = False) -> ConfigEntry:
+    if not e.ip:
+        e.ip = _dns_cached(e.address)
     if e.ip:
         counter[0] += 1
         return e
     async with sem:
-        try:
-            loop = asyncio.get_running_loop()
-            if use_doh:
-                ips = await loop.run_in_executor(None, resolve_doh, e.address)
-                if ips: e.ip = ips[0]
-            else:
-                info = await loop.getaddrinfo(e.address, 443, family=socket.AF_INET)
-                if info:
-                    e.ip = info[0][4][0]
-        except Exception:
-            e.ip = ""
+        # Another config with the same host may have resolved it meanwhile
+        e.ip = _dns_cached(e.address)
+        if not e.ip:
+            try:
+                loop = asyncio.get_running_loop()
+                if use_doh:
+                    ips = await loop.run_in_executor(None, resolve_doh, e.address)
+                    if ips: e.ip = ips[0]
+                else:
+                    info = await loop.getaddrinfo(e.address, 443, family=socket.AF_INET)
+                    if info:
+                        e.ip = info[0][4][0]
+                if e.ip:
+                    _DNS_CACHE[e.address] = (e.ip, time.monotonic() + _DNS_TTL)
+            except Exception:
+                e.ip = ""
         counter[0] += 1
     return e
 
@@ -3842,9 +4483,21 @@ async def resolve_all(st: State, workers: int = 100):
         _w(f"\r  {A.GRN}OK{A.RST} Resolved {total} domains -> {len(set(c.ip for c in st.configs if c.ip))} unique IPs\n")
         _fl()
 
+    # Literal IPs (e.g. template configs built from clean-scan results) and
+    # cached hosts are filled in here, so only real lookups become tasks
+    pending = []
+    for c in st.configs:
+        if not c.ip:
+            c.ip = _dns_cached(c.address)
+        if c.ip:
+            counter[0] += 1
+        else:
+            pending.append(c)
+
     prog_task = asyncio.create_task(_progress())
     try:
-        st.configs = list(await asyncio.gather(*[_resolve(c, sem, counter, getattr(st, "use_doh", False)) for c in st.configs]))
+        use_doh = getattr(st, "use_doh", False)
+        await asyncio.gather(*[_resolve(c, sem, counter, use_doh) for c in pending])
     finally:
         prog_task.cancel()
         try:
@@ -3960,6 +4613,7 @@ async def phase1(st: State, workers: int, timeout: float):
             st.done_count += 1
             if res.alive:
                 st.alive_n += 1
+                st.alive_tls_sum += tls
             else:
                 st.dead_n += 1
 
@@ -3974,6 +4628,20 @@ async def phase1(st: State, workers: int, timeout: float):
                 t.cancel()
 
 
+def _http_header(htxt: str, hlow: str, name: str) -> str:
+    """Return the value of header `name` (lowercase, with colon) or "".
+
+    `hlow` is `htxt.lower()`, computed once by the caller; the value is
+    sliced from `htxt` so its original case is kept.
+    """
+    i = hlow.find("\r\n" + name)
+    if i < 0:
+        return ""
+    i += 2 + len(name)
+    j = hlow.find("\r\n", i)
+    return htxt[i:j if j >= 0 else len(htxt)].strip()
+
+
 async def _dl_one(
     ip: str, size: int, timeout: float,
     host: str = "", path: str = "",
@@ -4059,23 +4727,16 @@ async def _dl_one(
         status_parts = status_line.split(None, 2)
         status_code = status_parts[1] if len(status_parts) >= 2 else ""
         if status_code == "429":
-            ra = ""
-            for line in htxt.split("\r\n"):
-                if line.lower().startswith("retry-after:"):
-                    ra = line.split(":", 1)[1].strip()
-                    break
+            ra = _http_header(htxt, htxt.lower(), "retry-after:")
             _dbg(f"DL {ip} {size}: 429 rate-limited (retry-after={ra})")
             return -1, 0, 0, "", f"429:{ra}"
         if status_code not in ("200", "206"):
             _dbg(f"DL {ip} {size}: HTTP error: {status_line[:80]}")
             return -1, 0, 0, "", f"http:{status_line[:40]}"
 
-        for line in htxt.split("\r\n"):
-            if line.lower().startswith("cf-ray:"):
-                ray = line.split(":", 1)[1].strip()
-                if "-" in ray:
-                    colo = ray.rsplit("-", 1)[-1]
-                break
+        ray = _http_header(htxt, htxt.lower(), "cf-ray:")
+        if "-" in ray:
+            colo = ray.rsplit("-", 1)[-1]
 
         ttfb = (time.monotonic() - t0) * 1000 - conn_ms
         dl_start = time.monotonic()
@@ -4110,14 +4771,14 @@ async def _dl_one(
                             if dt > 0:
                                 sp.append(db / dt)
                         if len(sp) >= 2:
-                            mn = statistics.mean(sp)
+                            # Stable once stdev/mean < 10%; compared as
+                            # variance < 1% of mean^2, in plain float math
+                            # (statistics.mean/stdev cost ~50us per check)
+                            mn = sum(sp) / len(sp)
                             if mn > 0:
-                                try:
-                                    sd = statistics.stdev(sp)
-                                    if sd / mn < 0.10:
-                                        break
-                                except statistics.StatisticsError:
-                                    pass
+                                var = sum((x - mn) ** 2 for x in sp) / (len(sp) - 1)
+                                if var < 0.01 * mn * mn:
+                                    break
             except asyncio.TimeoutError:
                 break
             except Exception:
@@ -4257,107 +4918,136 @@ async def phase2_round(
 
 
 def calc_scores(st: State):
-    has_speed = any(r.best_mbps > 0 for r in st.res.values())
-    for r in st.res.values():
+    results = st.res.values()
+    has_speed = any(r.best_mbps > 0 for r in results)
+    for r in results:
         if not r.alive:
             r.score = 0
             continue
-        lat = max(0, 100 - r.tls_ms / 10) if r.tls_ms > 0 else 0
-        spd = min(100, r.best_mbps * 20) if r.best_mbps > 0 else 0
-        ttfb = max(0, 100 - r.ttfb_ms / 5) if r.ttfb_ms > 0 else 0
-        if r.best_mbps > 0:
-            r.score = round(lat * 0.35 + spd * 0.50 + ttfb * 0.15, 1)
+        tls, mbps = r.tls_ms, r.best_mbps
+        lat = max(0, 100 - tls / 10) if tls > 0 else 0
+        if mbps > 0:
+            spd = min(100, mbps * 20)
+            ttfb = max(0, 100 - r.ttfb_ms / 5) if r.ttfb_ms > 0 else 0
+            sc = round(lat * 0.35 + spd * 0.50 + ttfb * 0.15, 1)
         elif has_speed:
             # Speed rounds ran but this IP wasn't tested - rank below tested ones
-            r.score = round(lat * 0.35, 1)
+            sc = round(lat * 0.35, 1)
         else:
             # No speed rounds at all (latency-only mode)
-            r.score = round(lat, 1)
-        if getattr(r, "h2", False): r.score += 5.0
-        if getattr(r, "loss", 0.0) > 0: r.score -= r.loss * 0.5
-        if getattr(r, "jitter", 0.0) > 10.0: r.score -= min(15.0, (r.jitter - 10.0) * 0.2)
+            sc = round(lat, 1)
+        if r.h2: sc += 5.0
+        if r.loss > 0: sc -= r.loss * 0.5
+        if r.jitter > 10.0: sc -= min(15.0, (r.jitter - 10.0) * 0.2)
+        r.score = sc
+    st.sort_version += 1
+
+
+# sort key -> (Result field getter, descending)
+_RESULT_SORTS = {
+    "score": (operator.attrgetter("score"), True),
+    "latency": (operator.attrgetter("tls_ms"), False),
+    "speed": (operator.attrgetter("best_mbps"), True),
+}
+_BY_IP = operator.attrgetter("ip")
+
+
+def _sort_results(results: List[Result], key: str) -> List[Result]:
+    spec = _RESULT_SORTS.get(key)
+    if spec:
+        results.sort(key=spec[0], reverse=spec[1])
+    return results
 
 
 def sorted_alive(st: State, key: str = "score") -> List[Result]:
-    alive = [r for r in st.res.values() if r.alive]
-    if key == "score":
-        alive.sort(key=lambda r: r.score, reverse=True)
-    elif key == "latency":
-        alive.sort(key=lambda r: r.tls_ms)
-    elif key == "speed":
-        alive.sort(key=lambda r: r.best_mbps, reverse=True)
-    return alive
+    return _sort_results([r for r in st.res.values() if r.alive], key)
 
 
 def sorted_all(st: State, key: str = "score") -> List[Result]:
     """Return all results: alive sorted by key, then dead at the bottom."""
-    alive = sorted_alive(st, key)
-    dead = [r for r in st.res.values() if not r.alive]
-    dead.sort(key=lambda r: r.ip)
-    return alive + dead
+    alive: List[Result] = []
+    dead: List[Result] = []
+    for r in st.res.values():
+        (alive if r.alive else dead).append(r)
+    dead.sort(key=_BY_IP)
+    return _sort_results(alive, key) + dead
 
 
-def draw_menu_header(cols: int) -> List[str]:
+@functools.lru_cache(maxsize=8)
+def _menu_header_lines(cols: int) -> Tuple[str, ...]:
     W = cols - 2
-    lines = []
-    lines.append(f"{A.CYN}╔{'═' * W}╗{A.RST}")
     t = f" {A.BOLD}{A.WHT}CF Config Scanner{A.RST} {A.DIM}v{VERSION}{A.RST}"
-    lines.append(f"{A.CYN}║{A.RST}" + t + " " * (W - _vl(t)) + f"{A.CYN}║{A.RST}")
-    lines.append(f"{A.CYN}╠{'═' * W}╣{A.RST}")
-    return lines
+    return (
+        f"{A.CYN}╔{_rep('═', W)}╗{A.RST}",
+        f"{A.CYN}║{A.RST}" + t + _rep(" ", W - _vl(t)) + f"{A.CYN}║{A.RST}",
+        f"{A.CYN}╠{_rep('═', W)}╣{A.RST}",
+    )
+
+
+def draw_menu_header(cols: int) -> List[str]:
+    """Menu header lines as a fresh list (callers append the body to it)."""
+    return list(_menu_header_lines(cols))
 
 
 def draw_box_line(content: str, cols: int) -> str:
     W = cols - 2
     vl = _vl(content)
-    pad = " " * max(0, W - vl)
+    pad = _rep(" ", W - vl)
     return f"{A.CYN}║{A.RST}{content}{pad}{A.CYN}║{A.RST}"
 
 
+@functools.lru_cache(maxsize=8)
 def draw_box_sep(cols: int) -> str:
-    return f"{A.CYN}╠{'═' * (cols - 2)}╣{A.RST}"
+    return f"{A.CYN}╠{_rep('═', cols - 2)}╣{A.RST}"
 
 
+@functools.lru_cache(maxsize=8)
 def draw_box_bottom(cols: int) -> str:
-    return f"{A.CYN}╚{'═' * (cols - 2)}╝{A.RST}"
+    return f"{A.CYN}╚{_rep('═', cols - 2)}╝{A.RST}"
+
+
+@functools.lru_cache(maxsize=1024)
+def _box_line(c: str, W: int, _cyn=A.CYN, _rst=A.RST, _vl=_vl, _rep=_rep) -> str:
+    """'|'-framed help-screen row, padded to inner width W."""
+    return f"{_cyn}|{_rst}{c}{_rep(' ', W - _vl(c))}\033[{W + 2}G{_cyn}|{_rst}"
+
+
+@functools.lru_cache(maxsize=64)
+def _help_frame(title: str, content: Tuple[str, ...], W: int, visible: int,
+                scroll: int) -> bytes:
+    """Encoded help sub-page frame for one width/height/scroll position."""
+    page = content[scroll:scroll + visible]
+    max_scroll = max(0, len(content) - visible)
+    rule = f"{A.CYN}{'-' * (W + 2)}{A.RST}"
+
+    out: List[str] = [f"{A.CYN}{'=' * (W + 2)}{A.RST}"]
+    out.append(_box_line(f" {A.BOLD}{A.WHT}cfray{A.RST} {A.DIM}v{VERSION}{A.RST}", W))
+    out.append(rule)
+    out.append(_box_line(f" {A.BOLD}{A.WHT}{title}{A.RST}", W))
+    out.append(rule)
+    out.extend(_box_line(line, W) for line in page)
+    out.extend([_box_line("", W)] * (visible - len(page)))
+    out.append(rule)
+    if max_scroll > 0:
+        pct = scroll * 100 // max_scroll if max_scroll else 100
+        nav = f" {A.DIM}[j/k] Scroll  [{pct}%]  [b] Back{A.RST}"
+    else:
+        nav = f" {A.DIM}[b] Back to help menu{A.RST}"
+    out.append(_box_line(nav, W))
+    out.append(f"{A.CYN}{'=' * (W + 2)}{A.RST}")
+    frame = A.CLR + A.HOME + A.HIDE + "\n".join(out) + "\n"
+    return _sgr_merge(frame).encode("utf-8", errors="replace")
 
 
-def _help_show_page(title: str, content: List[str]):
+def _help_show_page(title: str, content: Tuple[str, ...]):
     """Render a scrollable help sub-page. j/k/arrows scroll, b goes back."""
     scroll = 0
     while True:
-        _w(A.CLR + A.HOME + A.HIDE)
         cols, rows = term_size()
         W = cols - 2
         visible = max(3, rows - 8)
-        page = content[scroll:scroll + visible]
         max_scroll = max(0, len(content) - visible)
-
-        out: List[str] = []
-        _cpos = f"\033[{W + 2}G"
-        out.append(f"{A.CYN}{'=' * (W + 2)}{A.RST}")
-        t = f" {A.BOLD}{A.WHT}cfray{A.RST} {A.DIM}v{VERSION}{A.RST}"
-        out.append(f"{A.CYN}|{A.RST}{t}{' ' * max(0, W - _vl(t))}{_cpos}{A.CYN}|{A.RST}")
-        out.append(f"{A.CYN}{'-' * (W + 2)}{A.RST}")
-        ttl = f" {A.BOLD}{A.WHT}{title}{A.RST}"
-        out.append(f"{A.CYN}|{A.RST}{ttl}{' ' * max(0, W - _vl(ttl))}{_cpos}{A.CYN}|{A.RST}")
-        out.append(f"{A.CYN}{'-' * (W + 2)}{A.RST}")
-        for line in page:
-            vl = _vl(line)
-            out.append(f"{A.CYN}|{A.RST}{line}{' ' * max(0, W - vl)}{_cpos}{A.CYN}|{A.RST}")
-        for _ in range(visible - len(page)):
-            out.append(f"{A.CYN}|{A.RST}{' ' * W}{_cpos}{A.CYN}|{A.RST}")
-        out.append(f"{A.CYN}{'-' * (W + 2)}{A.RST}")
-        if max_scroll > 0:
-            pct = scroll * 100 // max_scroll if max_scroll else 100
-            nav = f" {A.DIM}[j/k] Scroll  [{pct}%]  [b] Back{A.RST}"
-        else:
-            nav = f" {A.DIM}[b] Back to help menu{A.RST}"
-        out.append(f"{A.CYN}|{A.RST}{nav}{' ' * max(0, W - _vl(nav))}{_cpos}{A.CYN}|{A.RST}")
-        out.append(f"{A.CYN}{'=' * (W + 2)}{A.RST}")
-
-        _w("\n".join(out) + "\n")
-        _fl()
+        _wb(_help_frame(title, content, W, visible, scroll))
         key = _read_key_blocking()
         if key in ("q", "esc", "b", "ctrl-c", "h"):
             _w(A.SHOW)
@@ -4372,8 +5062,9 @@ def _help_show_page(title: str, content: List[str]):
             scroll = max(0, scroll - visible)
 
 
-def _help_getting_started() -> List[str]:
-    return [
+@functools.lru_cache(maxsize=1)
+def _help_getting_started() -> Tuple[str, ...]:
+    return (
         "",
         f" {A.BOLD}{A.CYN}What is cfray?{A.RST}",
         f"   A Cloudflare config scanner, speed tester, and Xray server",
@@ -4416,11 +5107,12 @@ def _help_getting_started() -> List[str]:
         f"   {A.WHT} h {A.RST}  This help menu",
         f"   {A.WHT} q {A.RST}  Quit",
         "",
-    ]
+    )
 
 
-def _help_scan_modes() -> List[str]:
-    return [
+@functools.lru_cache(maxsize=1)
+def _help_scan_modes() -> Tuple[str, ...]:
+    return (
         "",
         f" {A.BOLD}{A.CYN}Local Files (auto-detected){A.RST}",
         f"   Place config files in the directory where you run cfray.",
@@ -4472,11 +5164,12 @@ def _help_scan_modes() -> List[str]:
         f"   In each round, bottom performers are eliminated.",
         f"   Survivors move to the next round with a bigger download.",
         "",
-    ]
+    )
 
 
-def _help_xray_test() -> List[str]:
-    return [
+@functools.lru_cache(maxsize=1)
+def _help_xray_test() -> Tuple[str, ...]:
+    return (
         "",
         f" {A.BOLD}{A.CYN}What is Xray Pipeline Test?{A.RST}",
         f"   Tests your config through a {A.WHT}real Xray-core proxy tunnel{A.RST}.",
@@ -4529,11 +5222,12 @@ def _help_xray_test() -> List[str]:
         f" {A.BOLD}{A.CYN}CLI equivalent{A.RST}",
         f"   {A.GRN}python3 scanner.py --xray 'vless://...' --xray-frag all{A.RST}",
         "",
-    ]
+    )
 
 
-def _help_clean_finder() -> List[str]:
-    return [
+@functools.lru_cache(maxsize=1)
+def _help_clean_finder() -> Tuple[str, ...]:
+    return (
         "",
         f" {A.BOLD}{A.CYN}What is the Clean IP Finder?{A.RST}",
         f"   Scans Cloudflare's IP ranges to find edge servers that",
@@ -4576,11 +5270,12 @@ def _help_clean_finder() -> List[str]:
         f"   {A.GRN}python3 scanner.py --find-clean --no-tui{A.RST}",
         f"   {A.GRN}python3 scanner.py --find-clean --clean-mode mega --no-tui{A.RST}",
         "",
-    ]
+    )
 
 
-def _help_deploy() -> List[str]:
-    return [
+@functools.lru_cache(maxsize=1)
+def _help_deploy() -> Tuple[str, ...]:
+    return (
         "",
         f" {A.BOLD}{A.CYN}[D] Deploy Xray Server{A.RST}",
         f"   Install and configure Xray on a Linux VPS in minutes.",
@@ -4630,11 +5325,12 @@ def _help_deploy() -> List[str]:
         f"   {A.GRN}python3 scanner.py --deploy --deploy-protocol vmess \\{A.RST}",
         f"   {A.GRN}  --deploy-transport ws --deploy-security tls{A.RST}",
         "",
-    ]
+    )
 
 
-def _help_worker_proxy() -> List[str]:
-    return [
+@functools.lru_cache(maxsize=1)
+def _help_worker_proxy() -> Tuple[str, ...]:
+    return (
         "",
         f" {A.BOLD}{A.CYN}What is Worker Proxy?{A.RST}",
         f"   Creates a Cloudflare Worker that proxies your traffic,",
@@ -4664,11 +5360,12 @@ def _help_worker_proxy() -> List[str]:
         f"   it to your origin, setting the correct Host header.",
         f"   Your ISP only sees a connection to {A.WHT}*.workers.dev{A.RST}.",
         "",
-    ]
+    )
 
 
-def _help_cli_reference() -> List[str]:
-    return [
+@functools.lru_cache(maxsize=1)
+def _help_cli_reference() -> Tuple[str, ...]:
+    return (
         "",
         f" {A.BOLD}{A.CYN}Input options{A.RST}",
         f"   {A.WHT}-i, --input FILE{A.RST}     Input file (VLESS URIs or domains.json)",
@@ -4738,69 +5435,71 @@ def _help_cli_reference() -> List[str]:
         f"   {A.GRN}python3 scanner.py --deploy --deploy-protocol vmess \\{A.RST}",
         f"   {A.GRN}  --deploy-transport ws --deploy-security tls{A.RST}",
         "",
-    ]
+    )
+
+
+_HELP_TOPICS: Tuple[Tuple[str, str, object], ...] = (
+    ("Getting Started",            "First steps, basic workflow, scoring",     _help_getting_started),
+    ("Scan & Test Modes",          "File scan, subscription, template",        _help_scan_modes),
+    ("Xray Pipeline Test",         "Fragment + transport pipeline testing",    _help_xray_test),
+    ("Clean IP Finder",            "Find reachable Cloudflare edge IPs",      _help_clean_finder),
+    *([ ("Deploy & Server Management", "Install Xray on VPS, manage connections", _help_deploy)] if sys.platform == "linux" else []),
+    ("Worker Proxy",               "Fresh workers.dev SNI for any config",    _help_worker_proxy),
+    ("CLI Reference",              "All command-line flags and examples",      _help_cli_reference),
+)
+_HELP_ICONS: Tuple[str, ...] = ("🚀", "📡", "⚡", "🔍", "🛠", "☁", "💻")
+
+
+@functools.lru_cache(maxsize=8)
+def _help_topic_rows(W: int) -> Tuple[str, ...]:
+    """Boxed topic-list rows of the help hub for an inner width W."""
+    rows: List[str] = []
+    for i, (title, desc, _) in enumerate(_HELP_TOPICS):
+        num = f"  {A.CYN}{A.BOLD}{i + 1}{A.RST}"
+        rows.append(f"{num}.  {_HELP_ICONS[i]} {A.BOLD}{A.WHT}{title}{A.RST}")
+        rows.append(f"      {A.DIM}{desc}{A.RST}")
+        rows.append("")
+    return tuple(_box_line(c, W) for c in rows)
 
 
 def tui_show_guide():
     """Multi-page help system. Shows topic hub, dispatches to sub-pages."""
-    pages = [
-        ("Getting Started",            "First steps, basic workflow, scoring",     _help_getting_started),
-        ("Scan & Test Modes",          "File scan, subscription, template",        _help_scan_modes),
-        ("Xray Pipeline Test",         "Fragment + transport pipeline testing",    _help_xray_test),
-        ("Clean IP Finder",            "Find reachable Cloudflare edge IPs",      _help_clean_finder),
-        *([ ("Deploy & Server Management", "Install Xray on VPS, manage connections", _help_deploy)] if sys.platform == "linux" else []),
-        ("Worker Proxy",               "Fresh workers.dev SNI for any config",    _help_worker_proxy),
-        ("CLI Reference",              "All command-line flags and examples",      _help_cli_reference),
-    ]
+    pages = _HELP_TOPICS
     while True:
-        _w(A.CLR + A.HOME + A.HIDE)
         cols, _ = term_size()
         W = cols - 2
 
-        out: List[str] = []
-        _cpos = f"\033[{W + 2}G"
-        def bx(c: str):
-            pad = " " * max(0, W - _vl(c))
-            out.append(f"{A.CYN}|{A.RST}{c}{pad}{_cpos}{A.CYN}|{A.RST}")
-
-        out.append(f"{A.CYN}{'=' * (W + 2)}{A.RST}")
-        t = f" {A.BOLD}{A.WHT}cfray{A.RST} {A.DIM}v{VERSION}{A.RST}"
-        bx(t)
-        out.append(f"{A.CYN}{'-' * (W + 2)}{A.RST}")
-        bx(f" {A.BOLD}{A.WHT}Help & Guide{A.RST}")
-        out.append(f"{A.CYN}{'-' * (W + 2)}{A.RST}")
-        bx("")
-
-        icons = ["🚀", "📡", "⚡", "🔍", "🛠", "☁", "💻"]
-        for i, (title, desc, _) in enumerate(pages):
-            num = f"  {A.CYN}{A.BOLD}{i + 1}{A.RST}"
-            bx(f"{num}.  {icons[i]} {A.BOLD}{A.WHT}{title}{A.RST}")
-            bx(f"      {A.DIM}{desc}{A.RST}")
-            bx("")
-
-        bx(f" {A.DIM}{'─' * (W - 2)}{A.RST}")
-        bx(f" {A.DIM}[1-{len(pages)}] Open topic    [q] Back to menu{A.RST}")
-        bx("")
-        bx(f" {A.BOLD}{A.WHT}Made By Sam — SamNet Technologies{A.RST}")
-        bx(f" {A.DIM}https://github.com/SamNet-dev/cfray{A.RST}")
-        out.append(f"{A.CYN}{'=' * (W + 2)}{A.RST}")
+        rule = f"{A.CYN}{_rep('-', W + 2)}{A.RST}"
+        out: List[str] = [f"{A.CYN}{_rep('=', W + 2)}{A.RST}"]
+        out.append(_box_line(f" {A.BOLD}{A.WHT}cfray{A.RST} {A.DIM}v{VERSION}{A.RST}", W))
+        out.append(rule)
+        out.append(_box_line(f" {A.BOLD}{A.WHT}Help & Guide{A.RST}", W))
+        out.append(rule)
+        out.append(_box_line("", W))
+        out.extend(_help_topic_rows(W))
+        out.extend(_box_line(c, W) for c in (
+            f" {A.DIM}{_rep('─', W - 2)}{A.RST}",
+            f" {A.DIM}[1-{len(pages)}] Open topic    [q] Back to menu{A.RST}",
+            "",
+            f" {A.BOLD}{A.WHT}Made By Sam — SamNet Technologies{A.RST}",
+            f" {A.DIM}https://github.com/SamNet-dev/cfray{A.RST}",
+        ))
+        out.append(f"{A.CYN}{_rep('=', W + 2)}{A.RST}")
 
-        _w("\n".join(out) + "\n")
-        _fl()
+        _wframe_lines(out, A.CLR + A.HOME + A.HIDE)
         key = _read_key_blocking()
         if key in ("q", "b", "esc", "ctrl-c"):
             _w(A.SHOW)
             return
         if key.isdigit() and 1 <= int(key) <= len(pages):
             title, _, fn = pages[int(key) - 1]
-            _help_show_page(title, fn())
+            _help_show_page(title, fn())  # builders are lru_cached
             continue
 
 
 def _clean_pick_mode() -> Optional[str]:
     """Pick scan scope for clean IP finder. Returns mode or None/'__back__'."""
     while True:
-        _w(A.CLR + A.HOME + A.HIDE)
         cols, _ = term_size()
         lines = draw_menu_header(cols)
         lines.append(draw_box_line(f" {A.BOLD}Find Clean Cloudflare IPs{A.RST}", cols))
@@ -4827,8 +5526,7 @@ def _clean_pick_mode() -> Optional[str]:
         lines.append(draw_box_line(f" {A.DIM}[1-4] Select   [B] Back   [Q] Quit{A.RST}", cols))
         lines.append(draw_box_bottom(cols))
 
-        _w("\n".join(lines) + "\n")
-        _fl()
+        _wframe_lines(lines, A.CLR + A.HOME + A.HIDE)
 
         key = _read_key_blocking()
         if key in ("q", "ctrl-c"):
@@ -4845,112 +5543,169 @@ def _clean_pick_mode() -> Optional[str]:
             return "mega"
 
 
+# Clean-scan progress frame pieces; only the numbers change between frames.
+_PROG_TITLE = f" {A.BOLD}{A.WHT}Finding Clean Cloudflare IPs{A.RST}"
+_PROG_TITLE_VL = _vl(_PROG_TITLE)
+_PROG_RIGHT_FMT = f"{A.DIM}%s  |  ^C stop{A.RST}".__mod__
+_PROG_BAR_FMT = f" Probing [{A.GRN}%s{A.DIM}%s{A.RST}] %s/%s  %d%%".__mod__
+_PROG_FOUND_FMT = f" {A.GRN}Found: %s clean IPs{A.RST}".__mod__
+_PROG_BEST_FMT = f"   {A.DIM}Best: %.0fms{A.RST}".__mod__
+_PROG_ROW_FMT = f"   {A.CYN}%3d.{A.RST} %-22s {A.GRN}%6.0fms{A.RST}".__mod__
+_PROG_TOP_HDR = f" {A.BOLD}Top IPs found (by latency):{A.RST}"
+_PROG_SCANNING = f"   {A.DIM}Scanning...{A.RST}"
+_PROG_FOOTER = f" {A.DIM}Press Ctrl+C to stop early and show results{A.RST}"
+
+
 def _draw_clean_progress(cs: CleanScanState):
     """Draw live progress screen for clean IP scan."""
     cols, rows = term_size()
     W = cols - 2
-    out: List[str] = []
+    edge = f"{A.CYN}║{A.RST}"
 
-    def bx(c: str):
-        out.append(f"{A.CYN}║{A.RST}" + c + " " * max(0, W - _vl(c)) + f"{A.CYN}║{A.RST}")
+    def box(c: str) -> str:
+        return edge + c + _rep(" ", W - _vl(c)) + edge
 
-    out.append(f"{A.CYN}╔{'═' * W}╗{A.RST}")
     elapsed = _fmt_elapsed(time.monotonic() - cs.start_time) if cs.start_time else "0s"
-    title = f" {A.BOLD}{A.WHT}Finding Clean Cloudflare IPs{A.RST}"
-    right = f"{A.DIM}{elapsed}  |  ^C stop{A.RST}"
-    bx(title + " " * max(1, W - _vl(title) - _vl(right)) + right)
-    out.append(f"{A.CYN}╠{'═' * W}╣{A.RST}")
+    draw_key = (cs.done, cs.found, len(cs.results), elapsed, cols, rows)
+    last = cs.last_draw
+    if draw_key == last:
+        return
+    cs.last_draw = draw_key
 
+    right = _PROG_RIGHT_FMT((elapsed,))
+    title_ln = box(_PROG_TITLE + _rep(" ", max(1, W - _PROG_TITLE_VL - _vl(right))) + right)
     pct = cs.done * 100 // max(1, cs.total)
     bw = max(1, min(30, W - 40))
     filled = int(bw * pct / 100)
-    bar = f"{A.GRN}{'█' * filled}{A.DIM}{'░' * (bw - filled)}{A.RST}"
-    bx(f" Probing [{bar}] {cs.done:,}/{cs.total:,}  {pct}%")
+    bar_ln = box(_PROG_BAR_FMT((_rep("█", filled), _rep("░", bw - filled),
+                                f"{cs.done:,}", f"{cs.total:,}", pct)))
 
-    found_line = f" {A.GRN}Found: {cs.found:,} clean IPs{A.RST}"
+    if last and last[1:3] == draw_key[1:3] and last[4:] == draw_key[4:]:
+        # Only the probe counter / clock moved: repaint just those two rows
+        _wframe(f"\033[2;1H{title_ln}\033[4;1H{bar_ln}")
+        return
+
+    sep = f"{A.CYN}╠{_rep('═', W)}╣{A.RST}\n"
+    buf = io.StringIO()
+    wr = buf.write
+    wr(A.HOME)
+    wr(f"{A.CYN}╔{_rep('═', W)}╗{A.RST}\n")
+    wr(title_ln); wr("\n")
+    wr(sep)
+    wr(bar_ln); wr("\n")
+
+    found_line = _PROG_FOUND_FMT((f"{cs.found:,}",))
     if cs.results:
-        best_lat = cs.results[0][1]
-        found_line += f"   {A.DIM}Best: {best_lat:.0f}ms{A.RST}"
-    bx(found_line)
+        found_line += _PROG_BEST_FMT((cs.best,))
+    wr(box(found_line)); wr("\n")
 
-    out.append(f"{A.CYN}╠{'═' * W}╣{A.RST}")
-    bx(f" {A.BOLD}Top IPs found (by latency):{A.RST}")
+    wr(sep)
+    wr(box(_PROG_TOP_HDR)); wr("\n")
 
     vis = min(15, rows - 12)
     if cs.results:
-        for i, (ip, lat) in enumerate(cs.results[:vis]):
-            bx(f"   {A.CYN}{i+1:>3}.{A.RST} {ip:<22} {A.GRN}{lat:>6.0f}ms{A.RST}")
+        for i, (ip, lat) in enumerate(itertools.islice(cs.results, vis)):
+            wr(box(_PROG_ROW_FMT((i + 1, ip, lat)))); wr("\n")
     else:
-        bx(f"   {A.DIM}Scanning...{A.RST}")
+        wr(box(_PROG_SCANNING)); wr("\n")
 
     # Fill remaining space
-    used = len(cs.results[:vis]) if cs.results else 1
+    used = min(len(cs.results), vis) if cs.results else 1
     for _ in range(vis - used):
-        bx("")
+        wr(box("")); wr("\n")
 
-    out.append(f"{A.CYN}╠{'═' * W}╣{A.RST}")
-    bx(f" {A.DIM}Press Ctrl+C to stop early and show results{A.RST}")
-    out.append(f"{A.CYN}╚{'═' * W}╝{A.RST}")
+    wr(sep)
+    wr(box(_PROG_FOOTER)); wr("\n")
+    wr(f"{A.CYN}╚{_rep('═', W)}╝{A.RST}\n")
+
+    _wframe(buf.getvalue())
 
-    _w(A.HOME)
-    _w("\n".join(out) + "\n")
-    _fl()
 
+def _save_clean_ips(results: CleanResults) -> str:
+    """Write clean addresses to results/clean_ips.txt in one write. Returns path."""
+    path = os.path.abspath(_results_path("clean_ips.txt"))
+    data = "".join([ip + "\n" for ip in results.iter_addrs()]).encode("ascii")
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
 
-def _clean_show_results(results: List[Tuple[str, float]], elapsed: str) -> Optional[str]:
+
+def _clean_show_results(results: CleanResults, elapsed: str) -> Optional[str]:
     """Show clean IP results with j/k scrolling. Returns action string or None."""
     MAX_SHOW = 300
+    DATA_ROW = 8  # screen row of the first result (menu header 3 + title/sep/hdr/rule 4)
     display = results[:MAX_SHOW]
     offset = 0
+    drawn: Optional[Tuple[int, int, int]] = None  # (cols, rows, offset) on screen
+    row_cache: Dict[int, List[str]] = {}
+
+    def _rows(cols: int) -> List[str]:
+        rr = row_cache.get(cols)
+        if rr is None:
+            rr = row_cache[cols] = [
+                draw_box_line(f" {i+1:>4}  {ip:<22} {A.GRN}{lat:>6.0f}ms{A.RST}", cols)
+                for i, (ip, lat) in enumerate(display)]
+        return rr
+
+    def _hdr(cols: int, vis: int) -> str:
+        hdr = f" {A.BOLD}{'#':>4}  {'Address':<22} {'Latency':>8}{A.RST}"
+        if len(display) > vis:
+            end = min(len(display), offset + vis)
+            pos = f"{A.DIM}[{offset+1}-{end} of {len(display)}"
+            if len(results) > MAX_SHOW:
+                pos += f", {len(results):,} total"
+            pos += f"]{A.RST}"
+            hdr += _rep(" ", max(1, cols - 2 - _vl(hdr) - _vl(pos) - 1)) + pos
+        return draw_box_line(hdr, cols)
 
     while True:
-        _w(A.CLR + A.HOME + A.HIDE)
         cols, rows = term_size()
-        lines = draw_menu_header(cols)
-
-        if results:
-            lines.append(draw_box_line(
-                f" {A.BOLD}{A.GRN}Scan Complete!{A.RST}  "
-                f"Found {A.BOLD}{len(results):,}{A.RST} clean IPs in {elapsed}", cols))
+        # header + separator = 2 rows, footer area = 5 rows, menu header = 3 rows
+        vis = max(5, rows - 13)
+
+        if drawn is not None and drawn[:2] == (cols, rows) and abs(offset - drawn[2]) <= 1:
+            if offset != drawn[2]:
+                # Scrolled one row: delete/insert a line inside the list
+                # and paint only the row that came into view.
+                rr = _rows(cols)
+                top, bot = DATA_ROW, DATA_ROW + vis - 1
+                if offset > drawn[2]:
+                    seq = f"\033[{top};1H\033[M\033[{bot};1H\033[L{rr[offset + vis - 1]}"
+                else:
+                    seq = f"\033[{bot};1H\033[M\033[{top};1H\033[L{rr[offset]}"
+                seq += f"\033[{DATA_ROW - 2};1H{_hdr(cols, vis)}"
+                _wframe(seq)
         else:
-            lines.append(draw_box_line(f" {A.YEL}Scan Complete — no clean IPs found.{A.RST}", cols))
-        lines.append(draw_box_sep(cols))
+            lines = draw_menu_header(cols)
 
-        if display:
-            # header + separator = 2 rows, footer area = 5 rows, menu header = 3 rows
-            vis = max(5, rows - 13)
-            end = min(len(display), offset + vis)
+            if results:
+                lines.append(draw_box_line(
+                    f" {A.BOLD}{A.GRN}Scan Complete!{A.RST}  "
+                    f"Found {A.BOLD}{len(results):,}{A.RST} clean IPs in {elapsed}", cols))
+            else:
+                lines.append(draw_box_line(f" {A.YEL}Scan Complete — no clean IPs found.{A.RST}", cols))
+            lines.append(draw_box_sep(cols))
 
-            hdr = f" {A.BOLD}{'#':>4}  {'Address':<22} {'Latency':>8}{A.RST}"
-            if len(display) > vis:
-                pos = f"{A.DIM}[{offset+1}-{end} of {len(display)}"
-                if len(results) > MAX_SHOW:
-                    pos += f", {len(results):,} total"
-                pos += f"]{A.RST}"
-                hdr += " " * max(1, cols - 2 - _vl(hdr) - _vl(pos) - 1) + pos
-            lines.append(draw_box_line(hdr, cols))
-            lines.append(draw_box_line(
-                f" {A.DIM}{'─'*4}  {'─'*22} {'─'*8}{A.RST}", cols))
-
-            for i in range(offset, end):
-                ip, lat = display[i]
+            if display:
+                lines.append(_hdr(cols, vis))
                 lines.append(draw_box_line(
-                    f" {i+1:>4}  {ip:<22} {A.GRN}{lat:>6.0f}ms{A.RST}", cols))
+                    f" {A.DIM}{'─'*4}  {'─'*22} {'─'*8}{A.RST}", cols))
+                lines.extend(_rows(cols)[offset:offset + vis])
 
-        lines.append(draw_box_line("", cols))
-        lines.append(draw_box_sep(cols))
-        ft = ""
-        if results:
-            ft += f" {A.CYN}[S]{A.RST} Save all  {A.CYN}[T]{A.RST} Template+SpeedTest  "
-        ft += f" {A.CYN}[B]{A.RST} Back"
-        lines.append(draw_box_line(ft, cols))
-        if display and len(display) > vis:
-            lines.append(draw_box_line(
-                f" {A.DIM}j/↓ down  k/↑ up  n/p page down/up{A.RST}", cols))
-        lines.append(draw_box_bottom(cols))
+            lines.append(draw_box_line("", cols))
+            lines.append(draw_box_sep(cols))
+            ft = ""
+            if results:
+                ft += f" {A.CYN}[S]{A.RST} Save all  {A.CYN}[T]{A.RST} Template+SpeedTest  "
+            ft += f" {A.CYN}[B]{A.RST} Back"
+            lines.append(draw_box_line(ft, cols))
+            if display and len(display) > vis:
+                lines.append(draw_box_line(
+                    f" {A.DIM}j/↓ down  k/↑ up  n/p page down/up{A.RST}", cols))
+            lines.append(draw_box_bottom(cols))
 
-        _w("\n".join(lines) + "\n")
-        _fl()
+            _wframe_lines(lines, A.CLR + A.HOME + A.HIDE)
+        drawn = (cols, rows, offset)
 
         key = _read_key_blocking()
         if key in ("b", "esc", "q", "ctrl-c"):
@@ -4973,6 +5728,7 @@ def _clean_show_results(results: List[Tuple[str, float]], elapsed: str) -> Optio
         if key == "s" and results:
             return "save"
         if key == "t" and results:
+            drawn = None  # prompt text below the box; repaint fully next time
             _w(A.SHOW)
             _w(f"\n {A.BOLD}{A.CYN}Speed Test with Clean IPs{A.RST}\n")
             _w(f" {A.DIM}Paste a VLESS/VMess config URI. The address in it will be{A.RST}\n")
@@ -5014,47 +5770,40 @@ async def tui_run_clean_finder() -> Optional[Tuple[str, str]]:
     _fl()
 
     ips = generate_cf_ips(CF_SUBNETS, scan_cfg["sample"])
+    n_ips = count_cf_ips(CF_SUBNETS, scan_cfg["sample"])
     ports = scan_cfg.get("ports", [443])
-    _dbg(f"CLEAN: Generated {len(ips):,} IPs × {len(ports)} port(s), sample={scan_cfg['sample']}")
+    _dbg(f"CLEAN: Generated {n_ips:,} IPs × {len(ports)} port(s), sample={scan_cfg['sample']}")
 
     # Run scan with live progress
     cs = CleanScanState()
     scan_task = asyncio.ensure_future(
         scan_clean_ips(
             ips, workers=scan_cfg["workers"], timeout=5.0,
-            validate=scan_cfg["validate"], cs=cs, ports=ports,
+            validate=scan_cfg["validate"], cs=cs, ports=ports, total=n_ips,
         )
     )
 
-    old_sigint = signal.getsignal(signal.SIGINT)
-    _loop = asyncio.get_running_loop()
-    def _sig(sig, frame):
-        cs.interrupted = True
-        _loop.call_soon_threadsafe(scan_task.cancel)
-    signal.signal(signal.SIGINT, _sig)
-
     _w(A.CLR + A.HIDE)
-    try:
-        while not scan_task.done():
-            _draw_clean_progress(cs)
-            await asyncio.sleep(0.3)
-    except asyncio.CancelledError:
-        pass
-    except Exception as e:
-        _dbg(f"CLEAN: progress loop error: {e}")
-    finally:
-        signal.signal(signal.SIGINT, old_sigint)
+    with _intercept_sigint(scan_task, cs, finish=False):
+        try:
+            while not scan_task.done():
+                _draw_clean_progress(cs)
+                await asyncio.sleep(0.3)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            _dbg(f"CLEAN: progress loop error: {e}")
 
     try:
         results = await scan_task
     except asyncio.CancelledError:
-        results = sorted(cs.all_results or cs.results, key=lambda x: x[1])
+        results = _clean_partial_results(cs)
     except Exception as e:
         _dbg(f"CLEAN: scan_task error: {e}")
-        results = sorted(cs.all_results or cs.results, key=lambda x: x[1])
+        results = _clean_partial_results(cs)
 
     elapsed = _fmt_elapsed(time.monotonic() - cs.start_time) if cs.start_time > 0 else "0s"
-    _dbg(f"CLEAN: Done in {elapsed}. Found {len(results):,} / {len(ips):,}")
+    _dbg(f"CLEAN: Done in {elapsed}. Found {len(results):,} / {n_ips:,}")
 
     # Show results and get user action
     action = _clean_show_results(results, elapsed)
@@ -5065,10 +5814,7 @@ async def tui_run_clean_finder() -> Optional[Tuple[str, str]]:
     if action == "save":
         try:
             os.makedirs(RESULTS_DIR, exist_ok=True)
-            path = os.path.abspath(_results_path("clean_ips.txt"))
-            with open(path, "w", encoding="utf-8") as f:
-                for ip, lat in results:
-                    f.write(f"{ip}\n")
+            path = _save_clean_ips(results)
             _w(f"\n {A.GRN}Saved {len(results):,} IPs to {path}{A.RST}\n")
         except Exception as e:
             _w(f"\n {A.RED}Save error: {e}{A.RST}\n")
@@ -5081,10 +5827,7 @@ async def tui_run_clean_finder() -> Optional[Tuple[str, str]]:
         template_uri = action[9:]
         try:
             os.makedirs(RESULTS_DIR, exist_ok=True)
-            path = os.path.abspath(_results_path("clean_ips.txt"))
-            with open(path, "w", encoding="utf-8") as f:
-                for ip, lat in results:
-                    f.write(f"{ip}\n")
+            path = _save_clean_ips(results)
         except Exception as e:
             _w(f"\n {A.RED}Save error: {e}{A.RST}\n")
             _fl()
@@ -5119,24 +5862,23 @@ def tui_pick_file() -> Optional[Tuple[str, str]]:
     files = find_config_files()
 
     while True:
-        _w(A.CLR + A.HOME + A.HIDE)
         cols, rows = term_size()
         W = cols - 2
 
         out: List[str] = []
         def bx(c: str):
-            pad = " " * max(0, W - _vl(c))
+            pad = _rep(" ", W - _vl(c))
             out.append(f"{A.CYN}║{A.RST}{c}{pad}\033[{W + 2}G{A.CYN}║{A.RST}")
 
         # Single clean box — no internal double-line separators
-        out.append(f"{A.CYN}╔{'═' * W}╗{A.RST}")
+        out.append(f"{A.CYN}╔{_rep('═', W)}╗{A.RST}")
         title = f" ⚡ {A.BOLD}{A.WHT}cfray{A.RST} {A.DIM}v{VERSION}{A.RST}"
         subtitle = f"{A.DIM}Cloudflare Config Scanner{A.RST}"
         bx(title + "  " + subtitle)
         bx("")
 
         # Section: Local Files
-        bx(f" {A.DIM}── {A.BOLD}{A.WHT}📁 LOCAL FILES{A.RST} {A.DIM}{'─' * max(1, W - 19)}{A.RST}")
+        bx(f" {A.DIM}── {A.BOLD}{A.WHT}📁 LOCAL FILES{A.RST} {A.DIM}{_rep('─', max(1, W - 19))}{A.RST}")
         if files:
             for i, (path, ftype, count) in enumerate(files[:9]):
                 num = f" {A.CYN}{A.BOLD}{i + 1}{A.RST}."
@@ -5149,13 +5891,13 @@ def tui_pick_file() -> Optional[Tuple[str, str]]:
         bx("")
 
         # Section: Remote Sources
-        bx(f" {A.DIM}── {A.BOLD}{A.WHT}🌐 REMOTE SOURCES{A.RST} {A.DIM}{'─' * max(1, W - 22)}{A.RST}")
+        bx(f" {A.DIM}── {A.BOLD}{A.WHT}🌐 REMOTE SOURCES{A.RST} {A.DIM}{_rep('─', max(1, W - 22))}{A.RST}")
         bx(f"  {A.CYN}{A.BOLD}s{A.RST}.  🔗 {A.WHT}Subscription URL{A.RST}        {A.DIM}Fetch configs from remote URL{A.RST}")
         bx(f"  {A.CYN}{A.BOLD}p{A.RST}.  📂 {A.WHT}Enter File Path{A.RST}         {A.DIM}Load from custom file path{A.RST}")
         bx("")
 
         # Section: Tools
-        bx(f" {A.DIM}── {A.BOLD}{A.WHT}🔧 TOOLS{A.RST} {A.DIM}{'─' * max(1, W - 13)}{A.RST}")
+        bx(f" {A.DIM}── {A.BOLD}{A.WHT}🔧 TOOLS{A.RST} {A.DIM}{_rep('─', max(1, W - 13))}{A.RST}")
         bx(f"  {A.CYN}{A.BOLD}t{A.RST}.  🧩 {A.WHT}Template + Addresses{A.RST}    {A.DIM}Test one config against many IPs{A.RST}")
         bx(f"  {A.CYN}{A.BOLD}f{A.RST}.  🔍 {A.WHT}Clean IP Finder{A.RST}         {A.DIM}Scan Cloudflare IP ranges{A.RST}")
         bx(f"  {A.CYN}{A.BOLD}x{A.RST}.  ⚡ {A.WHT}Xray Pipeline Test{A.RST}    {A.DIM}Smart: probe → validate → expand → speed{A.RST}")
@@ -5169,12 +5911,11 @@ def tui_pick_file() -> Optional[Tuple[str, str]]:
         if sys.platform == "linux":
             bx(f"  {A.CYN}{A.BOLD}c{A.RST}.  🔧 {A.WHT}Connection Manager{A.RST}    {A.DIM}Manage existing Xray server configs{A.RST}")
         bx("")
-        bx(f" {A.DIM}{'─' * (W - 2)}{A.RST}")
+        bx(f" {A.DIM}{_rep('─', W - 2)}{A.RST}")
         bx(f" {A.DIM}[h] ❓ Help    [q] 🚪 Quit{A.RST}")
-        out.append(f"{A.CYN}╚{'═' * W}╝{A.RST}")
+        out.append(f"{A.CYN}╚{_rep('═', W)}╝{A.RST}")
 
-        _w("\n".join(out) + "\n")
-        _fl()
+        _wframe_lines(out, A.CLR + A.HOME + A.HIDE)
 
         key = _read_key_blocking()
         if key in ("q", "ctrl-c", "esc"):
@@ -5204,7 +5945,7 @@ def tui_pick_file() -> Optional[Tuple[str, str]]:
             url = _tui_prompt_text("URL:")
             if url is None:
                 continue
-            if not url.lower().startswith(("http://", "https://")):
+            if not _HTTP_URL_RE.match(url):
                 _w(f" {A.RED}URL must start with http:// or https://{A.RST}\n")
                 _fl()
                 time.sleep(1.5)
@@ -5266,8 +6007,7 @@ def tui_pick_file() -> Optional[Tuple[str, str]]:
 def tui_pick_mode() -> Optional[str]:
     """Interactive mode picker. Returns mode name or None."""
     while True:
-        _w(A.CLR + A.HOME + A.HIDE)
-        cols, _ = term_size()
+        cols, _ = _cached_term_size()
         lines = draw_menu_header(cols)
         lines.append(draw_box_line(f" {A.BOLD}Select scan mode:{A.RST}", cols))
         lines.append(draw_box_line("", cols))
@@ -5299,8 +6039,7 @@ def tui_pick_mode() -> Optional[str]:
         )
         lines.append(draw_box_bottom(cols))
 
-        _w("\n".join(lines) + "\n")
-        _fl()
+        _wframe_lines(lines, A.CLR + A.HOME + A.HIDE)
 
         key = _read_key_blocking()
         if key in ("q", "ctrl-c"):
@@ -5317,44 +6056,81 @@ def tui_pick_mode() -> Optional[str]:
             return "thorough"
 
 
+@functools.lru_cache(maxsize=128)
+def _bar_fill(filled: int, w: int) -> str:
+    """Coloured progress bar with `filled` of `w` cells done."""
+    return f"{A.GRN}{_rep('█', filled)}{A.DIM}{_rep('░', w - filled)}{A.RST}"
+
+
 class XrayDashboard:
     """TUI dashboard for xray proxy test progress."""
 
+    # Static chrome as (text, visible width), measured once
+    _HDR_MULTI = (f" {A.BOLD}{'#':>3}  {'IP':<18} {'SNI':<20} {'Frag':>8}  "
+                  f"{'Conn':>6}  {'TTFB':>6}  {'Score':>5}{A.RST}")
+    _RULE_MULTI = f" {A.DIM}{'─'*3}  {'─'*18} {'─'*20} {'─'*8}  {'─'*6}  {'─'*6}  {'─'*5}{A.RST}"
+    _HDR_SINGLE = (f" {A.BOLD}{'#':>3}  {'SNI':<26} {'Fragment':>10}  "
+                   f"{'Conn':>6}  {'TTFB':>6}  {'Score':>5}{A.RST}")
+    _RULE_SINGLE = f" {A.DIM}{'─'*3}  {'─'*26} {'─'*10}  {'─'*6}  {'─'*6}  {'─'*5}{A.RST}"
+    _FOOT_WIDE = (f" {A.CYN}[S]{A.RST} Sort  {A.CYN}[E]{A.RST} Export  "
+                  f"{A.CYN}[C]{A.RST} View URI  "
+                  f"{A.CYN}[J/K]{A.RST} Scroll  {A.CYN}[N/P]{A.RST} Page  "
+                  f"{A.CYN}[B]{A.RST} Back  {A.CYN}[Q]{A.RST} Quit")
+    _FOOT_NARROW = f" {A.CYN}[S]{A.RST}ort {A.CYN}[E]{A.RST}xp {A.CYN}[C]{A.RST}URI {A.CYN}[B]{A.RST}ack {A.CYN}[Q]{A.RST}uit"
+    _FOOT_SCROLL = f" {A.CYN}[J/K]{A.RST} Scroll  {A.CYN}[N/P]{A.RST} Page"
+    # Score cell templates by bucket
+    _SC_HI = f"{A.GRN}%5.1f{A.RST}".__mod__
+    _SC_MID = f"{A.YEL}%5.1f{A.RST}".__mod__
+    _SC_LO = "%5.1f".__mod__
+    _SC_NONE = f"{'--':>5}"
+    _STATIC_VL: Dict[str, int] = {
+        t: _vl(t) for t in (_HDR_MULTI, _RULE_MULTI, _HDR_SINGLE, _RULE_SINGLE,
+                            _FOOT_WIDE, _FOOT_NARROW, _FOOT_SCROLL, "")
+    }
+
     def __init__(self, xst: XrayTestState):
         self.xst = xst
         self.sort = "score"
         self.offset = 0
+        self._prev_lines: List[str] = []  # last frame on screen, for diffing
+        self._prev_size: Tuple[int, int] = (0, 0)
+        self._sorted: List[XrayVariation] = []
+        self._sort_sig: tuple = ()
+        self._multi_ip: Optional[Tuple[int, bool]] = None  # (id(variations), flag)
+
+    def invalidate(self):
+        """Force the next draw() to repaint the whole screen."""
+        self._prev_lines = []
 
     def _bar(self, cur: int, tot: int, w: int = 24) -> str:
         if tot == 0:
-            return "░" * w
-        p = min(1.0, cur / tot)
-        f = int(w * p)
-        return f"{A.GRN}{'█' * f}{A.DIM}{'░' * (w - f)}{A.RST}"
+            return _rep("░", w)
+        return _bar_fill(int(w * min(1.0, cur / tot)), w)
 
     def draw(self):
-        cols, rows = term_size()
+        cols, rows = _cached_term_size()
         W = cols - 2
         xst = self.xst
 
-        # Live-score alive variations that don't have a score yet
-        for _v in xst.variations:
+        # Live-score variations that came alive since the last frame
+        pending, xst.unscored = xst.unscored, []
+        for _v in pending:
             if _v.alive and _v.score == 0 and _v.connect_ms > 0:
-                cms = _v.connect_ms if _v.connect_ms >= 0 else 1000
-                tms = _v.ttfb_ms if _v.ttfb_ms >= 0 else 1000
-                _lat = max(0.0, 100.0 - cms / 10.0)
-                _ttfb = max(0.0, 100.0 - tms / 5.0)
-                if _v.native_tested or _v.speed_mbps < 0.01:
-                    _v.score = round(_lat * 0.55 + _ttfb * 0.45, 1)
-                else:
-                    _spd = min(100.0, _v.speed_mbps * 20.0)
-                    _v.score = round(_lat * 0.35 + _spd * 0.50 + _ttfb * 0.15, 1)
+                _v.score = _xray_score(_v)
+                xst.version += 1
 
         out: List[str] = []
 
-        def bx(c: str):
-            pad = " " * max(0, W - _vl(c))
-            out.append(f"{A.CYN}║{A.RST}{c}{pad}\033[{W + 2}G{A.CYN}║{A.RST}")
+        static_vl = self._STATIC_VL
+        edge_l = f"{A.CYN}║{A.RST}"
+        edge_r = f"\033[{W + 2}G{A.CYN}║{A.RST}"
+
+        def bx(c: str, vlen: Optional[int] = None):
+            if vlen is None:
+                vlen = static_vl.get(c)
+                if vlen is None:
+                    vlen = _vl(c)
+            out.append(edge_l + c + _rep(" ", W - vlen) + edge_r)
 
         out.append(f"{A.CYN}╔{'═' * W}╗{A.RST}")
         elapsed = _fmt_elapsed(time.monotonic() - xst.start_time) if xst.start_time else "0s"
@@ -5436,61 +6212,72 @@ class XrayDashboard:
 
         out.append(f"{A.CYN}╠{'═' * W}╣{A.RST}")
 
-        # Check if we're testing multiple IPs (tag format: ip|sni|frag)
-        _multi_ip = any(v.tag.count("|") >= 2 for v in xst.variations[:3])
+        # Check if we're testing multiple IPs (tag format: ip|sni|frag).
+        # Tags share one format per run, so decide once variations exist.
+        mi = self._multi_ip
+        if mi is not None and mi[0] == id(xst.variations):
+            _multi_ip = mi[1]
+        else:
+            _multi_ip = any(v.tag.count("|") >= 2 for v in xst.variations[:3])
+            if xst.variations:
+                self._multi_ip = (id(xst.variations), _multi_ip)
         if _multi_ip:
-            hdr = (f" {A.BOLD}{'#':>3}  {'IP':<18} {'SNI':<20} {'Frag':>8}  "
-                   f"{'Conn':>6}  {'TTFB':>6}  {'Score':>5}{A.RST}")
-            bx(hdr)
-            bx(f" {A.DIM}{'─'*3}  {'─'*18} {'─'*20} {'─'*8}  {'─'*6}  {'─'*6}  {'─'*5}{A.RST}")
+            bx(self._HDR_MULTI)
+            bx(self._RULE_MULTI)
         else:
-            hdr = (f" {A.BOLD}{'#':>3}  {'SNI':<26} {'Fragment':>10}  "
-                   f"{'Conn':>6}  {'TTFB':>6}  {'Score':>5}{A.RST}")
-            bx(hdr)
-            bx(f" {A.DIM}{'─'*3}  {'─'*26} {'─'*10}  {'─'*6}  {'─'*6}  {'─'*5}{A.RST}")
-
-        sorted_vars = sorted(
-            xst.variations,
-            key=lambda v: (
-                -v.score if self.sort == "score"
-                else (v.connect_ms if v.connect_ms > 0 else 9999)
-            ),
-        )
+            bx(self._HDR_SINGLE)
+            bx(self._RULE_SINGLE)
+
+        # Results only land between these counters moving, so re-sort
+        # when one of them changes rather than on every refresh tick.
+        sig = (self.sort, id(xst.variations), len(xst.variations), xst.version,
+               xst.done_count, xst.alive_count, xst.dead_count, xst.phase,
+               xst.pipeline_stage, xst.finished)
+        if sig != self._sort_sig:
+            self._sorted = sorted(
+                xst.variations,
+                key=lambda v: (
+                    -v.score if self.sort == "score"
+                    else (v.connect_ms if v.connect_ms > 0 else 9999)
+                ),
+            )
+            self._sort_sig = sig
+        sorted_vars = self._sorted
 
         vis = max(3, rows - 18)
         page = sorted_vars[self.offset:self.offset + vis]
 
+        DIM, RED, RST = A.DIM, A.RED, A.RST
+        sc_hi, sc_mid, sc_lo, sc_none = self._SC_HI, self._SC_MID, self._SC_LO, self._SC_NONE
         for rank, v in enumerate(page, self.offset + 1):
             frag_s = "none" if v.fragment is None else v.fragment.get("length", "?")
             # Extract IP from tag if multi-IP mode
             if _multi_ip:
-                _parts = v.tag.split("|", 2)
-                _raw_ip = _parts[0] if len(_parts) >= 3 else ""
-                _ip_s = (_raw_ip[:16] + "..") if len(_raw_ip) > 18 else _raw_ip[:18]
                 sni_short = v.sni[:20]
-                _name_col = f"{_ip_s:<18} {sni_short:<20} {frag_s:>8}"
+                _name_col = f"{v.ip_label:<18} {sni_short:<20} {frag_s:>8}"
             else:
                 sni_short = v.sni[:26]
                 _name_col = f"{sni_short:<26} {frag_s:>10}"
             if not v.alive and v.error:
                 _err_s = v.error[:31] if v.error else "dead"
                 _pad = max(0, 31 - len(_err_s))
-                row = (f" {A.DIM}{rank:>3}  {_name_col}  "
-                       f"{A.RED}{_err_s}{A.RST}{A.DIM}{' '*_pad}{A.RST}")
+                row = (f" {DIM}{rank:>3}  {_name_col}  "
+                       f"{RED}{_err_s}{RST}{DIM}{' '*_pad}{RST}")
             elif not v.alive and not v.error and v.connect_ms <= 0 and v.score <= 0:
-                row = (f" {A.DIM}{rank:>3}  {_name_col}  "
-                       f"{'--':>6}  {'--':>6}  {'--':>5}{A.RST}")
+                row = (f" {DIM}{rank:>3}  {_name_col}  "
+                       f"{'--':>6}  {'--':>6}  {'--':>5}{RST}")
             else:
                 conn_s = f"{v.connect_ms:6.0f}" if v.connect_ms > 0 else f"{'--':>6}"
                 ttfb_s = f"{v.ttfb_ms:6.0f}" if v.ttfb_ms > 0 else f"{'--':>6}"
-                if v.score >= 70:
-                    sc_s = f"{A.GRN}{v.score:5.1f}{A.RST}"
-                elif v.score >= 40:
-                    sc_s = f"{A.YEL}{v.score:5.1f}{A.RST}"
-                elif v.score > 0:
-                    sc_s = f"{v.score:5.1f}"
+                sc = v.score
+                if sc >= 70:
+                    sc_s = sc_hi(sc)
+                elif sc >= 40:
+                    sc_s = sc_mid(sc)
+                elif sc > 0:
+                    sc_s = sc_lo(sc)
                 else:
-                    sc_s = f"{'--':>5}"
+                    sc_s = sc_none
                 row = (f" {rank:>3}  {_name_col}  "
                        f"{conn_s}  {ttfb_s}  {sc_s}")
             bx(row)
@@ -5501,23 +6288,31 @@ class XrayDashboard:
         out.append(f"{A.CYN}╠{'═' * W}╣{A.RST}")
         if xst.finished:
             if W >= 100:
-                footer = (f" {A.CYN}[S]{A.RST} Sort  {A.CYN}[E]{A.RST} Export  "
-                          f"{A.CYN}[C]{A.RST} View URI  "
-                          f"{A.CYN}[J/K]{A.RST} Scroll  {A.CYN}[N/P]{A.RST} Page  "
-                          f"{A.CYN}[B]{A.RST} Back  {A.CYN}[Q]{A.RST} Quit")
-                bx(footer)
+                bx(self._FOOT_WIDE)
             else:
-                bx(f" {A.CYN}[S]{A.RST}ort {A.CYN}[E]{A.RST}xp {A.CYN}[C]{A.RST}URI {A.CYN}[B]{A.RST}ack {A.CYN}[Q]{A.RST}uit")
-                bx(f" {A.CYN}[J/K]{A.RST} Scroll  {A.CYN}[N/P]{A.RST} Page")
+                bx(self._FOOT_NARROW)
+                bx(self._FOOT_SCROLL)
             if xst.export_error:
                 bx(f" {A.RED}{xst.export_error}{A.RST}")
         else:
             bx(f" {A.DIM}{xst.phase_label}  |  Press Ctrl+C to stop{A.RST}")
         out.append(f"{A.CYN}╚{'═' * W}╝{A.RST}")
 
-        _w(A.CLR + A.HIDE)
-        _w("\n".join(out) + "\n")
-        _fl()
+        prev = self._prev_lines
+        if not prev or self._prev_size != (cols, rows):
+            _wframe_lines(out, A.CLR + A.HIDE)
+        else:
+            # Repaint only the rows that changed since the last frame. The
+            # row is cleared *before* writing: a full-width row leaves the
+            # cursor in pending-wrap, where a trailing erase eats the border
+            buf = [f"\033[{i + 1};1H\033[2K{ln}"
+                   for i, ln in enumerate(out) if i >= len(prev) or prev[i] != ln]
+            if len(out) < len(prev):
+                buf.append(f"\033[{len(out) + 1};1H\033[J")
+            if buf:
+                _wframe("".join(buf))
+        self._prev_lines = out
+        self._prev_size = (cols, rows)
 
     def handle(self, key: str) -> Optional[str]:
         sorts = ["score", "latency"]
@@ -5526,17 +6321,17 @@ class XrayDashboard:
             self.sort = sorts[(idx + 1) % len(sorts)]
             self.offset = 0
         elif key in ("j", "down"):
-            _, rows = term_size()
+            _, rows = _cached_term_size()
             vis = max(3, rows - 18)
             self.offset = min(self.offset + 1, max(0, len(self.xst.variations) - vis))
         elif key in ("k", "up"):
             self.offset = max(0, self.offset - 1)
         elif key in ("n",):
-            _, rows = term_size()
+            _, rows = _cached_term_size()
             vis = max(3, rows - 18)
             self.offset = min(self.offset + vis, max(0, len(self.xst.variations) - vis))
         elif key in ("p",):
-            _, rows = term_size()
+            _, rows = _cached_term_size()
             vis = max(3, rows - 18)
             self.offset = max(0, self.offset - vis)
         elif key == "e" and self.xst.finished:
@@ -5550,40 +6345,42 @@ class XrayDashboard:
         return None
 
 
-def xray_save_results(xst: XrayTestState, top: int = 10) -> Tuple[str, str]:
-    """Save xray test results: CSV + top VLESS/VMess URIs. Returns (csv_path, uris_path)."""
+def xray_save_results(
+    xst: XrayTestState, top: int = 10,
+    sorted_vars: Optional[List[XrayVariation]] = None,
+) -> Tuple[str, str]:
+    """Save xray test results: CSV + top VLESS/VMess URIs. Returns (csv_path, uris_path).
+    Pass `sorted_vars` (alive variations, best first) to skip re-sorting."""
     os.makedirs(RESULTS_DIR, exist_ok=True)
     ts = time.strftime("%Y%m%d_%H%M%S")
 
-    sorted_vars = sorted(
-        [v for v in xst.variations if v.alive],
-        key=lambda v: v.score, reverse=True,
-    )
+    if sorted_vars is None:
+        sorted_vars = sorted(
+            [v for v in xst.variations if v.alive],
+            key=lambda v: v.score, reverse=True,
+        )
 
+    # Build each file in memory and write it once
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(["Rank", "Tag", "SNI", "Fragment", "Connect_ms", "TTFB_ms",
+                 "Speed_MBps", "Score", "Error", "URI"])
+    w.writerows([
+        rank, v.tag, v.sni, _json_encode(v.fragment) if v.fragment else "",
+        f"{v.connect_ms:.0f}" if v.connect_ms > 0 else "",
+        f"{v.ttfb_ms:.0f}" if v.ttfb_ms > 0 else "",
+        f"{v.speed_mbps:.3f}" if v.speed_mbps > 0 else "",
+        f"{v.score:.1f}", v.error, v.result_uri,
+    ] for rank, v in enumerate(sorted_vars, 1))
     csv_path = _results_path(f"xray_{ts}_results.csv")
     with open(csv_path, "w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        w.writerow(["Rank", "Tag", "SNI", "Fragment", "Connect_ms", "TTFB_ms",
-                     "Speed_MBps", "Score", "Error", "URI"])
-        for rank, v in enumerate(sorted_vars, 1):
-            frag_s = json.dumps(v.fragment) if v.fragment else ""
-            w.writerow([
-                rank, v.tag, v.sni, frag_s,
-                f"{v.connect_ms:.0f}" if v.connect_ms > 0 else "",
-                f"{v.ttfb_ms:.0f}" if v.ttfb_ms > 0 else "",
-                f"{v.speed_mbps:.3f}" if v.speed_mbps > 0 else "",
-                f"{v.score:.1f}", v.error, v.result_uri,
-            ])
+        f.write(buf.getvalue())
 
+    uris = itertools.islice((v.result_uri for v in sorted_vars if v.result_uri), top)
+    data = "".join(u + "\n" for u in uris).encode("utf-8")
     uri_path = _results_path(f"xray_{ts}_top{top}.txt")
-    with open(uri_path, "w", encoding="utf-8") as f:
-        count = 0
-        for v in sorted_vars:
-            if count >= top:
-                break
-            if v.result_uri:
-                f.write(v.result_uri + "\n")
-                count += 1
+    with open(uri_path, "wb", buffering=0) as f:  # single write: no buffer needed
+        f.write(data)
 
     return csv_path, uri_path
 
@@ -5598,39 +6395,36 @@ async def _run_pipeline_core(
     xdash = XrayDashboard(xst)
 
     async def _pipeline_refresh():
+        # Redraw when the pipeline reports progress; the timeout keeps the
+        # elapsed clock ticking through quiet stretches.
+        ev = xst.redraw_event = asyncio.Event()
         while not xst.finished:
             try:
                 xdash.draw()
             except (OSError, ValueError):
                 pass
-            await asyncio.sleep(0.3)
+            await asyncio.sleep(0.1)  # coalesce bursts of updates
+            try:
+                await asyncio.wait_for(ev.wait(), timeout=1.0)
+            except asyncio.TimeoutError:
+                pass
+            ev.clear()
 
-    _w(A.CLR + A.HOME + A.HIDE)
-    refresh_task = asyncio.create_task(_pipeline_refresh())
+    refresh_task = asyncio.create_task(_pipeline_refresh())  # first draw clears
     pipeline_task = asyncio.ensure_future(xray_pipeline_test(xst, pcfg))
 
-    old_sigint = signal.getsignal(signal.SIGINT)
-    _loop_pl = asyncio.get_running_loop()
-
-    def _sig(sig, frame):
-        xst.interrupted = True
-        xst.finished = True
-        _loop_pl.call_soon_threadsafe(pipeline_task.cancel)
-    signal.signal(signal.SIGINT, _sig)
-
-    try:
-        await pipeline_task
-    except (asyncio.CancelledError, KeyboardInterrupt):
-        xst.interrupted = True
-        xst.finished = True
-        _xray_calc_scores(xst)
-    except Exception as e:
-        _dbg(f"pipeline exception: {e}")
-        xst.interrupted = True
-        xst.finished = True
-        _xray_calc_scores(xst)
-    finally:
-        signal.signal(signal.SIGINT, old_sigint)
+    with _intercept_sigint(pipeline_task, xst):
+        try:
+            await pipeline_task
+        except (asyncio.CancelledError, KeyboardInterrupt):
+            xst.interrupted = True
+            xst.finished = True
+            _xray_calc_scores(xst)
+        except Exception as e:
+            _dbg(f"pipeline exception: {e}")
+            xst.interrupted = True
+            xst.finished = True
+            _xray_calc_scores(xst)
 
     refresh_task.cancel()
     try:
@@ -5647,11 +6441,16 @@ async def _post_pipeline_results(
     """Post-test results: auto-export, interactive loop (export, view)."""
     top_n = getattr(args, "xray_keep", 10)
     csv_p = uri_p = ""
+    # Variations are final once the pipeline is done: rank the alive ones once
+    alive = sorted(
+        [v for v in xst.variations if v.alive],
+        key=lambda v: v.score, reverse=True,
+    )
 
     # Auto-export alive results
-    if any(v.alive for v in xst.variations):
+    if alive:
         try:
-            csv_p, uri_p = xray_save_results(xst, top=top_n)
+            csv_p, uri_p = xray_save_results(xst, top=top_n, sorted_vars=alive)
         except Exception as e:
             csv_p = uri_p = ""
             xst.export_error = f"Export failed: {e}"
@@ -5662,26 +6461,23 @@ async def _post_pipeline_results(
         send_webhook_alert(args.notify, xst)
 
     # -- Post-scan interactive loop --
+    # Nothing changes on screen without input here, so block on the next
+    # key instead of polling.
     try:
         while True:
-            key = _read_key_nb(0.1)
-            if key is None:
+            key = _read_key_blocking()
+            if not key:
                 continue
             act = xdash.handle(key)
             if act in ("quit", "back"):
                 break
             elif act == "export":
                 try:
-                    csv_p, uri_p = xray_save_results(xst, top=top_n)
-                    _n_alive = sum(1 for v in xst.variations if v.alive)
-                    xst.export_error = f"Exported {_n_alive} configs -> {uri_p}"
+                    csv_p, uri_p = xray_save_results(xst, top=top_n, sorted_vars=alive)
+                    xst.export_error = f"Exported {len(alive)} configs -> {uri_p}"
                 except Exception as e:
                     xst.export_error = f"Export failed: {e}"
             elif act == "view_uri":
-                alive = sorted(
-                    [v for v in xst.variations if v.alive],
-                    key=lambda v: v.score, reverse=True,
-                )
                 if alive and alive[0].result_uri:
                     while True:
                         _w(A.CLR + A.HOME + A.SHOW)
@@ -5727,6 +6523,7 @@ async def _post_pipeline_results(
                         _fl()
                         _read_key_blocking()
                     _w(A.HIDE)
+                    xdash.invalidate()
                 else:
                     xst.export_error = "No alive configs to view"
             xdash.draw()
@@ -5735,6 +6532,25 @@ async def _post_pipeline_results(
     _w(A.SHOW)
 
 
+_PIPE_PORT_MENU = (
+    f"  {A.CYN}2{A.RST}. All CF HTTPS ports (443, 8443, 2053, 2083, 2087, 2096)\n"
+    f"  {A.CYN}3{A.RST}. Custom ports\n"
+    f" Choice [1]: "
+)
+_PIPE_INTENSITY_MENU = (
+    f"\n {A.BOLD}Step 5:{A.RST} {A.CYN}Test intensity:{A.RST}\n"
+    f" {A.DIM}How many IP x fragment combinations to test in expansion.{A.RST}\n"
+    f" {A.DIM}More = better coverage but takes longer.{A.RST}\n\n"
+    f"  {A.CYN}1{A.RST}. {A.WHT}Quick{A.RST}      500 variations   {A.DIM}~2-3 min{A.RST}\n"
+    f"  {A.CYN}2{A.RST}. {A.WHT}Normal{A.RST}    1,500 variations   {A.DIM}~5-8 min{A.RST} {A.GRN}(recommended){A.RST}\n"
+    f"  {A.CYN}3{A.RST}. {A.WHT}Thorough{A.RST}  3,000 variations   {A.DIM}~10-15 min{A.RST}\n"
+    f"  {A.CYN}4{A.RST}. {A.WHT}Maximum{A.RST}   7,500 variations   {A.DIM}~25-40 min{A.RST}\n"
+    f"\n Choice [2]: "
+)
+_PIPE_FRAG_MAP = {"1": "all", "2": "none", "3": "light", "4": "heavy"}
+_PIPE_INTENSITY_MAP = {"1": 500, "2": 1500, "3": 3000, "4": 7500}
+
+
 def tui_pipeline_input(configless: bool = False) -> Optional[PipelineConfig]:
     """Unified input wizard for the progressive xray pipeline.
 
@@ -5759,8 +6575,8 @@ def tui_pipeline_input(configless: bool = False) -> Optional[PipelineConfig]:
         return None
     parsed = parse_vless_full(uri) or parse_vmess_full(uri)
     if not parsed:
-        _w(f" {A.RED}Invalid VLESS/VMess URI.{A.RST}\n"); _fl()
-        time.sleep(1.5); return None
+        _flash_error("Invalid VLESS/VMess URI.", 1.5)
+        return None
 
     _proto = parsed.get("protocol", "vless")
     _net = parsed.get("type") or parsed.get("net") or "tcp"
@@ -5818,8 +6634,7 @@ def tui_pipeline_input(configless: bool = False) -> Optional[PipelineConfig]:
         frag_ch = input().strip() or "1"
     except (EOFError, KeyboardInterrupt, OSError):
         return None
-    frag_map = {"1": "all", "2": "none", "3": "light", "4": "heavy"}
-    frag_preset = frag_map.get(frag_ch, "all")
+    frag_preset = _PIPE_FRAG_MAP.get(frag_ch, "all")
 
     # Transport: locked to original -- server/tunnel only supports what it's configured for
     transport_variants = []
@@ -5830,13 +6645,14 @@ def tui_pipeline_input(configless: bool = False) -> Optional[PipelineConfig]:
     _w(f"  {A.CYN}1{A.RST}. Random CF IPs ({len(CF_TEST_IPS)} IPs across all ranges) {A.GRN}(recommended){A.RST}\n")
     # Check if clean_ips.txt exists from Clean IP Finder
     _clean_ip_path = os.path.join(RESULTS_DIR, "clean_ips.txt")
-    _clean_count = 0
+    _clean_lines: List[str] = []
     if os.path.isfile(_clean_ip_path):
         try:
-            with open(_clean_ip_path, "r") as _cf:
-                _clean_count = sum(1 for l in _cf if l.strip() and not l.startswith("#"))
+            with open(_clean_ip_path, "r", buffering=1 << 16) as _cf:
+                _clean_lines = _ip_file_entries(_cf.read())
         except OSError:
             pass
+    _clean_count = len(_clean_lines)
     if _clean_count > 0:
         _w(f"  {A.CYN}2{A.RST}. Clean IP Finder results ({_clean_count} IPs from {_clean_ip_path})\n")
     else:
@@ -5850,19 +6666,19 @@ def tui_pipeline_input(configless: bool = False) -> Optional[PipelineConfig]:
     except (EOFError, KeyboardInterrupt, OSError):
         return None
 
-    custom_ips: List[str] = []
+    custom_ips: Optional[CidrSet] = None
     if ip_ch == "2":
         if _clean_count > 0:
-            custom_ips = expand_custom_ips(_clean_ip_path)
+            custom_ips = expand_custom_ips_from_list(_clean_lines)
             if custom_ips:
-                _w(f" {A.GRN}Loaded {len(custom_ips)} IPs from clean_ips.txt{A.RST}\n")
+                _w(f" {A.GRN}Loaded {_custom_ips_label(custom_ips)} from clean_ips.txt{A.RST}\n")
                 _fl()
             else:
-                _w(f" {A.RED}Failed to read clean_ips.txt{A.RST}\n"); _fl()
-                time.sleep(1); return None
+                _flash_error("Failed to read clean_ips.txt")
+                return None
         else:
-            _w(f" {A.RED}No clean IPs found. Run Clean IP Finder [f] from the main menu first.{A.RST}\n")
-            _fl(); time.sleep(2); return None
+            _flash_error("No clean IPs found. Run Clean IP Finder [f] from the main menu first.", 2)
+            return None
     elif ip_ch == "3":
         _w(f" {A.CYN}Enter file path:{A.RST}\n ")
         _w(f" {A.DIM}e.g. results/clean_ips.txt or /path/to/ips.txt{A.RST}\n ")
@@ -5874,13 +6690,13 @@ def tui_pipeline_input(configless: bool = False) -> Optional[PipelineConfig]:
         if raw_ips:
             custom_ips = expand_custom_ips(raw_ips)
             if not custom_ips:
-                _w(f" {A.RED}No valid IPs found in file.{A.RST}\n"); _fl()
-                time.sleep(1); return None
-            _w(f" {A.GRN}Loaded {len(custom_ips)} IPs{A.RST}\n")
+                _flash_error("No valid IPs found in file.")
+                return None
+            _w(f" {A.GRN}Loaded {_custom_ips_label(custom_ips)}{A.RST}\n")
             _fl()
         else:
-            _w(f" {A.RED}No path entered.{A.RST}\n"); _fl()
-            time.sleep(1); return None
+            _flash_error("No path entered.")
+            return None
     elif ip_ch == "4":
         _w(f" {A.CYN}Enter IPs, CIDRs (comma-separated):{A.RST}\n ")
         _w(f" {A.DIM}e.g. 104.16.0.0/24, 172.67.1.1{A.RST}\n ")
@@ -5892,21 +6708,20 @@ def tui_pipeline_input(configless: bool = False) -> Optional[PipelineConfig]:
         if raw_ips:
             custom_ips = expand_custom_ips(raw_ips)
             if not custom_ips:
-                _w(f" {A.RED}No valid IPs found.{A.RST}\n"); _fl()
-                time.sleep(1); return None
-            _w(f" {A.GRN}Expanded to {len(custom_ips)} IPs{A.RST}\n")
+                _flash_error("No valid IPs found.")
+                return None
+            _w(f" {A.GRN}Expanded to {_custom_ips_label(custom_ips)}{A.RST}\n")
             _fl()
         else:
-            _w(f" {A.RED}No IPs entered.{A.RST}\n"); _fl()
-            time.sleep(1); return None
+            _flash_error("No IPs entered.")
+            return None
 
     # Step 4: Ports to scan
     _orig_port = int(parsed.get("port", 443))
-    _w(f"\n {A.BOLD}Step 4:{A.RST} {A.CYN}Ports to scan per IP:{A.RST}\n")
-    _w(f"  {A.CYN}1{A.RST}. Original port ({_orig_port}) only {A.GRN}(recommended){A.RST}\n")
-    _w(f"  {A.CYN}2{A.RST}. All CF HTTPS ports (443, 8443, 2053, 2083, 2087, 2096)\n")
-    _w(f"  {A.CYN}3{A.RST}. Custom ports\n")
-    _w(f" Choice [1]: ")
+    _w("".join((
+        f"\n {A.BOLD}Step 4:{A.RST} {A.CYN}Ports to scan per IP:{A.RST}\n",
+        f"  {A.CYN}1{A.RST}. Original port ({_orig_port}) only {A.GRN}(recommended){A.RST}\n",
+        _PIPE_PORT_MENU)))
     _fl()
     try:
         port_ch = input().strip() or "1"
@@ -5924,11 +6739,8 @@ def tui_pipeline_input(configless: bool = False) -> Optional[PipelineConfig]:
             raw_ports = input().strip()
         except (EOFError, KeyboardInterrupt, OSError):
             return None
-        probe_ports = []
-        for p in raw_ports.split(","):
-            p = p.strip()
-            if p.isdigit() and 1 <= int(p) <= 65535:
-                probe_ports.append(int(p))
+        probe_ports = [n for n in (int(p) for p in map(str.strip, raw_ports.split(","))
+                                   if p.isdigit()) if 1 <= n <= 65535]
         if not probe_ports:
             _w(f" {A.RED}No valid ports. Using {_orig_port}.{A.RST}\n"); _fl()
             probe_ports = [_orig_port]
@@ -5936,23 +6748,13 @@ def tui_pipeline_input(configless: bool = False) -> Optional[PipelineConfig]:
         probe_ports = [_orig_port]
 
     # Step 5: Test intensity (max variations in expansion)
-    _n_frags = len(XRAY_FRAG_PRESETS.get(frag_preset, XRAY_FRAG_PRESETS.get("all", [])))
-    _potential = 120 * max(1, _n_frags)
-    _w(f"\n {A.BOLD}Step 5:{A.RST} {A.CYN}Test intensity:{A.RST}\n")
-    _w(f" {A.DIM}How many IP x fragment combinations to test in expansion.{A.RST}\n")
-    _w(f" {A.DIM}More = better coverage but takes longer.{A.RST}\n\n")
-    _w(f"  {A.CYN}1{A.RST}. {A.WHT}Quick{A.RST}      500 variations   {A.DIM}~2-3 min{A.RST}\n")
-    _w(f"  {A.CYN}2{A.RST}. {A.WHT}Normal{A.RST}    1,500 variations   {A.DIM}~5-8 min{A.RST} {A.GRN}(recommended){A.RST}\n")
-    _w(f"  {A.CYN}3{A.RST}. {A.WHT}Thorough{A.RST}  3,000 variations   {A.DIM}~10-15 min{A.RST}\n")
-    _w(f"  {A.CYN}4{A.RST}. {A.WHT}Maximum{A.RST}   7,500 variations   {A.DIM}~25-40 min{A.RST}\n")
-    _w(f"\n Choice [2]: ")
+    _w(_PIPE_INTENSITY_MENU)
     _fl()
     try:
         _int_ch = input().strip() or "2"
     except (EOFError, KeyboardInterrupt, OSError):
         return None
-    _int_map = {"1": 500, "2": 1500, "3": 3000, "4": 7500}
-    max_expansion = _int_map.get(_int_ch, 1500)
+    max_expansion = _PIPE_INTENSITY_MAP.get(_int_ch, 1500)
     _w(f" {A.GRN}-> Up to {max_expansion:,} variations{A.RST}\n")
 
     return PipelineConfig(
@@ -5974,7 +6776,7 @@ async def _tui_run_pipeline(args, cli_uri: str = ""):
         parsed = parse_vless_full(cli_uri) or parse_vmess_full(cli_uri)
         if not parsed:
             _w(A.SHOW)
-            print(f"  Invalid VLESS/VMess URI: {cli_uri[:60]}...")
+            print(f"  Invalid VLESS/VMess URI: {cli_uri[:60]}...", flush=True)
             time.sleep(2)
             return
         # Block non-CF, non-REALITY configs
@@ -5992,7 +6794,7 @@ async def _tui_run_pipeline(args, cli_uri: str = ""):
         # No SNI rotation -- CF zone matching blocks cross-zone SNIs.
         sni_pool = []
         if getattr(args, "xray_sni", None):
-            sni_pool = [s.strip() for s in args.xray_sni.split(",") if s.strip()]
+            sni_pool = list(filter(None, map(str.strip, args.xray_sni.split(","))))
         frag_preset = getattr(args, "xray_frag", "all")
         # REALITY: no frag/transport expansion
         if _sec == "reality":
@@ -6051,24 +6853,71 @@ def deploy_check_prerequisites() -> Tuple[bool, str]:
     return True, ""
 
 
+_IP_ECHO_URLS = ("https://ifconfig.me/ip", "https://api.ipify.org", "https://icanhazip.com")
+
+
+def _fetch_ip(url: str) -> str:
+    """Ask one IP-echo service for our address; "" on any failure."""
+    try:
+        req = urllib.request.Request(url, headers={"User-Agent": "curl/7.0"})
+        with urllib.request.urlopen(req, timeout=5) as resp:
+            ip = resp.read(1024).decode().strip()
+        ipaddress.ip_address(ip)
+        return ip
+    except (OSError, ValueError, http.client.HTTPException):
+        return ""
+
+
 def deploy_detect_server_ip() -> str:
-    """Detect server's public IP by querying external services."""
-    for url in ("https://ifconfig.me/ip", "https://api.ipify.org", "https://icanhazip.com"):
-        try:
-            req = urllib.request.Request(url, headers={"User-Agent": "curl/7.0"})
-            with urllib.request.urlopen(req, timeout=5) as resp:
-                ip = resp.read(1024).decode().strip()
-                if ip:
-                    try:
-                        ipaddress.ip_address(ip)
-                        return ip
-                    except ValueError:
-                        continue
-        except (OSError, ValueError, http.client.HTTPException):
-            continue
+    """Detect server's public IP by querying external services.
+
+    All services are asked at once and the first valid answer wins, so a
+    slow or dead endpoint no longer adds its full timeout.
+    """
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=len(_IP_ECHO_URLS))
+    futs = [pool.submit(_fetch_ip, url) for url in _IP_ECHO_URLS]
+    try:
+        for fut in concurrent.futures.as_completed(futs, timeout=6):
+            ip = fut.result()
+            if ip:
+                return ip
+    except concurrent.futures.TimeoutError:
+        pass
+    finally:
+        for fut in futs:
+            fut.cancel()
+        pool.shutdown(wait=False)
     return ""
 
 
+_SERVER_IP_TTL = 60.0
+_SERVER_IP_CACHE = [0.0, ""]  # [monotonic time of detection, detected IP]
+
+
+def _cached_server_ip(ttl: float = _SERVER_IP_TTL) -> str:
+    """deploy_detect_server_ip() remembered for `ttl` seconds. A failed
+    lookup is not cached, so the next call tries again."""
+    now = time.monotonic()
+    if _SERVER_IP_CACHE[1] and now - _SERVER_IP_CACHE[0] < ttl:
+        return _SERVER_IP_CACHE[1]
+    ip = deploy_detect_server_ip()
+    if ip:
+        _SERVER_IP_CACHE[0] = time.monotonic()
+        _SERVER_IP_CACHE[1] = ip
+    return ip
+
+
+def _parse_port(value, default: int = 443) -> int:
+    """`value` as a TCP port (str or int), or `default` if it isn't one.
+    Checks digits first so bad input never goes through int()'s exception."""
+    s = str(value).strip()
+    if s.isascii() and s.isdigit():
+        port = int(s)
+        if 1 <= port <= 65535:
+            return port
+    return default
+
+
 def deploy_check_port(port: int) -> bool:
     """Check if a TCP port is free."""
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -6087,6 +6936,68 @@ def deploy_generate_uuid() -> str:
     return str(_uuid_mod.uuid4())
 
 
+# `xray x25519` output labels -> which key they carry. Newer xray prints
+# "Password" for the public key; an explicit public key label wins over it.
+_X25519_LABELS = {
+    "private key": "priv", "privatekey": "priv",
+    "public key": "pub", "publickey": "pub",
+    "password": "pwd",
+}
+
+
+def _parse_x25519_output(text: str) -> Tuple[str, str]:
+    """(private, public) keys from `xray x25519` output, either format."""
+    keys: Dict[str, str] = {}
+    for line in text.splitlines():
+        label, sep, val = line.partition(":")
+        kind = _X25519_LABELS.get(label.strip().lower()) if sep else None
+        if kind:
+            keys[kind] = val.strip()
+    return keys.get("priv", ""), keys.get("pub") or keys.get("pwd", "")
+
+
+def _x25519_base(k: bytes) -> bytes:
+    """RFC 7748 X25519 scalar multiplication of the base point (u = 9)."""
+    p = 2 ** 255 - 19
+    k_int = int.from_bytes(k, "little")
+    k_int = (k_int & ~7 & ((1 << 255) - 1)) | (1 << 254)  # clamp
+    x1 = 9
+    x2, z2, x3, z3 = 1, 0, x1, 1
+    swap = 0
+    for t in range(254, -1, -1):
+        bit = (k_int >> t) & 1
+        if swap ^ bit:
+            x2, x3, z2, z3 = x3, x2, z3, z2
+        swap = bit
+        a = x2 + z2
+        aa = a * a % p
+        b = x2 - z2
+        bb = b * b % p
+        e = aa - bb
+        da = (x3 - z3) * a % p
+        cb = (x3 + z3) * b % p
+        x3 = (da + cb) ** 2 % p
+        z3 = x1 * (da - cb) ** 2 % p
+        x2 = aa * bb % p
+        z2 = e * (aa + 121665 * e) % p
+    if swap:
+        x2, z2 = x3, z3
+    return (x2 * pow(z2, p - 2, p) % p).to_bytes(32, "little")
+
+
+@functools.lru_cache(maxsize=64)
+def _x25519_public_key(private_key: str) -> str:
+    """REALITY public key for an xray private key (unpadded urlsafe base64),
+    derived in-process instead of forking `xray x25519 -i`. "" if invalid."""
+    try:
+        raw = base64.urlsafe_b64decode(private_key + "=" * (-len(private_key) % 4))
+    except (ValueError, TypeError):
+        return ""
+    if len(raw) != 32:
+        return ""
+    return base64.urlsafe_b64encode(_x25519_base(raw)).rstrip(b"=").decode()
+
+
 def deploy_generate_reality_keys(xray_bin: str) -> Tuple[str, str]:
     """Generate x25519 key pair using xray binary. Returns (private, public).
 
@@ -6104,19 +7015,7 @@ def deploy_generate_reality_keys(xray_bin: str) -> Tuple[str, str]:
         )
         if result.returncode != 0:
             return "", ""
-        private_key = ""
-        public_key = ""
-        for line in result.stdout.strip().splitlines():
-            line = line.strip()
-            low = line.lower()
-            if low.startswith("private key:") or low.startswith("privatekey:"):
-                private_key = line.split(":", 1)[1].strip()
-            elif low.startswith("public key:") or low.startswith("publickey:"):
-                public_key = line.split(":", 1)[1].strip()
-            elif low.startswith("password:"):
-                # New xray format: "Password" is the public key
-                public_key = line.split(":", 1)[1].strip()
-        return private_key, public_key
+        return _parse_x25519_output(result.stdout)
     except (OSError, subprocess.SubprocessError, ValueError):
         return "", ""
 
@@ -6144,7 +7043,7 @@ def _build_single_inbound(parsed: dict, ds: "DeployState", index: int) -> dict:
         "protocol": protocol,
         "settings": {},
         "streamSettings": {},
-        "sniffing": {"enabled": True, "destOverride": ["http", "tls", "quic"]},
+        "sniffing": {"enabled": True, "destOverride": _SNIFFING_DEST_OVERRIDE},
     }
 
     # -- Settings (clients) --
@@ -6225,16 +7124,7 @@ def _build_single_inbound(parsed: dict, ds: "DeployState", index: int) -> dict:
     elif net == "tcp":
         htype = parsed.get("headerType", "")
         if htype == "http":
-            stream["tcpSettings"] = {
-                "header": {
-                    "type": "http",
-                    "response": {
-                        "version": "1.1",
-                        "status": "200",
-                        "reason": "OK",
-                    },
-                },
-            }
+            stream["tcpSettings"] = _TCP_HTTP_HEADER
 
     inbound["streamSettings"] = stream
     return inbound
@@ -6245,16 +7135,8 @@ def build_server_config(ds: "DeployState") -> dict:
     config = {
         "log": {"loglevel": "warning"},
         "inbounds": [],
-        "outbounds": [
-            {"tag": "direct", "protocol": "freedom"},
-            {"tag": "block", "protocol": "blackhole"},
-        ],
-        "routing": {
-            "domainStrategy": "AsIs",
-            "rules": [
-                {"type": "field", "ip": ["geoip:private"], "outboundTag": "block"},
-            ],
-        },
+        "outbounds": _SERVER_OUTBOUNDS,
+        "routing": _SERVER_ROUTING,
     }
 
     for i, parsed in enumerate(ds.parsed_configs):
@@ -6267,12 +7149,11 @@ def build_server_config(ds: "DeployState") -> dict:
 
 def build_client_uri_for_server(parsed: dict, ds: "DeployState", tag: str, index: int = 0) -> str:
     """Build a client URI pointing to the deployed server."""
-    p = copy.copy(parsed)
-    p["address"] = ds.server_ip
     try:
-        p["port"] = int(ds.listen_port if index == 0 else parsed.get("port", 443))
+        port = int(ds.listen_port if index == 0 else parsed.get("port", 443))
     except (ValueError, TypeError):
-        p["port"] = 443
+        port = 443
+    p = {**parsed, "address": ds.server_ip, "port": port}
     if p.get("security") == "reality" and ds.reality_public_key:
         p["pbk"] = ds.reality_public_key
     if p.get("security") == "reality" and ds.reality_short_id:
@@ -6282,6 +7163,9 @@ def build_client_uri_for_server(parsed: dict, ds: "DeployState", tag: str, index
     return _build_uri(p, sni, tag)
 
 
+_VMESS_DEFAULTS = {"aid": 0, "scy": "auto"}
+
+
 def deploy_fresh_config(
     protocol: str, transport: str, security: str,
     port: int, uuid_val: str, sni: str, ds: "DeployState",
@@ -6308,10 +7192,8 @@ def deploy_fresh_config(
         "pbk": ds.reality_public_key if security == "reality" else "",
         "sid": ds.reality_short_id if security == "reality" else "",
         "spx": "",
+        **(_VMESS_DEFAULTS if protocol == "vmess" else {}),
     }
-    if protocol == "vmess":
-        parsed["aid"] = 0
-        parsed["scy"] = "auto"
     return parsed
 
 
@@ -6323,39 +7205,34 @@ def generate_configless_base(
     Creates ws/tls and xhttp/tls variants (plus vmess/ws/tls if vmess protocol).
     Returns list of (uri_string, parsed_dict) tuples.
     """
-    results: List[Tuple[str, dict]] = []
     default_sni = "speed.cloudflare.com"
+    extra = _VMESS_DEFAULTS if protocol == "vmess" else {}
 
-    transports = ["ws", "xhttp"]
-    for transport in transports:
-        path = "/ws" if transport == "ws" else "/xhttp"
-        parsed = {
-            "protocol": protocol,
-            "uuid": uuid_val,
-            "address": server,
-            "port": port,
-            "name": f"cfray-{protocol}-{transport}",
-            "type": transport,
-            "security": "tls",
-            "sni": default_sni,
-            "host": default_sni,
-            "path": path,
-            "fp": "chrome",
-            "flow": "",
-            "alpn": "h2,http/1.1",
-            "encryption": "none",
-            "serviceName": "",
-            "headerType": "",
-            "pbk": "",
-            "sid": "",
-            "spx": "",
-            "mode": "auto" if transport == "xhttp" else "",
-        }
-        if protocol == "vmess":
-            parsed["aid"] = 0
-            parsed["scy"] = "auto"
-        uri = _build_uri(parsed, default_sni, parsed["name"])
-        results.append((uri, parsed))
+    bases = [{
+        "protocol": protocol,
+        "uuid": uuid_val,
+        "address": server,
+        "port": port,
+        "name": f"cfray-{protocol}-{transport}",
+        "type": transport,
+        "security": "tls",
+        "sni": default_sni,
+        "host": default_sni,
+        "path": "/ws" if transport == "ws" else "/xhttp",
+        "fp": "chrome",
+        "flow": "",
+        "alpn": "h2,http/1.1",
+        "encryption": "none",
+        "serviceName": "",
+        "headerType": "",
+        "pbk": "",
+        "sid": "",
+        "spx": "",
+        "mode": "auto" if transport == "xhttp" else "",
+        **extra,
+    } for transport in ("ws", "xhttp")]
+    results: List[Tuple[str, dict]] = [
+        (_build_uri(parsed, default_sni, parsed["name"]), parsed) for parsed in bases]
 
     # If VMess, also add a VLESS ws/tls variant for broader testing
     if protocol == "vmess":
@@ -6378,6 +7255,57 @@ def generate_configless_base(
 # ─── Xray Server Deploy — Pipeline Functions ─────────────────────────────
 
 
+def _fast_copy(src: str, dst: str):
+    """Copy file contents kernel-side with os.sendfile, keeping only the
+    permission bits; falls back to shutil.copy2 where sendfile can't
+    target a regular file (non-Linux)."""
+    try:
+        in_fd = os.open(src, os.O_RDONLY | getattr(os, "O_CLOEXEC", 0))
+    except OSError:
+        shutil.copy2(src, dst)
+        return
+    try:
+        st = os.fstat(in_fd)
+        size = st.st_size
+        out_fd = os.open(dst, _CONFIG_OPEN_FLAGS, st.st_mode & 0o777)
+        try:
+            offset = 0
+            while offset < size:
+                sent = os.sendfile(out_fd, in_fd, offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+        except (OSError, AttributeError):
+            os.close(out_fd)
+            out_fd = -1
+            shutil.copy2(src, dst)
+        finally:
+            if out_fd >= 0:
+                os.close(out_fd)
+    finally:
+        os.close(in_fd)
+
+
+def _install_copy(src: str, dst: str):
+    """Copy src to a temp file beside dst, then os.replace() it into place.
+    dst always gets its own inode: a hard link would tie the system binary
+    to ~/.cfray/bin, so a later --xray-install would rewrite it in place
+    (or fail with ETXTBSY while the service runs). The rename also swaps a
+    running binary atomically instead of truncating it."""
+    if os.path.realpath(src) == os.path.realpath(dst):
+        return
+    tmp = f"{dst}.tmp{os.getpid()}"
+    try:
+        _fast_copy(src, tmp)
+        os.replace(tmp, dst)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
 def deploy_install_xray_system() -> Tuple[bool, str]:
     """Install xray to /usr/local/bin/ with geo files. Returns (ok, message)."""
     if os.path.isfile(DEPLOY_XRAY_BIN):
@@ -6398,7 +7326,7 @@ def deploy_install_xray_system() -> Tuple[bool, str]:
 
     try:
         os.makedirs(os.path.dirname(DEPLOY_XRAY_BIN), exist_ok=True)
-        shutil.copy2(local_bin, DEPLOY_XRAY_BIN)
+        _install_copy(local_bin, DEPLOY_XRAY_BIN)
         os.chmod(DEPLOY_XRAY_BIN, 0o755)
     except OSError as e:
         return False, f"Failed to install to {DEPLOY_XRAY_BIN}: {e}"
@@ -6408,7 +7336,7 @@ def deploy_install_xray_system() -> Tuple[bool, str]:
         for gf in ("geoip.dat", "geosite.dat"):
             src = os.path.join(XRAY_BIN_DIR, gf)
             if os.path.isfile(src):
-                shutil.copy2(src, os.path.join(DEPLOY_XRAY_SHARE, gf))
+                _install_copy(src, os.path.join(DEPLOY_XRAY_SHARE, gf))
     except OSError:
         pass  # geo files are optional
 
@@ -6425,13 +7353,14 @@ def deploy_write_config(ds: "DeployState") -> Tuple[bool, str]:
             backup = os.path.join(DEPLOY_XRAY_BACKUP_DIR, f"config_{ts}.json")
             shutil.copy2(DEPLOY_XRAY_CONFIG, backup)
 
-        config_str = json.dumps(ds.server_config, indent=2, ensure_ascii=False)
         tmp_path = DEPLOY_XRAY_CONFIG + ".tmp"
-        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        fd = os.open(tmp_path, _CONFIG_OPEN_FLAGS, 0o600)
         try:
-            with os.fdopen(fd, "w", encoding="utf-8") as f:
-                f.write(config_str + "\n")
+            with os.fdopen(fd, "w", buffering=_CONFIG_WRITE_BUF, encoding="utf-8") as f:
+                json.dump(ds.server_config, f, indent=2, ensure_ascii=False)
+                f.write("\n")
             os.replace(tmp_path, DEPLOY_XRAY_CONFIG)
+            ds.server_config_file = DEPLOY_XRAY_CONFIG
         except BaseException:
             try:
                 os.remove(tmp_path)
@@ -6443,14 +7372,77 @@ def deploy_write_config(ds: "DeployState") -> Tuple[bool, str]:
         return False, f"Failed to write config: {e}"
 
 
+_VALIDATED_SIDECAR = DEPLOY_XRAY_CONFIG + ".sha256"
+
+
+def _config_cert_paths(node) -> Iterator[str]:
+    """Every certificateFile/keyFile path referenced anywhere in a config."""
+    if isinstance(node, dict):
+        for k, v in node.items():
+            if k in ("certificateFile", "keyFile") and isinstance(v, str):
+                yield v
+            else:
+                yield from _config_cert_paths(v)
+    elif isinstance(node, list):
+        for v in node:
+            yield from _config_cert_paths(v)
+
+
+def _validated_digest() -> str:
+    """SHA-256 over everything an `xray run -test` verdict depends on: the
+    on-disk config, plus size/mtime of the xray binary, the geoip/geosite
+    data and every TLS cert/key file the config references."""
+    h = hashlib.sha256()
+    try:
+        with open(DEPLOY_XRAY_CONFIG, "rb") as f:
+            raw = f.read()
+        st = os.stat(DEPLOY_XRAY_BIN)
+    except OSError:
+        return ""
+    h.update(raw)
+    h.update(f"\0{st.st_size}:{st.st_mtime_ns}".encode())
+    try:
+        certs = sorted(set(_config_cert_paths(json.loads(raw))))
+    except ValueError:
+        certs = []
+    deps = [os.path.join(DEPLOY_XRAY_SHARE, gf) for gf in ("geoip.dat", "geosite.dat")]
+    for path in deps + certs:
+        try:
+            st = os.stat(path)
+            stamp = f"{st.st_size}:{st.st_mtime_ns}"
+        except OSError:
+            stamp = "-"  # missing now; appearing later changes the digest too
+        h.update(f"\0{path}\0{stamp}".encode("utf-8", "surrogateescape"))
+    return h.hexdigest()
+
+
 def deploy_validate_config() -> Tuple[bool, str]:
-    """Run xray to validate the config file."""
+    """Run xray to validate the config file.
+
+    Skipped when the config, binary, geo data and cert/key files are
+    unchanged since the last successful validation (recorded in a .sha256
+    sidecar).
+    """
+    digest = _validated_digest()
+    if digest:
+        try:
+            with open(_VALIDATED_SIDECAR, "r", encoding="ascii") as f:
+                if f.read().strip() == digest:
+                    return True, "Config unchanged since last validation"
+        except (OSError, ValueError):
+            pass
     try:
         result = subprocess.run(
             [DEPLOY_XRAY_BIN, "run", "-test", "-c", DEPLOY_XRAY_CONFIG],
             capture_output=True, text=True, timeout=10,
         )
         if result.returncode == 0:
+            if digest:
+                try:
+                    with open(_VALIDATED_SIDECAR, "w", encoding="ascii") as f:
+                        f.write(digest + "\n")
+                except OSError:
+                    pass
             return True, "Config validated OK"
         err_msg = (result.stderr or result.stdout).strip()[:200]
         return False, f"Config validation failed: {err_msg}"
@@ -6460,17 +7452,32 @@ def deploy_validate_config() -> Tuple[bool, str]:
         return False, f"Validation error: {e}"
 
 
+_WHICH_CACHE: Dict[str, Tuple[Optional[str], float]] = {}
+_WHICH_TTL = 60.0
+
+
+def _which_cached(name: str) -> Optional[str]:
+    """shutil.which() remembered for _WHICH_TTL seconds."""
+    now = time.monotonic()
+    hit = _WHICH_CACHE.get(name)
+    if hit is not None and now - hit[1] < _WHICH_TTL:
+        return hit[0]
+    path = shutil.which(name)
+    _WHICH_CACHE[name] = (path, now)
+    return path
+
+
 def deploy_setup_certbot(domain: str) -> Tuple[bool, str, str]:
     """Try to obtain TLS cert via certbot. Returns (ok, cert_path, key_path)."""
     if not domain:
         return False, "", ""
     # Validate domain: must look like a hostname (no flags, no special chars)
-    if not re.match(r'^[a-zA-Z0-9]([a-zA-Z0-9._-]{0,253}[a-zA-Z0-9])?$', domain):
+    if not _DOMAIN_RE.match(domain):
         return False, "", ""
     # Certbot standalone needs port 80
     if not deploy_check_port(80):
         return False, "", ""
-    certbot = shutil.which("certbot")
+    certbot = _which_cached("certbot")
     if not certbot:
         for cmd in (
             ["apt-get", "install", "-y", "certbot"],
@@ -6480,7 +7487,8 @@ def deploy_setup_certbot(domain: str) -> Tuple[bool, str, str]:
             try:
                 result = subprocess.run(cmd, capture_output=True, timeout=120)
                 if result.returncode == 0:
-                    certbot = shutil.which("certbot")
+                    _WHICH_CACHE.pop("certbot", None)
+                    certbot = _which_cached("certbot")
                     break
             except (OSError, subprocess.SubprocessError):
                 continue
@@ -6504,8 +7512,8 @@ def deploy_setup_certbot(domain: str) -> Tuple[bool, str, str]:
                     os.makedirs(DEPLOY_XRAY_CONFIG_DIR, exist_ok=True)
                     dst_cert = os.path.join(DEPLOY_XRAY_CONFIG_DIR, "cert.pem")
                     dst_key = os.path.join(DEPLOY_XRAY_CONFIG_DIR, "key.pem")
-                    shutil.copy2(cert, dst_cert)
-                    shutil.copy2(key, dst_key)
+                    _fast_copy(cert, dst_cert)
+                    _fast_copy(key, dst_key)
                     os.chmod(dst_cert, 0o644)
                     os.chmod(dst_key, 0o600)
                     return True, dst_cert, dst_key
@@ -6524,8 +7532,10 @@ def deploy_systemd_service() -> Tuple[bool, str]:
     except OSError as e:
         return False, f"Failed to write service file: {e}"
 
+    # `enable` reloads the manager configuration itself (unless --no-reload),
+    # so a separate daemon-reload is redundant. `restart` stays separate from
+    # `enable --now`, which would not reload an xray that is already running.
     for cmd, label in [
-        (["systemctl", "daemon-reload"], "daemon-reload"),
         (["systemctl", "enable", "xray"], "enable"),
         (["systemctl", "restart", "xray"], "start"),
     ]:
@@ -6538,13 +7548,10 @@ def deploy_systemd_service() -> Tuple[bool, str]:
 
     time.sleep(1)
     try:
-        result = subprocess.run(
-            ["systemctl", "is-active", "xray"],
-            capture_output=True, text=True, timeout=5,
-        )
-        if result.stdout.strip() == "active":
+        state = _xray_service_state(0)
+        if state == "active":
             return True, "Xray service running"
-        return False, f"Service status: {result.stdout.strip()}"
+        return False, f"Service status: {state}"
     except (OSError, subprocess.SubprocessError) as e:
         return False, f"Status check failed: {e}"
 
@@ -6602,7 +7609,16 @@ def deploy_save_results(ds: "DeployState") -> str:
             for uri in ds.client_uris:
                 f.write(uri + "\n")
             f.write(f"\n# Server config JSON:\n")
-            f.write(json.dumps(ds.server_config, indent=2) + "\n")
+            # Reuse the JSON deploy_write_config already put on disk rather
+            # than serialising the whole config a second time
+            config_text = ""
+            if ds.server_config_file:
+                try:
+                    with open(ds.server_config_file, "r", encoding="utf-8") as cf:
+                        config_text = cf.read()
+                except OSError:
+                    pass
+            f.write(config_text or json.dumps(ds.server_config, indent=2) + "\n")
         return path
     except OSError as e:
         _dbg(f"deploy_save_results failed: {e}")
@@ -6613,27 +7629,46 @@ def deploy_save_results(ds: "DeployState") -> str:
 
 
 def _read_server_config() -> Optional[dict]:
-    """Read and parse the xray server config."""
+    """Read and parse the xray server config.
+
+    Inbound streamSettings/settings stored as JSON text (panel exports)
+    are decoded here once, so everything downstream sees plain dicts.
+    """
     try:
         with open(DEPLOY_XRAY_CONFIG, "r", encoding="utf-8") as f:
             data = json.load(f)
         if isinstance(data, dict):
+            _normalize_inbounds(data)
             return data
     except (OSError, ValueError):
         pass
     return None
 
 
-def _write_server_config(config: dict) -> bool:
-    """Write xray server config atomically with backup. Returns True on success."""
+def _normalize_inbounds(config: dict):
+    """Decode string-encoded streamSettings/settings of each inbound in place.
+    Undecodable text is left untouched so a later write doesn't lose it."""
+    inbounds = config.get("inbounds")
+    if not isinstance(inbounds, list):
+        return
+    for ib in inbounds:
+        if not isinstance(ib, dict):
+            continue
+        for key in ("streamSettings", "settings"):
+            val = ib.get(key)
+            if isinstance(val, str):
+                try:
+                    ib[key] = json.loads(val)
+                except ValueError:
+                    pass
+
+
+def _write_server_config(config: dict, text: Optional[str] = None) -> bool:
+    """Write xray server config atomically with backup. Returns True on success.
+    `text` is config already serialised by the caller, written as-is."""
     os.makedirs(DEPLOY_XRAY_CONFIG_DIR, exist_ok=True)
     backup_dir = os.path.join(DEPLOY_XRAY_CONFIG_DIR, "backups")
     os.makedirs(backup_dir, exist_ok=True)
-    # Validate JSON serialisable before touching disk
-    try:
-        data = json.dumps(config, indent=2)
-    except (TypeError, ValueError):
-        return False
     # Backup existing config
     if os.path.isfile(DEPLOY_XRAY_CONFIG):
         ts = time.strftime("%Y%m%d_%H%M%S")
@@ -6641,15 +7676,19 @@ def _write_server_config(config: dict) -> bool:
             shutil.copy2(DEPLOY_XRAY_CONFIG, os.path.join(backup_dir, f"config_{ts}.json"))
         except OSError:
             pass
-    # Atomic write: write to tmp then rename
+    # Atomic write: stream to tmp then rename; a value that isn't JSON
+    # serialisable aborts here and the live config is never touched
     tmp_path = DEPLOY_XRAY_CONFIG + ".tmp"
     try:
-        _fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
-        with os.fdopen(_fd, "w", encoding="utf-8") as f:
-            f.write(data)
+        _fd = os.open(tmp_path, _CONFIG_OPEN_FLAGS, 0o600)
+        with os.fdopen(_fd, "w", buffering=_CONFIG_WRITE_BUF, encoding="utf-8") as f:
+            if text is None:
+                json.dump(config, f, indent=2)
+            else:
+                f.write(text)
         os.replace(tmp_path, DEPLOY_XRAY_CONFIG)
         return True
-    except OSError:
+    except (OSError, TypeError, ValueError):
         try:
             os.remove(tmp_path)
         except OSError:
@@ -6657,6 +7696,34 @@ def _write_server_config(config: dict) -> bool:
         return False
 
 
+def _server_config_unchanged(text: str) -> bool:
+    """True if serialised config `text` matches the live file byte for byte,
+    so write and restart can be skipped."""
+    try:
+        new = hashlib.blake2b(text.encode("utf-8")).digest()
+        with open(DEPLOY_XRAY_CONFIG, "rb") as f:
+            return hashlib.blake2b(f.read()).digest() == new
+    except OSError:
+        return False
+
+
+_XRAY_STATE_CACHE = [0.0, ""]  # [monotonic time of query, is-active output]
+
+
+def _xray_service_state(ttl: float = 0.5) -> str:
+    """`systemctl is-active xray` output, reused for `ttl` seconds so quick
+    Connection Manager redraws don't fork systemctl each time. ttl=0
+    forces a fresh query (after starting/stopping the service)."""
+    now = time.monotonic()
+    if ttl > 0 and now - _XRAY_STATE_CACHE[0] < ttl:
+        return _XRAY_STATE_CACHE[1]
+    r = subprocess.run(["systemctl", "is-active", "xray"],
+                       capture_output=True, text=True, timeout=5)
+    _XRAY_STATE_CACHE[0] = time.monotonic()
+    _XRAY_STATE_CACHE[1] = r.stdout.strip()
+    return _XRAY_STATE_CACHE[1]
+
+
 def _restart_xray_service() -> Tuple[bool, str]:
     """Restart xray via systemctl. Returns (success, message)."""
     if sys.platform in ("win32", "darwin"):
@@ -6672,13 +7739,10 @@ def _restart_xray_service() -> Tuple[bool, str]:
         return False, f"restart error: {e}"
     time.sleep(1)
     try:
-        result = subprocess.run(
-            ["systemctl", "is-active", "xray"],
-            capture_output=True, text=True, timeout=5,
-        )
-        if result.stdout.strip() == "active":
+        state = _xray_service_state(0)
+        if state == "active":
             return True, "Xray service running"
-        return False, f"Service status: {result.stdout.strip()}"
+        return False, f"Service status: {state}"
     except (OSError, subprocess.SubprocessError) as e:
         return False, f"Status check: {e}"
 
@@ -6686,20 +7750,10 @@ def _restart_xray_service() -> Tuple[bool, str]:
 def _parse_inbound_summary(inbound: dict) -> dict:
     """Extract readable summary from a server inbound config."""
     stream = inbound.get("streamSettings") or {}
-    if isinstance(stream, str):
-        try:
-            stream = json.loads(stream)
-        except (ValueError, TypeError):
-            stream = {}
     if not isinstance(stream, dict):
         stream = {}
     clients = []
     settings = inbound.get("settings") or {}
-    if isinstance(settings, str):
-        try:
-            settings = json.loads(settings)
-        except (ValueError, TypeError):
-            settings = {}
     if not isinstance(settings, dict):
         settings = {}
     if isinstance(settings.get("clients"), list):
@@ -6715,12 +7769,84 @@ def _parse_inbound_summary(inbound: dict) -> dict:
     }
 
 
-def _cm_build_client_uri(inbound: dict, uuid_val: str, server_ip: str) -> Optional[str]:
-    """Build a client URI from an existing inbound config + UUID. Returns None on failure."""
+def _cm_tx_ws(stream: dict, parsed: dict):
+    ws = stream.get("wsSettings") or {}
+    parsed["path"] = ws.get("path", "/ws")
+    parsed["host"] = ws.get("headers", {}).get("Host", "")
+
+
+def _cm_tx_xhttp(stream: dict, parsed: dict):
+    parsed["type"] = "xhttp"
+    xh = stream.get("xhttpSettings") or stream.get("splithttpSettings") or {}
+    parsed["path"] = xh.get("path", "/xhttp")
+
+
+def _cm_tx_grpc(stream: dict, parsed: dict):
+    gs = stream.get("grpcSettings") or {}
+    parsed["serviceName"] = gs.get("serviceName", "grpc")
+
+
+def _cm_tx_h2(stream: dict, parsed: dict):
+    hs = stream.get("httpSettings") or {}
+    parsed["path"] = hs.get("path", "/h2")
+
+
+def _cm_sec_reality(stream: dict, parsed: dict) -> str:
+    rs = stream.get("realitySettings") or {}
+    snames = rs.get("serverNames") or []
+    sni = snames[0] if snames else ""
+    parsed["sni"] = sni
+    sid_list = rs.get("shortIds") or []
+    parsed["sid"] = sid_list[0] if sid_list else ""
+    # Derive public key from private key
+    priv = rs.get("privateKey", "")
+    _pub = _x25519_public_key(priv) if priv else ""
+    if _pub:
+        parsed["pbk"] = _pub
+    elif priv:
+        _xbin = xray_find_binary(None)
+        if _xbin:
+            try:
+                kw = {}
+                if sys.platform == "win32":
+                    kw["creationflags"] = 0x08000000
+                r = subprocess.run(
+                    [_xbin, "x25519", "-i", priv],
+                    capture_output=True, text=True, timeout=10, **kw,
+                )
+                _pub = _parse_x25519_output(r.stdout)[1]
+                if _pub:
+                    parsed["pbk"] = _pub
+            except (OSError, subprocess.SubprocessError):
+                pass
+    if parsed["protocol"] == "vless" and parsed["type"] == "tcp":
+        parsed["flow"] = "xtls-rprx-vision"
+    return sni
+
+
+def _cm_sec_tls(stream: dict, parsed: dict) -> str:
+    tls_s = stream.get("tlsSettings") or {}
+    sni = tls_s.get("serverName", "")
+    parsed["sni"] = sni
+    return sni
+
+
+# streamSettings network/security -> fills the matching client URI fields
+_CM_TRANSPORT_FIELDS = {
+    "ws": _cm_tx_ws,
+    "xhttp": _cm_tx_xhttp, "splithttp": _cm_tx_xhttp,
+    "grpc": _cm_tx_grpc,
+    "h2": _cm_tx_h2, "http": _cm_tx_h2,
+}
+_CM_SECURITY_FIELDS = {"reality": _cm_sec_reality, "tls": _cm_sec_tls}
+
+
+def _cm_build_client_uri(inbound: dict, uuid_val: str, server_ip: str,
+                         ws_host: str = "") -> Optional[str]:
+    """Build a client URI from an existing inbound config + UUID. Returns None on failure.
+    `ws_host` fills the ws Host when the inbound does not set one."""
     try:
         stream = inbound.get("streamSettings") or {}
-        if isinstance(stream, str):
-            stream = json.loads(stream)
         if not isinstance(stream, dict):
             stream = {}
         protocol = inbound.get("protocol", "vless")
@@ -6732,55 +7858,13 @@ def _cm_build_client_uri(inbound: dict, uuid_val: str, server_ip: str) -> Option
             "port": port, "uuid": uuid_val,
             "type": transport, "security": security, "fp": "chrome",
         }
-        # Transport paths
-        if transport == "ws":
-            ws = stream.get("wsSettings") or {}
-            parsed["path"] = ws.get("path", "/ws")
-            parsed["host"] = ws.get("headers", {}).get("Host", "")
-        elif transport in ("xhttp", "splithttp"):
-            parsed["type"] = "xhttp"
-            xh = stream.get("xhttpSettings") or stream.get("splithttpSettings") or {}
-            parsed["path"] = xh.get("path", "/xhttp")
-        elif transport == "grpc":
-            gs = stream.get("grpcSettings") or {}
-            parsed["serviceName"] = gs.get("serviceName", "grpc")
-        elif transport in ("h2", "http"):
-            hs = stream.get("httpSettings") or {}
-            parsed["path"] = hs.get("path", "/h2")
-        # Security: REALITY
-        sni = ""
-        if security == "reality":
-            rs = stream.get("realitySettings") or {}
-            snames = rs.get("serverNames") or []
-            sni = snames[0] if snames else ""
-            parsed["sni"] = sni
-            sid_list = rs.get("shortIds") or []
-            parsed["sid"] = sid_list[0] if sid_list else ""
-            # Derive public key from private key
-            priv = rs.get("privateKey", "")
-            if priv:
-                _xbin = xray_find_binary(None)
-                if _xbin:
-                    try:
-                        kw = {}
-                        if sys.platform == "win32":
-                            kw["creationflags"] = 0x08000000
-                        r = subprocess.run(
-                            [_xbin, "x25519", "-i", priv],
-                            capture_output=True, text=True, timeout=10, **kw,
-                        )
-                        for line in r.stdout.strip().splitlines():
-                            if line.strip().lower().startswith("public key:"):
-                                parsed["pbk"] = line.split(":", 1)[1].strip()
-                                break
-                    except (OSError, subprocess.SubprocessError):
-                        pass
-            if protocol == "vless" and transport == "tcp":
-                parsed["flow"] = "xtls-rprx-vision"
-        elif security == "tls":
-            tls_s = stream.get("tlsSettings") or {}
-            sni = tls_s.get("serverName", "")
-            parsed["sni"] = sni
+        tx = _CM_TRANSPORT_FIELDS.get(transport)
+        if tx:
+            tx(stream, parsed)
+        if transport == "ws" and not parsed.get("host"):
+            parsed["host"] = ws_host
+        sec = _CM_SECURITY_FIELDS.get(security)
+        sni = sec(stream, parsed) if sec else ""
         tag = f"cfray-{protocol}-{port}"
         return _build_uri(parsed, sni, tag)
     except (KeyError, ValueError, TypeError, IndexError):
@@ -6800,7 +7884,6 @@ def _tui_deploy_detect_ip(ds: "DeployState"):
     else:
         _w(f" {A.YEL}could not detect{A.RST}\n")
     _w(f" {A.BOLD}Server IP [{ds.server_ip or 'enter manually'}]:{A.RST} ")
-    _fl()
     try:
         ip_input = input().strip()
     except (EOFError, KeyboardInterrupt, OSError):
@@ -6810,14 +7893,10 @@ def _tui_deploy_detect_ip(ds: "DeployState"):
             ipaddress.ip_address(ip_input)
             ds.server_ip = ip_input
         except ValueError:
-            _w(f" {A.RED}Invalid IP address.{A.RST}\n")
-            _fl()
-            time.sleep(1)
+            _flash_error("Invalid IP address.")
             return False
     if not ds.server_ip:
-        _w(f" {A.RED}No server IP.{A.RST}\n")
-        _fl()
-        time.sleep(1)
+        _flash_error("No server IP.")
         return False
     return True
 
@@ -6832,15 +7911,11 @@ def _tui_deploy_handle_security(parsed: dict, ds: "DeployState") -> bool:
         if not xray_bin:
             xray_bin = xray_install() or ""
         if not xray_bin:
-            _w(f" {A.RED}Need Xray to generate keys.{A.RST}\n")
-            _fl()
-            time.sleep(2)
+            _flash_error("Need Xray to generate keys.", 2)
             return False
         priv, pub = deploy_generate_reality_keys(xray_bin)
         if not priv or not pub:
-            _w(f" {A.RED}Key generation failed.{A.RST}\n")
-            _fl()
-            time.sleep(2)
+            _flash_error("Key generation failed.", 2)
             return False
         ds.reality_private_key = priv
         ds.reality_public_key = pub
@@ -6853,7 +7928,6 @@ def _tui_deploy_handle_security(parsed: dict, ds: "DeployState") -> bool:
         _w(f"  {A.CYN}1{A.RST}. Auto-obtain via certbot\n")
         _w(f"  {A.CYN}2{A.RST}. Enter cert/key paths\n")
         _w(f" Choice [1]: ")
-        _fl()
         try:
             cc = input().strip() or "1"
         except (EOFError, KeyboardInterrupt, OSError):
@@ -6875,21 +7949,17 @@ def _tui_deploy_handle_security(parsed: dict, ds: "DeployState") -> bool:
                 cc = "2"
         if cc == "2":
             _w(f" {A.CYN}Certificate file path:{A.RST} ")
-            _fl()
             try:
                 ds.tls_cert_path = input().strip()
             except (EOFError, KeyboardInterrupt, OSError):
                 return False
             _w(f" {A.CYN}Private key file path:{A.RST} ")
-            _fl()
             try:
                 ds.tls_key_path = input().strip()
             except (EOFError, KeyboardInterrupt, OSError):
                 return False
             if not os.path.isfile(ds.tls_cert_path) or not os.path.isfile(ds.tls_key_path):
-                _w(f" {A.RED}Cert/key files not found.{A.RST}\n")
-                _fl()
-                time.sleep(1)
+                _flash_error("Cert/key files not found.")
                 return False
     return True
 
@@ -6915,7 +7985,6 @@ def _tui_deploy_fresh_wizard(ds: "DeployState") -> Optional["DeployState"]:
         _w(f"  {A.CYN}1{A.RST}. VLESS {A.GRN}(recommended){A.RST}\n")
         _w(f"  {A.CYN}2{A.RST}. VMess\n")
         _w(f" Choice [1]: ")
-        _fl()
         try:
             proto = input().strip() or "1"
         except (EOFError, KeyboardInterrupt, OSError):
@@ -6928,7 +7997,6 @@ def _tui_deploy_fresh_wizard(ds: "DeployState") -> Optional["DeployState"]:
         _w(f"  {A.CYN}2{A.RST}. TLS (needs domain + certificate)\n")
         _w(f"  {A.CYN}3{A.RST}. None (no encryption)\n")
         _w(f" Choice [1]: ")
-        _fl()
         try:
             sec_choice = input().strip() or "1"
         except (EOFError, KeyboardInterrupt, OSError):
@@ -6952,7 +8020,6 @@ def _tui_deploy_fresh_wizard(ds: "DeployState") -> Optional["DeployState"]:
             _w(f"  {A.CYN}4{A.RST}. H2\n")
             _w(f"  {A.CYN}5{A.RST}. XHTTP {A.GRN}(CDN-compatible){A.RST}\n")
         _w(f" Choice [1]: ")
-        _fl()
         try:
             trans_choice = input().strip() or "1"
         except (EOFError, KeyboardInterrupt, OSError):
@@ -6965,24 +8032,17 @@ def _tui_deploy_fresh_wizard(ds: "DeployState") -> Optional["DeployState"]:
         # Port
         if config_num == 0:
             _w(f"\n {A.BOLD}Port [443]:{A.RST} ")
-            _fl()
             try:
                 port_input = input().strip() or "443"
             except (EOFError, KeyboardInterrupt, OSError):
                 break
-            try:
-                port = int(port_input)
-                if not (1 <= port <= 65535):
-                    port = 443
-            except ValueError:
-                port = 443
+            port = _parse_port(port_input)
             ds.listen_port = port
 
             # Check if port is free
             if not deploy_check_port(port):
                 _w(f" {A.YEL}Warning: port {port} is already in use by another process{A.RST}\n")
                 _w(f" {A.CYN}Continue anyway? [y/N]:{A.RST} ")
-                _fl()
                 try:
                     _pc = input().strip().lower()
                 except (EOFError, KeyboardInterrupt, OSError):
@@ -7001,7 +8061,6 @@ def _tui_deploy_fresh_wizard(ds: "DeployState") -> Optional["DeployState"]:
                 _w(f"\n {A.DIM}REALITY dest: {sni} (reusing){A.RST}\n")
             else:
                 _w(f"\n {A.BOLD}REALITY dest domain [www.google.com]:{A.RST} ")
-                _fl()
                 try:
                     sni = input().strip() or "www.google.com"
                 except (EOFError, KeyboardInterrupt, OSError):
@@ -7013,15 +8072,12 @@ def _tui_deploy_fresh_wizard(ds: "DeployState") -> Optional["DeployState"]:
                 _w(f"\n {A.DIM}TLS domain: {sni} (reusing){A.RST}\n")
             else:
                 _w(f"\n {A.BOLD}Domain for TLS certificate:{A.RST} ")
-                _fl()
                 try:
                     sni = input().strip()
                 except (EOFError, KeyboardInterrupt, OSError):
                     break
                 if not sni:
-                    _w(f" {A.RED}Domain required for TLS.{A.RST}\n")
-                    _fl()
-                    time.sleep(1)
+                    _flash_error("Domain required for TLS.")
                     break
                 _saved_tls_sni = sni
                 ds.tls_domain = sni
@@ -7040,15 +8096,11 @@ def _tui_deploy_fresh_wizard(ds: "DeployState") -> Optional["DeployState"]:
                 _fl()
                 xray_bin = xray_install() or ""
             if not xray_bin:
-                _w(f" {A.RED}Failed to install Xray.{A.RST}\n")
-                _fl()
-                time.sleep(2)
+                _flash_error("Failed to install Xray.", 2)
                 break
             priv, pub = deploy_generate_reality_keys(xray_bin)
             if not priv or not pub:
-                _w(f" {A.RED}Key generation failed.{A.RST}\n")
-                _fl()
-                time.sleep(2)
+                _flash_error("Key generation failed.", 2)
                 break
             ds.reality_private_key = priv
             ds.reality_public_key = pub
@@ -7075,7 +8127,6 @@ def _tui_deploy_fresh_wizard(ds: "DeployState") -> Optional["DeployState"]:
 
         _w(f"\n {A.GRN}Config #{config_num} added: {protocol}/{transport}/{security} on port {port}{A.RST}\n")
         _w(f"\n {A.CYN}Add another config? [y/N]:{A.RST} ")
-        _fl()
         try:
             again = input().strip().lower()
         except (EOFError, KeyboardInterrupt, OSError):
@@ -7092,7 +8143,6 @@ def _tui_deploy_fresh_wizard(ds: "DeployState") -> Optional["DeployState"]:
 def _tui_deploy_from_uri(ds: "DeployState") -> Optional["DeployState"]:
     """Deploy from an existing VLESS/VMess URI."""
     _w(f"\n {A.BOLD}Paste VLESS/VMess URI:{A.RST}\n ")
-    _fl()
     try:
         uri = input().strip()
     except (EOFError, KeyboardInterrupt, OSError):
@@ -7100,9 +8150,7 @@ def _tui_deploy_from_uri(ds: "DeployState") -> Optional["DeployState"]:
 
     parsed = parse_vless_full(uri) or parse_vmess_full(uri)
     if not parsed:
-        _w(f" {A.RED}Invalid VLESS/VMess URI.{A.RST}\n")
-        _fl()
-        time.sleep(1)
+        _flash_error("Invalid VLESS/VMess URI.")
         return None
 
     ds.source_uris = [uri]
@@ -7111,31 +8159,18 @@ def _tui_deploy_from_uri(ds: "DeployState") -> Optional["DeployState"]:
     if not _tui_deploy_detect_ip(ds):
         return None
 
-    try:
-        ds.listen_port = int(parsed.get("port", 443))
-    except (ValueError, TypeError):
-        ds.listen_port = 443
-    if not (1 <= ds.listen_port <= 65535):
-        ds.listen_port = 443
+    ds.listen_port = _parse_port(parsed.get("port", 443))
     _w(f" {A.BOLD}Port [{ds.listen_port}]:{A.RST} ")
-    _fl()
     try:
         port_in = input().strip()
     except (EOFError, KeyboardInterrupt, OSError):
         return None
     if port_in:
-        try:
-            pv = int(port_in)
-            if 1 <= pv <= 65535:
-                ds.listen_port = pv
-        except ValueError:
-            pass
+        ds.listen_port = _parse_port(port_in, ds.listen_port)
 
     # Reject VMess + REALITY (not supported by Xray)
     if parsed.get("protocol") == "vmess" and parsed.get("security") == "reality":
-        _w(f" {A.RED}VMess + REALITY is not supported. Use VLESS instead.{A.RST}\n")
-        _fl()
-        time.sleep(2)
+        _flash_error("VMess + REALITY is not supported. Use VLESS instead.", 2)
         return None
 
     if not _tui_deploy_handle_security(parsed, ds):
@@ -7149,22 +8184,17 @@ def _tui_deploy_from_uri(ds: "DeployState") -> Optional["DeployState"]:
 def _tui_deploy_from_file(ds: "DeployState") -> Optional["DeployState"]:
     """Deploy from a file of URIs."""
     _w(f" {A.CYN}File path:{A.RST} ")
-    _fl()
     try:
         path = input().strip()
     except (EOFError, KeyboardInterrupt, OSError):
         return None
     if not os.path.isfile(path):
-        _w(f" {A.RED}File not found.{A.RST}\n")
-        _fl()
-        time.sleep(1)
+        _flash_error("File not found.")
         return None
 
     configs = load_input(path)
     if not configs:
-        _w(f" {A.RED}No valid configs found.{A.RST}\n")
-        _fl()
-        time.sleep(1)
+        _flash_error("No valid configs found.")
         return None
 
     for c in configs:
@@ -7175,35 +8205,23 @@ def _tui_deploy_from_file(ds: "DeployState") -> Optional["DeployState"]:
                 ds.parsed_configs.append(parsed)
 
     if not ds.parsed_configs:
-        _w(f" {A.RED}No parseable VLESS/VMess URIs in file.{A.RST}\n")
-        _fl()
-        time.sleep(1)
+        _flash_error("No parseable VLESS/VMess URIs in file.")
         return None
 
     _w(f" {A.GRN}Found {len(ds.parsed_configs)} config(s){A.RST}\n")
+    _fl()
 
     if not _tui_deploy_detect_ip(ds):
         return None
 
-    try:
-        ds.listen_port = int(ds.parsed_configs[0].get("port", 443))
-    except (ValueError, TypeError):
-        ds.listen_port = 443
-    if not (1 <= ds.listen_port <= 65535):
-        ds.listen_port = 443
+    ds.listen_port = _parse_port(ds.parsed_configs[0].get("port", 443))
     _w(f" {A.BOLD}Port [{ds.listen_port}]:{A.RST} ")
-    _fl()
     try:
         port_in = input().strip()
     except (EOFError, KeyboardInterrupt, OSError):
         return None
     if port_in:
-        try:
-            pv = int(port_in)
-            if 1 <= pv <= 65535:
-                ds.listen_port = pv
-        except ValueError:
-            pass
+        ds.listen_port = _parse_port(port_in, ds.listen_port)
 
     # Filter out VMess + REALITY (not supported) -- keep source_uris in sync
     paired = [(u, p) for u, p in zip(ds.source_uris, ds.parsed_configs)
@@ -7212,9 +8230,7 @@ def _tui_deploy_from_file(ds: "DeployState") -> Optional["DeployState"]:
     if skipped:
         _w(f" {A.YEL}Skipped {skipped} VMess+REALITY config(s) (not supported){A.RST}\n")
     if not paired:
-        _w(f" {A.RED}No valid configs after filtering.{A.RST}\n")
-        _fl()
-        time.sleep(1)
+        _flash_error("No valid configs after filtering.")
         return None
     ds.source_uris = [u for u, _ in paired]
     ds.parsed_configs = [p for _, p in paired]
@@ -7244,6 +8260,7 @@ def tui_deploy_input() -> Optional["DeployState"]:
     _w(f"\n {A.BOLD}{A.CYN}Deploy Xray Server{A.RST}\n")
     _w(f" {A.YEL}For:{A.RST} You have a Linux VPS and want to install xray on it (no tunnel).\n")
     _w(f" {A.DIM}Installs xray, generates config, starts the service. Run this ON your server.{A.RST}\n\n")
+    _fl()
 
     ok, err = deploy_check_prerequisites()
     if not ok:
@@ -7269,6 +8286,7 @@ async def _tui_run_deploy(args, preloaded_uri: str = ""):
             _w(A.SHOW)
             _w(f"\n {A.BOLD}{A.CYN}Deploy Xray Server{A.RST}\n")
             _w(f" {A.DIM}Deploying best config from xray test.{A.RST}\n")
+            _fl()
             ok, err = deploy_check_prerequisites()
             if not ok:
                 _w(f" {A.RED}ERROR: {err}{A.RST}\n")
@@ -7277,12 +8295,7 @@ async def _tui_run_deploy(args, preloaded_uri: str = ""):
                 return
             if not _tui_deploy_detect_ip(ds):
                 return
-            try:
-                ds.listen_port = int(parsed.get("port", 443))
-            except (ValueError, TypeError):
-                ds.listen_port = 443
-            if not (1 <= ds.listen_port <= 65535):
-                ds.listen_port = 443
+            ds.listen_port = _parse_port(parsed.get("port", 443))
             if not deploy_check_port(ds.listen_port):
                 _w(f" {A.YEL}Warning: port {ds.listen_port} is already in use{A.RST}\n")
                 _w(f" {A.CYN}Continue anyway? [y/N]:{A.RST} ")
@@ -7373,8 +8386,29 @@ async def _tui_run_deploy(args, preloaded_uri: str = ""):
 # ─── Uninstall ─────────────────────────────────────────────────────────────────
 
 
+def _remove_tree(path: str) -> bool:
+    """Delete a directory tree; True if it is gone afterwards.
+
+    On Linux `find -delete` does the getdents64/unlinkat walk in C, which
+    beats a Python-level walk when ~/.cfray/tmp has piled up thousands of
+    per-test configs. shutil.rmtree covers other platforms and anything
+    find left behind.
+    """
+    if sys.platform.startswith("linux") and shutil.which("find"):
+        try:
+            subprocess.run(["find", path, "-delete"],
+                           capture_output=True, timeout=30)
+        except (OSError, subprocess.SubprocessError):
+            pass
+    if os.path.lexists(path):
+        shutil.rmtree(path, ignore_errors=True)
+    return not os.path.isdir(path)
+
+
 def _uninstall_all() -> Tuple[bool, str]:
     """Remove everything cfray installed on this system."""
+    _reset_xray_binary_cache()  # every cached path is about to vanish
+    _XRAY_STATE_CACHE[0] = 0.0
     _out: list = []
     _had_errors = False
 
@@ -7390,8 +8424,7 @@ def _uninstall_all() -> Tuple[bool, str]:
 
     if sys.platform in ("win32", "darwin"):
         if os.path.isdir(XRAY_HOME):
-            shutil.rmtree(XRAY_HOME, ignore_errors=True)
-            if os.path.isdir(XRAY_HOME):
+            if not _remove_tree(XRAY_HOME):
                 _log_err(f"Could not fully remove {XRAY_HOME}")
             else:
                 _log(f"Removed {XRAY_HOME}")
@@ -7399,31 +8432,34 @@ def _uninstall_all() -> Tuple[bool, str]:
             _log("Nothing to remove (no local cfray directory)")
         return not _had_errors, "; ".join(_out)
 
-    # --- 1. Stop xray service ---
-    for action in ["stop", "disable"]:
-        try:
-            subprocess.run(["systemctl", action, "xray"],
-                           capture_output=True, text=True, timeout=15)
-        except (OSError, subprocess.SubprocessError):
-            pass
+    # --- 1. Stop xray service (one call: disable --now also stops it) ---
+    try:
+        subprocess.run(["systemctl", "disable", "--now", "xray"],
+                       capture_output=True, text=True, timeout=20)
+    except (OSError, subprocess.SubprocessError):
+        pass
     _log("Stopped and disabled xray service")
 
     # --- 2. Remove xray server files ---
     _removed = []
-    for path in [DEPLOY_XRAY_SERVICE, DEPLOY_XRAY_BIN]:
-        if os.path.isfile(path):
-            try:
-                os.remove(path)
-                _removed.append(path)
-            except OSError:
-                _log_err(f"Could not remove {path}")
-    for dpath in [DEPLOY_XRAY_CONFIG_DIR, DEPLOY_XRAY_SHARE]:
+    for path in (DEPLOY_XRAY_SERVICE, DEPLOY_XRAY_BIN):
+        try:
+            os.unlink(path)
+            _removed.append(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            _log_err(f"Could not remove {path}: {e}")
+    # Independent trees, so remove them side by side
+    _dirs = [d for d in (DEPLOY_XRAY_CONFIG_DIR, DEPLOY_XRAY_SHARE) if os.path.isdir(d)]
+    if _dirs:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(_dirs)) as pool:
+            list(pool.map(lambda d: shutil.rmtree(d, ignore_errors=True), _dirs))
+    for dpath in _dirs:
         if os.path.isdir(dpath):
-            shutil.rmtree(dpath, ignore_errors=True)
-            if os.path.isdir(dpath):
-                _log_err(f"Could not fully remove {dpath}")
-            else:
-                _removed.append(dpath)
+            _log_err(f"Could not fully remove {dpath}")
+        else:
+            _removed.append(dpath)
     if _removed:
         _log(f"Removed xray server: {', '.join(os.path.basename(p) for p in _removed)}")
     elif not _had_errors:
@@ -7438,8 +8474,7 @@ def _uninstall_all() -> Tuple[bool, str]:
 
     # --- 4. Remove local client dir (~/.cfray/) ---
     if os.path.isdir(XRAY_HOME):
-        shutil.rmtree(XRAY_HOME, ignore_errors=True)
-        if os.path.isdir(XRAY_HOME):
+        if not _remove_tree(XRAY_HOME):
             _log_err(f"Could not fully remove {XRAY_HOME}")
         else:
             _log(f"Removed {XRAY_HOME}")
@@ -7452,6 +8487,184 @@ def _uninstall_all() -> Tuple[bool, str]:
 # ─── Connection Manager (Direct JSON mode) ───────────────────────────────────
 
 
+# Connection Manager table header, row formatter and footer key hints
+_CM_TABLE_HDR = (f"{A.BOLD}  {'#':>2}  {'Protocol':<10} {'Port':>6} "
+                 f"{'Transport':<12} {'Security':<10} {'Users':>5}{A.RST}")
+_cm_row = "  {i:>2}  {protocol:<10} {port:>6} {transport:<12} {security:<10} {users:>5}".format_map
+_CM_FOOTER_WRITE = f"  {A.YEL}[W]{A.RST} Write"
+_CM_FOOTER_INBOUND = "".join(
+    f"  {A.CYN}[{k}]{A.RST} {label}"
+    for k, label in (("V", "View"), ("S", "Show URIs"), ("U", "Add user"), ("X", "Remove"))
+)
+_CM_FOOTER_BASE = "".join(
+    f"  {A.CYN}[{k}]{A.RST} {label}"
+    for k, label in (("A", "Add inbound"), ("R", "Restart xray"), ("L", "Logs"),
+                     ("D", "Uninstall"), ("B", "Back"))
+)
+
+
+def _json_preview(obj, limit: int) -> str:
+    """First `limit` chars of `obj` as indented JSON. Encoding stops once
+    enough text exists, so an inbound with a huge clients list isn't
+    serialised in full just to be cut off."""
+    out, n = [], 0
+    for chunk in _JSON_PRETTY.iterencode(obj):
+        out.append(chunk)
+        n += len(chunk)
+        if n >= limit:
+            break
+    return "".join(out)[:limit]
+
+
+def _cm_write_and_restart(config: dict) -> bool:
+    """Write staged Connection Manager edits and restart xray once."""
+    # Serialise once: the same text feeds the no-change check and the write
+    try:
+        text = json.dumps(config, indent=2)
+    except (TypeError, ValueError):
+        text = None
+    if text is not None and _server_config_unchanged(text):
+        _w(f"\n {A.DIM}No changes to write.{A.RST}\n")
+        _fl()
+        return True
+    _w(f"\n {A.DIM}Writing config and restarting xray...{A.RST}\n")
+    _fl()
+    if text is None or not _write_server_config(config, text):
+        _w(f" {A.RED}Failed to write config (run as root?) - staged changes discarded.{A.RST}\n")
+        _fl()
+        return False
+    ok, msg = _restart_xray_service()
+    if ok:
+        _w(f" {A.GRN}{msg}{A.RST}\n")
+    else:
+        _w(f" {A.YEL}Warning: {msg}{A.RST}\n")
+    _fl()
+    return True
+
+
+def _cm_restart(inbounds: list, inbound_indices: List[int], summaries: List[dict]):
+    """Restart xray and show the outcome."""
+    _w(f"\n {A.DIM}Restarting xray...{A.RST}\n")
+    _fl()
+    ok, msg = _restart_xray_service()
+    if ok:
+        _w(f" {A.GRN}{msg}{A.RST}\n")
+    else:
+        _w(f" {A.RED}{msg}{A.RST}\n")
+    _pause(1.5)
+
+
+def _cm_logs(inbounds: list, inbound_indices: List[int], summaries: List[dict]):
+    """Show the last 30 xray journal lines."""
+    _w(A.CLR + A.HOME)
+    _w(f"\n {A.BOLD}{A.CYN}xray Logs (last 30 lines){A.RST}\n")
+    _w(f" {A.DIM}{'-' * 50}{A.RST}\n\n")
+    _fl()
+    try:
+        # Stop reading at 30 lines instead of waiting for journalctl
+        # to exit; on a large journal the tail of its run is slow. A
+        # 10 s deadline still bounds a journalctl that never gets there.
+        import select
+        p = subprocess.Popen(
+            ["journalctl", "-u", "xray", "-n", "30", "--no-pager", "-q", "--output=short"],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0,
+        )
+        chunks: List[bytes] = []
+        try:
+            fd = p.stdout.fileno()
+            deadline = time.monotonic() + 10.0
+            lines = 0
+            while lines < 30:
+                left = deadline - time.monotonic()
+                if left <= 0 or not select.select([fd], [], [], left)[0]:
+                    break
+                data = os.read(fd, 65536)
+                if not data:
+                    break
+                chunks.append(data)
+                lines += data.count(b"\n")
+        finally:
+            p.kill()
+            p.wait(timeout=1)
+            p.stdout.close()
+        raw = b"".join(chunks).decode("utf-8", errors="replace")
+        logs = "".join(raw.splitlines(keepends=True)[:30])
+        _w(logs[:3000] if logs else f" {A.DIM}(no logs){A.RST}\n")
+    except (OSError, subprocess.SubprocessError) as e:
+        _w(f" {A.RED}Failed to read logs: {e}{A.RST}\n")
+    _w(f"\n {A.DIM}Press any key to go back...{A.RST}\n")
+    _fl()
+    _read_key_blocking()
+
+
+def _cm_view(inbounds: list, inbound_indices: List[int], summaries: List[dict]):
+    """Pretty-print one inbound's JSON."""
+    _w(A.SHOW)
+    which = _tui_prompt_text(f"View which inbound? [1-{len(summaries)}]:")
+    if which:
+        try:
+            sel = int(which) - 1
+            if 0 <= sel < len(summaries):
+                ib_data = inbounds[inbound_indices[sel]]
+                _w(A.CLR + A.HOME)
+                _w(f"\n {A.BOLD}{A.CYN}Inbound #{sel+1}{A.RST}\n")
+                _w(f" {A.DIM}{'-' * 50}{A.RST}\n\n")
+                _w(f"{_json_preview(ib_data, 3000)}\n")
+                _w(f"\n {A.DIM}Press any key to go back...{A.RST}\n")
+                _fl()
+                _read_key_blocking()
+        except (ValueError, IndexError):
+            pass
+
+
+def _cm_show_uris(inbounds: list, inbound_indices: List[int], summaries: List[dict]):
+    """List client URIs for every inbound."""
+    _w(f"\n {A.DIM}Building client URIs...{A.RST}\n")
+    _fl()
+    server_ip = _cached_server_ip() or "<server-ip>"
+    # Build every URI up front; the xray key-derivation fallback
+    # forks per inbound, so overlap those on a small pool
+    _jobs = []
+    for i in range(len(summaries)):
+        ib_data = inbounds[inbound_indices[i]]
+        settings = ib_data.get("settings")
+        if not isinstance(settings, dict):
+            continue
+        for cl in settings.get("clients") or []:
+            _cl_uuid = cl.get("id", "") if isinstance(cl, dict) else ""
+            if _cl_uuid:
+                _jobs.append((i, ib_data, _cl_uuid))
+    if len(_jobs) > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(8, len(_jobs))) as _pool:
+            _uris = list(_pool.map(lambda j: _cm_build_client_uri(j[1], j[2], server_ip), _jobs))
+    else:
+        _uris = [_cm_build_client_uri(j[1], j[2], server_ip) for j in _jobs]
+    _by_inbound: Dict[int, List[str]] = defaultdict(list)
+    for (i, _, _), _cl_uri in zip(_jobs, _uris):
+        if _cl_uri:
+            _by_inbound[i].append(_cl_uri)
+    # Whole listing goes out as one frame
+    page = [A.CLR + A.HOME, f"\n {A.BOLD}{A.CYN}All Client URIs{A.RST}\n",
+            f" {A.DIM}{'-' * 50}{A.RST}\n\n"]
+    for i, s in enumerate(summaries):
+        page.append(f" {A.BOLD}Inbound #{i+1}{A.RST} ({s['protocol']}:{s['port']} {s['transport']}/{s['security']})\n")
+        page.extend(f"   {A.GRN}{_cl_uri}{A.RST}\n" for _cl_uri in _by_inbound.get(i, ()))
+        page.append("\n")
+    page.append(f" {A.DIM}Press any key to go back...{A.RST}\n")
+    _wframe("".join(page))
+    _read_key_blocking()
+
+
+# Connection Manager actions that don't edit the config:
+# key -> (handler, needs at least one inbound)
+_CM_ACTIONS = {
+    "r": (_cm_restart, False),
+    "l": (_cm_logs, False),
+    "v": (_cm_view, True),
+    "s": (_cm_show_uris, True),
+}
+
+
 async def _tui_connection_manager(args):
     """TUI for managing xray server configs and connections."""
     if sys.platform in ("win32", "darwin"):
@@ -7462,11 +8675,15 @@ async def _tui_connection_manager(args):
         _read_key_blocking()
         return
 
-    _cm_server_ip = ""  # Cached; detected on first need
+    # Add/remove edits are staged here and written with one restart on [W]
+    # (or on leaving), instead of rewriting the config and restarting xray
+    # after every change. A failed write drops them and re-reads the disk.
+    _staged = None
+    _pending = 0
 
     while True:
         # Direct JSON mode only
-        config = _read_server_config()
+        config = _staged if _staged is not None else _read_server_config()
         if config is not None:
             ib_val = config.get("inbounds")
             if not isinstance(ib_val, list):
@@ -7482,45 +8699,29 @@ async def _tui_connection_manager(args):
         # Service status
         xray_running = False
         try:
-            r = subprocess.run(["systemctl", "is-active", "xray"],
-                                capture_output=True, text=True, timeout=5)
-            xray_running = r.stdout.strip() == "active"
+            xray_running = _xray_service_state() == "active"
         except (OSError, subprocess.SubprocessError):
             pass
 
-        _w(A.CLR + A.HOME + A.SHOW)
-        W, _ = term_size()
+        W, _ = _cached_term_size()
         W = max(60, W - 2)
-        out = []
-        out.append(f"{A.CYN}{'=' * (W + 2)}{A.RST}")
+        dbl = f"{A.CYN}{_rep('=', W + 2)}{A.RST}"
+        rule = f"{A.CYN}{_rep('-', W + 2)}{A.RST}"
         _cmhdr = f" {A.BOLD}{A.CYN}Connection Manager{A.RST}"
-        out.append(f"{A.CYN}|{A.RST}{_cmhdr}{' ' * max(0, W - _vl(_cmhdr))}{A.CYN}|{A.RST}")
-        out.append(f"{A.CYN}{'=' * (W + 2)}{A.RST}")
+        out = [dbl, f"{A.CYN}|{A.RST}{_cmhdr}{_rep(' ', W - _vl(_cmhdr))}{A.CYN}|{A.RST}", dbl]
 
         # Service status
         def bx(txt):
             vlen = _vl(txt)
             if vlen > W:
-                vis = 0
-                i = 0
-                while i < len(txt) and vis < W - 1:
-                    if txt[i] == '\033' and i + 1 < len(txt) and txt[i + 1] == '[':
-                        j = i + 2
-                        while j < len(txt) and txt[j] != 'm':
-                            j += 1
-                        i = j + 1
-                    else:
-                        vis += _char_width(txt[i])
-                        i += 1
-                txt = txt[:i] + A.RST + "..."
+                txt = _vtrunc(txt, W - 1) + A.RST + "..."
                 vlen = _vl(txt)
-            pad = ' ' * max(0, W - vlen)
-            out.append(f"{A.CYN}|{A.RST}{txt}{pad}{A.CYN}|{A.RST}")
+            out.append(f"{A.CYN}|{A.RST}{txt}{_rep(' ', W - vlen)}{A.CYN}|{A.RST}")
 
         xray_dot = f"{A.GRN}*{A.RST} running" if xray_running else f"{A.RED}*{A.RST} stopped"
         bx(f"  Xray Service: {xray_dot}  {A.DIM}(system){A.RST}")
 
-        out.append(f"{A.CYN}{'-' * (W + 2)}{A.RST}")
+        out.append(rule)
 
         # Inbounds
         _has_inbounds = bool(summaries)
@@ -7531,67 +8732,58 @@ async def _tui_connection_manager(args):
             bx(f"  {A.DIM}No inbounds configured.{A.RST}")
         else:
             bx(f"  {A.BOLD}Server Inbounds ({len(summaries)}){A.RST}")
-            bx(f"  {A.DIM}{'-' * (W - 4)}{A.RST}")
-            hdr = f"  {'#':>2}  {'Protocol':<10} {'Port':>6} {'Transport':<12} {'Security':<10} {'Users':>5}"
-            bx(f"{A.BOLD}{hdr}{A.RST}")
-            for i, s in enumerate(summaries[:20]):
-                line = f"  {i+1:>2}  {s['protocol']:<10} {s['port']:>6} {s['transport']:<12} {s['security']:<10} {s['users']:>5}"
-                bx(line)
+            bx(f"  {A.DIM}{_rep('-', W - 4)}{A.RST}")
+            bx(_CM_TABLE_HDR)
+            for i, s in enumerate(summaries[:20], 1):
+                bx(_cm_row({**s, "i": i}))
+
+        if _pending:
+            bx(f"  {A.YEL}{_pending} unsaved change(s) - press W to write & restart xray{A.RST}")
 
-        out.append(f"{A.CYN}{'-' * (W + 2)}{A.RST}")
+        out.append(rule)
 
         # Footer
-        parts = []
-        if _has_inbounds:
-            parts.append(f"{A.CYN}[V]{A.RST} View")
-            parts.append(f"{A.CYN}[S]{A.RST} Show URIs")
-            parts.append(f"{A.CYN}[U]{A.RST} Add user")
-            parts.append(f"{A.CYN}[X]{A.RST} Remove")
-        parts.append(f"{A.CYN}[A]{A.RST} Add inbound")
-        parts.append(f"{A.CYN}[R]{A.RST} Restart xray")
-        parts.append(f"{A.CYN}[L]{A.RST} Logs")
-        parts.append(f"{A.CYN}[D]{A.RST} Uninstall")
-        parts.append(f"{A.CYN}[B]{A.RST} Back")
-        bx(f"  {'  '.join(parts)}")
-        out.append(f"{A.CYN}{'=' * (W + 2)}{A.RST}")
-
-        _w("\n".join(out) + "\n")
-        _fl()
+        bx((_CM_FOOTER_WRITE if _pending else "")
+           + (_CM_FOOTER_INBOUND if _has_inbounds else "") + _CM_FOOTER_BASE)
+        out.append(dbl)
+
+        # Clear, header, table and footer go out as one write
+        _wframe_lines(out, A.CLR + A.HOME + A.SHOW)
 
         key = _read_key_blocking()
         if isinstance(key, str):
             key = key.lower()
         if key in ("b", "esc", "q", "ctrl-c"):
+            if _pending:
+                # Ctrl-C asks too: URIs shown for staged users/inbounds are
+                # only valid once the config actually reaches disk
+                _w(f"\n {A.YEL}Write {_pending} unsaved change(s) and restart xray? [Y/n]:{A.RST} ")
+                _fl()
+                if _read_key_blocking() not in ("n", "N", "esc", "ctrl-c"):
+                    _cm_write_and_restart(_staged)
+                else:
+                    _w(f"\n {A.YEL}Discarded {_pending} unsaved change(s).{A.RST}\n")
+                    _fl()
+                _pause(1.5)
             return
 
-        if key == "r":
-            _w(f"\n {A.DIM}Restarting xray...{A.RST}\n")
-            _fl()
-            ok, msg = _restart_xray_service()
-            if ok:
-                _w(f" {A.GRN}{msg}{A.RST}\n")
-            else:
-                _w(f" {A.RED}{msg}{A.RST}\n")
-            _fl()
-            time.sleep(1.5)
+        if key == "r" and _pending:
+            # Restarting now would reload the old on-disk config; write the
+            # staged edits first (that restarts xray once as well)
+            _cm_write_and_restart(_staged)
+            _staged, _pending = None, 0
+            _pause(1.5)
             continue
 
-        if key == "l":
-            _w(A.CLR + A.HOME)
-            _w(f"\n {A.BOLD}{A.CYN}xray Logs (last 30 lines){A.RST}\n")
-            _w(f" {A.DIM}{'-' * 50}{A.RST}\n\n")
-            _fl()
-            try:
-                result = subprocess.run(
-                    ["journalctl", "-u", "xray", "-n", "30", "--no-pager"],
-                    capture_output=True, text=True, timeout=10,
-                )
-                _w(result.stdout[:3000] if result.stdout else f" {A.DIM}(no logs){A.RST}\n")
-            except (OSError, subprocess.SubprocessError) as e:
-                _w(f" {A.RED}Failed to read logs: {e}{A.RST}\n")
-            _w(f"\n {A.DIM}Press any key to go back...{A.RST}\n")
-            _fl()
-            _read_key_blocking()
+        action = _CM_ACTIONS.get(key)
+        if action and (summaries or not action[1]):
+            action[0](inbounds, inbound_indices, summaries)
+            continue
+
+        if key == "w" and _pending:
+            _cm_write_and_restart(_staged)
+            _staged, _pending = None, 0
+            _pause(1.5)
             continue
 
         if key == "d":
@@ -7607,6 +8799,7 @@ async def _tui_connection_manager(args):
             if confirm == "uninstall":
                 _w(f"\n {A.DIM}Uninstalling...{A.RST}\n")
                 _fl()
+                _staged, _pending = None, 0
                 ok, msg = _uninstall_all()
                 if ok:
                     _w(f"\n {A.GRN}{msg}{A.RST}\n")
@@ -7618,52 +8811,7 @@ async def _tui_connection_manager(args):
                 return
             else:
                 _w(f" {A.DIM}Cancelled.{A.RST}\n")
-                _fl()
-                time.sleep(1)
-            continue
-
-        if key == "v" and summaries:
-            _w(A.SHOW)
-            which = _tui_prompt_text(f"View which inbound? [1-{len(summaries)}]:")
-            if which:
-                try:
-                    sel = int(which) - 1
-                    if 0 <= sel < len(summaries):
-                        ib_data = inbounds[inbound_indices[sel]]
-                        _w(A.CLR + A.HOME)
-                        _w(f"\n {A.BOLD}{A.CYN}Inbound #{sel+1}{A.RST}\n")
-                        _w(f" {A.DIM}{'-' * 50}{A.RST}\n\n")
-                        pretty = json.dumps(ib_data, indent=2, ensure_ascii=False)
-                        _w(f"{pretty[:3000]}\n")
-                        _w(f"\n {A.DIM}Press any key to go back...{A.RST}\n")
-                        _fl()
-                        _read_key_blocking()
-                except (ValueError, IndexError):
-                    pass
-            continue
-
-        if key == "s" and summaries:
-            _w(A.CLR + A.HOME)
-            _w(f"\n {A.BOLD}{A.CYN}All Client URIs{A.RST}\n")
-            _w(f" {A.DIM}{'-' * 50}{A.RST}\n\n")
-            if not _cm_server_ip:
-                _cm_server_ip = deploy_detect_server_ip() or "<server-ip>"
-            for i, s in enumerate(summaries):
-                real_idx = inbound_indices[i]
-                ib_data = inbounds[real_idx]
-                settings = ib_data.get("settings") or {}
-                clients = settings.get("clients") or []
-                _w(f" {A.BOLD}Inbound #{i+1}{A.RST} ({s['protocol']}:{s['port']} {s['transport']}/{s['security']})\n")
-                for cl in clients:
-                    _cl_uuid = cl.get("id", "")
-                    if _cl_uuid:
-                        _cl_uri = _cm_build_client_uri(ib_data, _cl_uuid, _cm_server_ip)
-                        if _cl_uri:
-                            _w(f"   {A.GRN}{_cl_uri}{A.RST}\n")
-                _w("\n")
-            _w(f" {A.DIM}Press any key to go back...{A.RST}\n")
-            _fl()
-            _read_key_blocking()
+                _pause(1)
             continue
 
         if key == "u" and summaries:
@@ -7674,7 +8822,6 @@ async def _tui_connection_manager(args):
                     sel = int(which) - 1
                     if 0 <= sel < len(summaries):
                         new_uuid = deploy_generate_uuid()
-                        _user_add_ok = False
                         real_idx = inbound_indices[sel]
                         ib = inbounds[real_idx]
                         settings = ib.get("settings")
@@ -7690,22 +8837,15 @@ async def _tui_connection_manager(args):
                         if proto == "vmess":
                             new_client["alterId"] = 0
                         clients.append(new_client)
-                        if _write_server_config(config):
-                            ok, msg = _restart_xray_service()
-                            _w(f"\n {A.GRN}User added: {new_uuid}{A.RST}\n")
-                            if not ok:
-                                _w(f" {A.YEL}Warning: {msg}{A.RST}\n")
-                            _user_add_ok = True
-                        else:
-                            clients.pop()
-                            _w(f"\n {A.RED}Failed to write config (run as root?){A.RST}\n")
-                        if _user_add_ok:
-                            if not _cm_server_ip:
-                                _cm_server_ip = deploy_detect_server_ip() or "<server-ip>"
-                            _u_uri = _cm_build_client_uri(ib, new_uuid, _cm_server_ip)
-                            if _u_uri:
-                                _w(f"\n {A.BOLD}{A.CYN}Client URI:{A.RST}\n")
-                                _w(f" {A.GRN}{_u_uri}{A.RST}\n")
+                        _staged = config
+                        _pending += 1
+                        _w(f"\n {A.GRN}User added: {new_uuid}{A.RST}\n")
+                        _w(f" {A.DIM}Staged - press W in the menu to write & restart xray.{A.RST}\n")
+                        _cm_server_ip = _cached_server_ip() or "<server-ip>"
+                        _u_uri = _cm_build_client_uri(ib, new_uuid, _cm_server_ip)
+                        if _u_uri:
+                            _w(f"\n {A.BOLD}{A.CYN}Client URI:{A.RST}\n")
+                            _w(f" {A.GRN}{_u_uri}{A.RST}\n")
                         _w(f"\n {A.DIM}Press any key to continue...{A.RST}\n")
                         _fl()
                         _wait_any_key()
@@ -7722,26 +8862,13 @@ async def _tui_connection_manager(args):
                     if 0 <= sel < len(summaries):
                         s = summaries[sel]
                         _w(f" {A.YEL}Remove {s['protocol']}:{s['port']}? [y/N]:{A.RST} ")
-                        _fl()
-                        try:
-                            confirm = input().strip().lower()
-                        except (EOFError, KeyboardInterrupt, OSError):
-                            confirm = ""
-                        if confirm in ("y", "yes"):
+                        if _confirm_key():
                             real_idx = inbound_indices[sel]
-                            removed = inbounds[real_idx]
                             inbounds.pop(real_idx)
-                            if _write_server_config(config):
-                                ok, msg = _restart_xray_service()
-                                _w(f" {A.GRN}Inbound removed.{A.RST}\n")
-                                if not ok:
-                                    _w(f" {A.YEL}Warning: {msg}{A.RST}\n")
-                            else:
-                                # Restore in-memory state on write failure
-                                inbounds.insert(real_idx, removed)
-                                _w(f" {A.RED}Failed to write config (run as root?){A.RST}\n")
-                            _fl()
-                            time.sleep(1.5)
+                            _staged = config
+                            _pending += 1
+                            _w(f" {A.GRN}Inbound removed (staged - press W to write).{A.RST}\n")
+                            _pause(1.5)
                 except (ValueError, IndexError):
                     pass
             continue
@@ -7765,36 +8892,22 @@ async def _tui_connection_manager(args):
             _fl()
             try:
                 port_str = input().strip() or "443"
-                new_port = int(port_str)
-                if not (1 <= new_port <= 65535):
-                    _w(f" {A.YEL}Invalid port, using 443{A.RST}\n")
-                    new_port = 443
             except (EOFError, KeyboardInterrupt, OSError):
                 continue
-            except ValueError:
+            new_port = _parse_port(port_str, 0)
+            if not new_port:
                 _w(f" {A.YEL}Invalid port, using 443{A.RST}\n")
                 new_port = 443
             # Check for port conflicts -- our own inbounds
-            used_ports = {int(ib.get("port", 0)) for ib in inbounds if isinstance(ib, dict) and ib.get("port")}
-            if new_port in used_ports:
+            if any(_parse_port(s["port"], 0) == new_port for s in summaries):
                 _w(f" {A.YEL}Warning: port {new_port} already used by another inbound{A.RST}\n")
                 _w(f" {A.CYN}Continue anyway? [y/N]:{A.RST} ")
-                _fl()
-                try:
-                    _pc = input().strip().lower()
-                except (EOFError, KeyboardInterrupt, OSError):
-                    continue
-                if _pc not in ("y", "yes"):
+                if not _confirm_key():
                     continue
             elif not deploy_check_port(new_port):
                 _w(f" {A.YEL}Warning: port {new_port} is already in use by another process{A.RST}\n")
                 _w(f" {A.CYN}Continue anyway? [y/N]:{A.RST} ")
-                _fl()
-                try:
-                    _pc = input().strip().lower()
-                except (EOFError, KeyboardInterrupt, OSError):
-                    continue
-                if _pc not in ("y", "yes"):
+                if not _confirm_key():
                     continue
 
             _w(f"\n  {A.CYN}1{A.RST}. TCP\n")
@@ -7831,15 +8944,13 @@ async def _tui_connection_manager(args):
                 if not _xbin:
                     _w(f" {A.RED}REALITY requires xray binary for key generation.{A.RST}\n")
                     _w(f" {A.DIM}Falling back to no security. Use Deploy for REALITY.{A.RST}\n")
-                    _fl()
-                    time.sleep(1.5)
+                    _pause(1.5)
                     security = "none"
                 else:
                     _reality_priv, _reality_pub = deploy_generate_reality_keys(_xbin)
                     if not _reality_priv:
                         _w(f" {A.RED}Key generation failed. Falling back to none.{A.RST}\n")
-                        _fl()
-                        time.sleep(1.5)
+                        _pause(1.5)
                         security = "none"
                     else:
                         _reality_sid = deploy_generate_short_id()
@@ -7875,7 +8986,7 @@ async def _tui_connection_manager(args):
                 "protocol": protocol,
                 "settings": {},
                 "streamSettings": {"network": transport, "security": security},
-                "sniffing": {"enabled": True, "destOverride": ["http", "tls", "quic"]},
+                "sniffing": {"enabled": True, "destOverride": _SNIFFING_DEST_OVERRIDE},
             }
 
             # Client
@@ -7928,68 +9039,26 @@ async def _tui_connection_manager(args):
                 config = {
                     "log": {"loglevel": "warning"},
                     "inbounds": [],
-                    "outbounds": [
-                        {"tag": "direct", "protocol": "freedom"},
-                        {"tag": "block", "protocol": "blackhole"},
-                    ],
-                    "routing": {
-                        "domainStrategy": "AsIs",
-                        "rules": [{"type": "field", "ip": ["geoip:private"], "outboundTag": "block"}],
-                    },
+                    "outbounds": _SERVER_OUTBOUNDS,
+                    "routing": _SERVER_ROUTING,
                 }
                 inbounds = config["inbounds"]
 
-            _add_ok = False
             inbounds.append(new_inbound)
-            if _write_server_config(config):
-                ok, msg = _restart_xray_service()
-                _w(f"\n {A.GRN}Inbound added: {protocol}:{new_port} ({transport}/{security}){A.RST}\n")
-                if not ok:
-                    _w(f" {A.YEL}Warning: {msg}{A.RST}\n")
-                _add_ok = True
+            _staged = config
+            _pending += 1
+            _w(f"\n {A.GRN}Inbound added: {protocol}:{new_port} ({transport}/{security}){A.RST}\n")
+            _w(f" {A.DIM}Staged - press W in the menu to write & restart xray.{A.RST}\n")
+
+            # Generate and display client URI for the new inbound
+            _cm_server_ip = _cached_server_ip() or "<server-ip>"
+            # ws+REALITY: the client's Host header is the REALITY SNI
+            _client_uri = _cm_build_client_uri(new_inbound, new_uuid, _cm_server_ip, ws_host=_rsni)
+            if _client_uri:
+                _w(f"\n {A.BOLD}{A.CYN}Client URI:{A.RST}\n")
+                _w(f" {A.GRN}{_client_uri}{A.RST}\n")
             else:
-                inbounds.pop()
-                _w(f"\n {A.RED}Failed to write config (run as root?){A.RST}\n")
-
-            # Generate and display client URI after successful add
-            if _add_ok:
-                if not _cm_server_ip:
-                    _cm_server_ip = deploy_detect_server_ip() or "<server-ip>"
-                _uri_sni = _rsni or ""
-                _uri_parsed = {
-                    "protocol": protocol,
-                    "address": _cm_server_ip,
-                    "port": new_port,
-                    "uuid": new_uuid,
-                    "type": transport,
-                    "security": security,
-                    "fp": "chrome",
-                }
-                if transport == "ws":
-                    _uri_parsed["path"] = "/ws"
-                    _uri_parsed["host"] = _uri_sni
-                elif transport in ("xhttp", "splithttp"):
-                    _uri_parsed["type"] = "xhttp"
-                    _uri_parsed["path"] = "/xhttp"
-                elif transport == "grpc":
-                    _uri_parsed["serviceName"] = "grpc"
-                elif transport in ("h2", "http"):
-                    _uri_parsed["path"] = "/h2"
-                if security == "reality" and _reality_pub:
-                    _uri_parsed["pbk"] = _reality_pub
-                    _uri_parsed["sid"] = _reality_sid
-                    _uri_parsed["sni"] = _rsni
-                    if protocol == "vless" and transport == "tcp":
-                        _uri_parsed["flow"] = "xtls-rprx-vision"
-                elif security == "tls":
-                    _uri_parsed["sni"] = _uri_sni
-                _uri_tag = f"cfray-{protocol}-{new_port}"
-                try:
-                    _client_uri = _build_uri(_uri_parsed, _uri_sni, _uri_tag)
-                    _w(f"\n {A.BOLD}{A.CYN}Client URI:{A.RST}\n")
-                    _w(f" {A.GRN}{_client_uri}{A.RST}\n")
-                except (KeyError, ValueError, TypeError) as _uri_err:
-                    _w(f" {A.DIM}(Could not generate client URI: {_uri_err}){A.RST}\n")
+                _w(f" {A.DIM}(Could not generate client URI){A.RST}\n")
 
             _w(f"\n {A.DIM}Press any key to continue...{A.RST}\n")
             _fl()
@@ -8034,6 +9103,17 @@ export default {{
 }};"""
 
 
+_WORKER_DEPLOY_STEPS = (
+    f" {A.BOLD}Deploy instructions:{A.RST}\n\n"
+    f"   {A.WHT}1.{A.RST} Go to {A.CYN}dash.cloudflare.com{A.RST} -> Workers & Pages -> Create\n"
+    f"   {A.WHT}2.{A.RST} Click {A.WHT}\"Create Worker\"{A.RST}, name it anything\n"
+    f"   {A.WHT}3.{A.RST} Click {A.WHT}\"Deploy\"{A.RST}, then {A.WHT}\"Edit Code\"{A.RST}\n"
+    f"   {A.WHT}4.{A.RST} Delete all default code, paste the script above\n"
+    f"   {A.WHT}5.{A.RST} Click {A.WHT}\"Deploy\"{A.RST} again\n"
+    f"   {A.WHT}6.{A.RST} Copy your Worker URL (e.g. {A.GRN}my-proxy.username.workers.dev{A.RST})\n\n"
+)
+
+
 async def _tui_worker_proxy(args):
     """Worker Proxy — paste any VLESS URI, deploy a CF Worker, run pipeline
     with ALL CF SNIs enabled.
@@ -8043,9 +9123,8 @@ async def _tui_worker_proxy(args):
     sits in its own zone (*.workers.dev); the Worker rewrites Host to the
     origin domain and proxies internally.  Result: every CF SNI works.
     """
-    enable_ansi()
     _w(A.CLR + A.HOME + A.SHOW)
-    cols, _ = term_size()
+    cols, _ = _cached_term_size()
     W = cols - 2
 
     _w(f"\n{A.CYN}{'=' * (W + 2)}{A.RST}\n")
@@ -8063,11 +9142,12 @@ async def _tui_worker_proxy(args):
     _w(f" {A.DIM}(a full vless://... URI){A.RST}\n ")
     _fl()
     try:
-        uri = input().strip()
+        uri = (await _ainput()).strip()
     except (EOFError, KeyboardInterrupt, OSError):
         return
     if not uri:
         _w(f"\n {A.RED}Cancelled.{A.RST}\n")
+        _fl()
         time.sleep(1)
         return
 
@@ -8103,17 +9183,10 @@ async def _tui_worker_proxy(args):
     _w(f" {A.BOLD}{A.CYN}[2/3]{A.RST} {A.BOLD}Worker script generated:{A.RST}\n\n")
     script = _worker_proxy_generate_script(origin_host, origin_port, security)
     _w(f" {A.DIM}{'-' * (W - 2)}{A.RST}\n")
-    for line in script.split("\n"):
-        _w(f" {A.WHT}{line}{A.RST}\n")
+    _w(f" {A.WHT}" + script.replace("\n", f"{A.RST}\n {A.WHT}") + f"{A.RST}\n")
     _w(f" {A.DIM}{'-' * (W - 2)}{A.RST}\n\n")
 
-    _w(f" {A.BOLD}Deploy instructions:{A.RST}\n\n")
-    _w(f"   {A.WHT}1.{A.RST} Go to {A.CYN}dash.cloudflare.com{A.RST} -> Workers & Pages -> Create\n")
-    _w(f"   {A.WHT}2.{A.RST} Click {A.WHT}\"Create Worker\"{A.RST}, name it anything\n")
-    _w(f"   {A.WHT}3.{A.RST} Click {A.WHT}\"Deploy\"{A.RST}, then {A.WHT}\"Edit Code\"{A.RST}\n")
-    _w(f"   {A.WHT}4.{A.RST} Delete all default code, paste the script above\n")
-    _w(f"   {A.WHT}5.{A.RST} Click {A.WHT}\"Deploy\"{A.RST} again\n")
-    _w(f"   {A.WHT}6.{A.RST} Copy your Worker URL (e.g. {A.GRN}my-proxy.username.workers.dev{A.RST})\n\n")
+    _w(_WORKER_DEPLOY_STEPS)
 
     # -- Step 3: Get Worker URL --
     _flush_stdin()  # drain stale bytes from multi-line URI paste
@@ -8121,7 +9194,7 @@ async def _tui_worker_proxy(args):
     _w(f" {A.BOLD}{A.CYN}[3/3]{A.RST} {A.YEL}Enter your Worker URL when deployed{A.RST} (or Enter to skip): ")
     _fl()
     try:
-        worker_url = input().strip()
+        worker_url = (await _ainput()).strip()
     except (EOFError, KeyboardInterrupt, OSError):
         return
 
@@ -8148,6 +9221,7 @@ async def _tui_worker_proxy(args):
     new_parsed["sni"] = worker_url
     new_parsed["port"] = 443
     new_parsed["security"] = "tls"
+    new_parsed["name"] = "Worker-Proxy"
     new_uri = build_vless_uri(new_parsed, worker_url, "Worker-Proxy")
 
     _w(f"\n {A.BOLD}New config URI:{A.RST}\n")
@@ -8162,39 +9236,36 @@ async def _tui_worker_proxy(args):
     _w(f" {A.YEL}Run pipeline test with ALL SNIs?{A.RST} [Y/n]: ")
     _fl()
     try:
-        ans = input().strip().lower()
+        ans = (await _ainput()).strip().lower()
     except (EOFError, KeyboardInterrupt, OSError):
         ans = "n"
 
     if ans in ("", "y", "yes"):
-        re_parsed = parse_vless_full(new_uri)
-        if re_parsed:
-            # CF zone matching applies to Workers too — only the Worker URL
-            # works as SNI (it's in the workers.dev zone).  Other CF domains
-            # (discord.com, etc.) return 403 because Host is cross-zone.
-            # The Worker gives you a fresh random *.workers.dev SNI instead
-            # of the original (possibly blocked) domain.
-            pcfg = PipelineConfig(
-                uri=new_uri, parsed=re_parsed,
-                sni_pool=[],
-                frag_preset="all",
-                transport_variants=[],
-                max_expansion=1500,
-            )
-            xray_bin = xray_find_binary(getattr(args, "xray_bin", None))
-            if not xray_bin:
-                _w(f" {A.YEL}Xray not found. Installing...{A.RST}\n")
-                _fl()
-                xray_bin = xray_install()
-            if xray_bin:
-                xst = XrayTestState()
-                xdash = await _run_pipeline_core(xst, pcfg, xray_bin)
-                await _post_pipeline_results(xst, xdash, args)
-                return  # interactive loop handles exit
-            else:
-                _w(f"   {A.RED}Could not find/install xray-core{A.RST}\n")
+        # CF zone matching applies to Workers too — only the Worker URL
+        # works as SNI (it's in the workers.dev zone).  Other CF domains
+        # (discord.com, etc.) return 403 because Host is cross-zone.
+        # The Worker gives you a fresh random *.workers.dev SNI instead
+        # of the original (possibly blocked) domain.
+        # new_parsed is exactly what parsing new_uri back would give
+        pcfg = PipelineConfig(
+            uri=new_uri, parsed=new_parsed,
+            sni_pool=[],
+            frag_preset="all",
+            transport_variants=[],
+            max_expansion=1500,
+        )
+        xray_bin = xray_find_binary(getattr(args, "xray_bin", None))
+        if not xray_bin:
+            _w(f" {A.YEL}Xray not found. Installing...{A.RST}\n")
+            _fl()
+            xray_bin = xray_install()
+        if xray_bin:
+            xst = XrayTestState()
+            xdash = await _run_pipeline_core(xst, pcfg, xray_bin)
+            await _post_pipeline_results(xst, xdash, args)
+            return  # interactive loop handles exit
         else:
-            _w(f"   {A.RED}Failed to parse generated URI{A.RST}\n")
+            _w(f"   {A.RED}Could not find/install xray-core{A.RST}\n")
 
     _w(f"\n {A.DIM}Press any key to go back...{A.RST}\n")
     _fl()
@@ -8204,12 +9275,94 @@ async def _tui_worker_proxy(args):
 # ─── End Worker Proxy ─────────────────────────────────────────────────────────
 
 
+@functools.lru_cache(maxsize=2048)
+def _score_cell(v: float) -> str:
+    """Coloured score cell; scores repeat across rows and frames, so memoized."""
+    if v >= 70:
+        return f"{A.GRN}{v:5.1f}{A.RST}"
+    if v >= 40:
+        return f"{A.YEL}{v:5.1f}{A.RST}"
+    if v > 0:
+        return f"{A.RED}{v:5.1f}{A.RST}"
+    return f"{A.DIM}    -{A.RST}"
+
+
+@functools.lru_cache(maxsize=2048)
+def _speed_cell(v: float) -> str:
+    """Coloured MB/s cell (KB/s below 1 MB/s), memoized like _score_cell."""
+    if v <= 0:
+        return f"{A.DIM}     -{A.RST}"
+    if v >= 1:
+        return f"{A.GRN}{v:5.1f}{A.RST}"
+    return f"{A.YEL}{v * 1000:4.0f}K{A.RST}"
+
+
 class Dashboard:
+    _TITLE = f" {A.BOLD}{A.WHT}CF Config Scanner{A.RST}"
+    _TITLE_VL = _vl(_TITLE)
+
     def __init__(self, st: State):
         self.st = st
         self.sort = "score"
         self.offset = 0
         self.show_domains = False
+        # ip -> (row inputs, styled row, visible width); only rows whose inputs changed
+        # since the last frame are formatted again
+        self._row_cache: Dict[str, Tuple[tuple, str, int]] = {}
+        self._prev_lines: List[str] = []  # last frame on screen, for diffing
+        self._prev_size: Tuple[int, int] = (0, 0)
+        self._last_sig: Optional[tuple] = None  # inputs of the frame on screen
+        self._rounds_cached: Optional[tuple] = None
+        self._templates(st.rounds, tuple((rc.size, rc.keep) for rc in st.rounds))
+        self._sorted_key: Optional[tuple] = None
+        self._sorted: List[Result] = []
+
+    def invalidate(self):
+        """Force the next draw() to repaint the whole screen."""
+        self._prev_lines = []
+        self._last_sig = None
+
+    def sorted_results(self) -> List[Result]:
+        """sorted_all() for the current sort key, reused once the scan is over.
+
+        While scanning, results change in place every frame, so the list is
+        rebuilt; after st.finished it only changes with the sort key or a
+        calc_scores() pass.
+        """
+        s = self.st
+        key = (self.sort, s.sort_version, len(s.res))
+        if not s.finished or key != self._sorted_key:
+            self._sorted = sorted_all(s, self.sort)
+            self._sorted_key = key if s.finished else None
+        return self._sorted
+
+    def _templates(self, rounds: List[RoundCfg], key: tuple):
+        """Build the round labels and the table header, separator and row
+        templates; `key` is the rounds' (size, keep) pairs."""
+        if key == self._rounds_cached:
+            return
+        self._rounds_cached = key
+        n_rounds = len(rounds)
+        self._round_lbls = [f"{f'Speed R{i + 1} ({rc.label}x{rc.keep})':<18}"
+                            for i, rc in enumerate(rounds)]
+        self._alive_tpl = " {rank:>3}  {ip:<16} {dom:>3}  {tcp}  {tls}{speeds}  {cl}  {score}"
+        self._dead_tpl = (
+            f" {A.DIM}{{rank:>3}}  {{ip:<16}} {{dom:>3}}  {A.RED}{'dead':>6}{A.RST}{A.DIM}  {'':>6}"
+            + f"  {'':>5}" * n_rounds
+            + f"  {'':>4}  {A.RED}{'--':>5}{A.RST}"
+        )
+        self._header_tpl = (
+            f" {A.BOLD}{'#':>3}  {'IP':<16} {'Dom':>3}  {'Ping':>6}  {'Conn':>6}"
+            + "".join(f"  {'R' + str(i + 1):>5}" for i in range(n_rounds))
+            + f"  {'Colo':>4}  {'Score':>5}{A.RST}"
+        )
+        self._sep_tpl = (
+            f"{A.DIM} {'─' * 3}  {'─' * 16} {'─' * 3}  {'─' * 6}  {'─' * 6}"
+            + f"  {'─' * 5}" * n_rounds
+            + f"  {'─' * 4}  {'─' * 5}{A.RST}"
+        )
+        self._header_vl = _vl(self._header_tpl)
+        self._sep_vl = _vl(self._sep_tpl)
 
     def _bar(self, cur: int, tot: int, w: int = 24) -> str:
         if tot == 0:
@@ -8218,45 +9371,68 @@ class Dashboard:
         f = int(w * p)
         return f"{A.GRN}{'█' * f}{A.DIM}{'░' * (w - f)}{A.RST}"
 
-    def _cscore(self, v: float) -> str:
-        if v >= 70:
-            return f"{A.GRN}{v:5.1f}{A.RST}"
-        if v >= 40:
-            return f"{A.YEL}{v:5.1f}{A.RST}"
-        if v > 0:
-            return f"{A.RED}{v:5.1f}{A.RST}"
-        return f"{A.DIM}    -{A.RST}"
-
-    def _speed_str(self, v: float) -> str:
-        if v <= 0:
-            return f"{A.DIM}     -{A.RST}"
-        if v >= 1:
-            return f"{A.GRN}{v:5.1f}{A.RST}"
-        return f"{A.YEL}{v * 1000:4.0f}K{A.RST}"
+    def _row(self, r: Result, rank: int, n_rounds: int) -> str:
+        """Styled table row for one result."""
+        if not r.alive:
+            return self._dead_tpl.format(rank=rank, ip=r.ip, dom=len(r.domains))
+        dash = f"{A.DIM}    -{A.RST}"
+        sp = r.speeds
+        return self._alive_tpl.format(
+            rank=rank, ip=r.ip, dom=len(r.domains),
+            tcp=f"{r.tcp_ms:6.0f}" if r.tcp_ms > 0 else f"{A.DIM}     -{A.RST}",
+            tls=f"{r.tls_ms:6.0f}" if r.tls_ms > 0 else f"{A.DIM}     -{A.RST}",
+            speeds="".join(
+                "  " + (_speed_cell(sp[j]) if j < len(sp) and sp[j] > 0 else dash)
+                for j in range(n_rounds)
+            ),
+            cl=f"{r.colo:>4}" if r.colo else f"{A.DIM}   -{A.RST}",
+            score=_score_cell(r.score),
+        )
 
-    def draw(self):
-        cols, rows = term_size()
+    def draw(self, now: Optional[float] = None):
+        """Render a frame; `now` is a time.monotonic() reading the caller
+        already has (the refresh loop passes its event-loop clock)."""
+        if now is None:
+            now = time.monotonic()
+        cols, rows = _cached_term_size()
         W = cols - 2
         s = self.st
+        elapsed = _fmt_elapsed(now - s.start_time) if s.start_time else "0s"
+        notify = s.notify if s.notify and now < s.notify_until else ""
+        rounds_key = tuple((rc.size, rc.keep) for rc in s.rounds)
+        # Everything the frame shows; probes update results and counters
+        # together, so an unchanged signature means an unchanged screen.
+        sig = (cols, rows, elapsed, notify, s.phase, s.phase_label, s.cur_round,
+               s.total, s.done_count, s.alive_n, s.dead_n, s.best_speed,
+               s.latency_cut_n, s.finished, s.sort_version, len(s.res),
+               rounds_key, self.sort, self.offset)
+        if sig == self._last_sig:
+            return
+        self._last_sig = sig
+        self._templates(s.rounds, rounds_key)
         vis = max(3, rows - 18 - len(s.rounds))
         out: List[str] = []
 
-        def bx(c: str):
-            out.append(f"{A.CYN}║{A.RST}" + c + " " * max(0, W - _vl(c)) + f"{A.CYN}║{A.RST}")
+        def bx(c: str, vl: Optional[int] = None):
+            if vl is None:
+                vl = _vl(c)
+            if vl > W:  # keep one screen row per line so the diff repaint lines up
+                c = _vtrunc(c, W) + A.RST
+                vl = W
+            out.append(f"{A.CYN}║{A.RST}" + c + _rep(" ", W - vl) + f"{A.CYN}║{A.RST}")
 
-        out.append(f"{A.CYN}╔{'═' * W}╗{A.RST}")
-        elapsed = _fmt_elapsed(time.monotonic() - s.start_time) if s.start_time else "0s"
-        title = f" {A.BOLD}{A.WHT}CF Config Scanner{A.RST}"
+        out.append(f"{A.CYN}╔{_rep('═', W)}╗{A.RST}")
         right = f"{A.DIM}{elapsed}  |  {s.mode}  |  ^C stop{A.RST}"
-        bx(title + " " * max(1, W - _vl(title) - _vl(right)) + right)
-        out.append(f"{A.CYN}╠{'═' * W}╣{A.RST}")
+        gap = max(1, W - self._TITLE_VL - _vl(right))
+        bx(self._TITLE + _rep(" ", gap) + right, self._TITLE_VL + gap + _vl(right))
+        out.append(f"{A.CYN}╠{_rep('═', W)}╣{A.RST}")
 
         fname = os.path.basename(s.input_file)
         info = f" {A.DIM}File:{A.RST} {fname}   {A.DIM}Configs:{A.RST} {len(s.configs)}   {A.DIM}Unique IPs:{A.RST} {len(s.ips)}"
         if s.latency_cut_n > 0:
             info += f"   {A.DIM}Cut:{A.RST} {s.latency_cut_n}"
         bx(info)
-        out.append(f"{A.CYN}╠{'═' * W}╣{A.RST}")
+        out.append(f"{A.CYN}╠{_rep('═', W)}╣{A.RST}")
 
         bw = min(24, W - 55)
 
@@ -8269,22 +9445,19 @@ class Dashboard:
         else:
             bx(f" {A.DIM}○ Latency          waiting...{A.RST}")
 
-        for i, rc in enumerate(s.rounds):
-            rn = i + 1
-            lbl = f"Speed R{rn} ({rc.label}x{rc.keep})"
+        for rn, lbl in enumerate(self._round_lbls, 1):
             if s.cur_round == rn and s.phase.startswith("speed") and not s.finished:
                 pct = s.done_count * 100 // max(1, s.total)
-                bx(f" {A.GRN}▶{A.RST} {A.BOLD}{lbl:<18}{A.RST}[{self._bar(s.done_count, s.total, bw)}] {s.done_count}/{s.total}  {pct}%")
+                bx(f" {A.GRN}▶{A.RST} {A.BOLD}{lbl}{A.RST}[{self._bar(s.done_count, s.total, bw)}] {s.done_count}/{s.total}  {pct}%")
             elif s.cur_round > rn or (s.cur_round >= rn and s.finished):
-                bx(f" {A.GRN}✓{A.RST} {lbl:<18}{A.GRN}done{A.RST}")
+                bx(f" {A.GRN}✓{A.RST} {lbl}{A.GRN}done{A.RST}")
             else:
-                bx(f" {A.DIM}○ {lbl:<18}waiting...{A.RST}")
+                bx(f" {A.DIM}○ {lbl}waiting...{A.RST}")
 
-        out.append(f"{A.CYN}╠{'═' * W}╣{A.RST}")
+        out.append(f"{A.CYN}╠{_rep('═', W)}╣{A.RST}")
         parts = []
         if s.alive_n > 0:
-            alats = [r.tls_ms for r in s.res.values() if r.alive and r.tls_ms > 0]
-            avg_lat = statistics.mean(alats) if alats else 0
+            avg_lat = s.alive_tls_sum / s.alive_n
             parts.append(f"{A.GRN}● {s.alive_n}{A.RST} alive")
             parts.append(f"{A.RED}● {s.dead_n}{A.RST} dead")
             if avg_lat:
@@ -8293,54 +9466,35 @@ class Dashboard:
                 parts.append(f"{A.CYN}best:{A.RST} {s.best_speed:.2f} MB/s")
         bx(" " + "   ".join(parts) if parts else " ")
 
-        out.append(f"{A.CYN}╠{'═' * W}╣{A.RST}")
+        out.append(f"{A.CYN}╠{_rep('═', W)}╣{A.RST}")
 
-        hdr = f" {A.BOLD}{'#':>3}  {'IP':<16} {'Dom':>3}  {'Ping':>6}  {'Conn':>6}"
-        for i, rc in enumerate(s.rounds):
-            hdr += f"  {'R' + str(i + 1):>5}"
-        hdr += f"  {'Colo':>4}  {'Score':>5}{A.RST}"
-        bx(hdr)
+        bx(self._header_tpl, self._header_vl)
+        bx(self._sep_tpl, self._sep_vl)
 
-        sep = f" {'─' * 3}  {'─' * 16} {'─' * 3}  {'─' * 6}  {'─' * 6}"
-        for _ in s.rounds:
-            sep += f"  {'─' * 5}"
-        sep += f"  {'─' * 4}  {'─' * 5}"
-        bx(f"{A.DIM}{sep}{A.RST}")
-
-        results = sorted_all(s, self.sort)
+        results = self.sorted_results()
         total_results = len(results)
         page = results[self.offset : self.offset + vis]
 
+        n_rounds = len(s.rounds)
+        prev_rows, row_cache = self._row_cache, {}
         for rank, r in enumerate(page, self.offset + 1):
-            if not r.alive:
-                row = f" {A.DIM}{rank:>3}  {r.ip:<16} {len(r.domains):>3}  {A.RED}{'dead':>6}{A.RST}{A.DIM}  {'':>6}"
-                for j in range(len(s.rounds)):
-                    row += f"  {'':>5}"
-                row += f"  {'':>4}  {A.RED}{'--':>5}{A.RST}"
-                bx(row)
-                continue
-            tcp = f"{r.tcp_ms:6.0f}" if r.tcp_ms > 0 else f"{A.DIM}     -{A.RST}"
-            tls = f"{r.tls_ms:6.0f}" if r.tls_ms > 0 else f"{A.DIM}     -{A.RST}"
-            row = f" {rank:>3}  {r.ip:<16} {len(r.domains):>3}  {tcp}  {tls}"
-            for j in range(len(s.rounds)):
-                if j < len(r.speeds) and r.speeds[j] > 0:
-                    row += f"  {self._speed_str(r.speeds[j])}"
-                else:
-                    row += f"  {A.DIM}    -{A.RST}"
-            if r.colo:
-                cl = f"{r.colo:>4}"
-            else:
-                cl = f"{A.DIM}   -{A.RST}"
-            row += f"  {cl}  {self._cscore(r.score)}"
-            bx(row)
+            key = (rank, n_rounds, r.alive, len(r.domains), r.tcp_ms, r.tls_ms,
+                   tuple(r.speeds), r.colo, r.score)
+            hit = prev_rows.get(r.ip)
+            if hit is None or hit[0] != key:
+                row = self._row(r, rank, n_rounds)
+                hit = (key, row, _vl(row))
+            row_cache[r.ip] = hit
+            bx(hit[1], hit[2])
+        self._row_cache = row_cache
 
         for _ in range(vis - len(page)):
-            bx("")
+            bx("", 0)
 
-        out.append(f"{A.CYN}╠{'═' * W}╣{A.RST}")
+        out.append(f"{A.CYN}╠{_rep('═', W)}╣{A.RST}")
 
-        if s.notify and time.monotonic() < s.notify_until:
-            bx(f" {A.GRN}{A.BOLD}{s.notify}{A.RST}")
+        if notify:
+            bx(f" {A.GRN}{A.BOLD}{notify}{A.RST}")
         elif s.finished:
             sort_hint = f"sort:{A.BOLD}{self.sort}{A.RST}"
             page_hint = f"{self.offset + 1}-{min(self.offset + vis, total_results)}/{total_results}"
@@ -8363,17 +9517,28 @@ class Dashboard:
         else:
             bx(f" {A.DIM}{s.phase_label}...  Press Ctrl+C to stop and export partial results{A.RST}")
 
-        out.append(f"{A.CYN}╚{'═' * W}╝{A.RST}")
+        out.append(f"{A.CYN}╚{_rep('═', W)}╝{A.RST}")
 
-        _w(A.HOME)
-        _w("\n".join(out) + "\n")
-        _fl()
+        prev = self._prev_lines
+        if not prev or self._prev_size != (cols, rows):
+            _wframe_lines(out, A.CLR)
+        else:
+            # Same diff repaint as XrayDashboard.draw: only changed rows,
+            # each cleared before it is written so the border survives
+            buf = [f"\033[{i + 1};1H\033[2K{ln}"
+                   for i, ln in enumerate(out) if i >= len(prev) or prev[i] != ln]
+            if len(out) < len(prev):
+                buf.append(f"\033[{len(out) + 1};1H\033[J")
+            if buf:
+                _wframe("".join(buf))
+        self._prev_lines = out
+        self._prev_size = (cols, rows)
 
     def draw_domain_popup(self, r: Result):
         """Show domains for the selected IP."""
-        _w(A.CLR)
+        self.invalidate()
         cols, rows = term_size()
-        vis = min(len(r.domains), rows - 10)
+        vis = min(len(r.domains), max(0, rows - 10))
         lines = []
         lines.append(f"{A.CYN}╔{'═' * (cols - 2)}╗{A.RST}")
         lines.append(draw_box_line(f" {A.BOLD}Domains for {r.ip}  ({len(r.domains)} total){A.RST}", cols))
@@ -8381,21 +9546,18 @@ class Dashboard:
         conn_s = f"{r.tls_ms:.0f}ms" if r.tls_ms > 0 else "-"
         lines.append(draw_box_line(f" {A.DIM}Score: {r.score:.1f}  |  Ping: {ping_s}  |  Conn: {conn_s}{A.RST}", cols))
         lines.append(draw_box_sep(cols))
-        for d in r.domains[:vis]:
-            lines.append(draw_box_line(f"  {d}", cols))
+        lines.extend(draw_box_line(f"  {d}", cols) for d in itertools.islice(r.domains, vis))
         if len(r.domains) > vis:
             lines.append(draw_box_line(f"  {A.DIM}...and {len(r.domains) - vis} more{A.RST}", cols))
         lines.append(draw_box_sep(cols))
         lines.append(draw_box_line(f" {A.DIM}Press any key to go back{A.RST}", cols))
         lines.append(draw_box_bottom(cols))
-        _w("\n".join(lines) + "\n")
-        _fl()
-        _wait_any_key()
-        _w(A.CLR)  # clear before dashboard redraws
+        _wframe_lines(lines, A.CLR)
+        _wait_any_key()  # next draw() repaints from a cleared screen
 
     def draw_config_popup(self, r: Result):
         """Show all VLESS/VMess URIs for the selected IP."""
-        _w(A.CLR)
+        self.invalidate()
         cols, rows = term_size()
         lines = []
         lines.append(f"{A.CYN}╔{'═' * (cols - 2)}╗{A.RST}")
@@ -8408,13 +9570,11 @@ class Dashboard:
         ))
         lines.append(draw_box_sep(cols))
         if r.uris:
-            max_show = rows - 10
-            for i, uri in enumerate(r.uris[:max_show]):
-                # Truncate long URIs to fit terminal width
+            max_show = max(0, rows - 10)
+            max_uri = cols - 8  # truncate long URIs to fit terminal width
+            for i, uri in enumerate(itertools.islice(r.uris, max_show)):
                 tag = f" {A.CYN}{i+1}.{A.RST} "
-                max_uri = cols - 8
-                display = uri if len(uri) <= max_uri else uri[:max_uri - 3] + "..."
-                lines.append(draw_box_line(f"{tag}{A.GRN}{display}{A.RST}", cols))
+                lines.append(draw_box_line(f"{tag}{A.GRN}{_ellipsize(uri, max_uri)}{A.RST}", cols))
             if len(r.uris) > max_show:
                 lines.append(draw_box_line(f"  {A.DIM}...and {len(r.uris) - max_show} more{A.RST}", cols))
         else:
@@ -8423,14 +9583,12 @@ class Dashboard:
         lines.append(draw_box_sep(cols))
         lines.append(draw_box_line(f" {A.DIM}Press any key to go back{A.RST}", cols))
         lines.append(draw_box_bottom(cols))
-        _w("\n".join(lines) + "\n")
-        _fl()
-        _wait_any_key()
-        _w(A.CLR)
+        _wframe_lines(lines, A.CLR)
+        _wait_any_key()  # next draw() repaints from a cleared screen
 
     def draw_help_popup(self):
         """Show keybinding help + column explanations overlay."""
-        _w(A.CLR)
+        self.invalidate()
         cols, rows = term_size()
         W = min(64, cols - 4)
         lines = []
@@ -8476,10 +9634,8 @@ class Dashboard:
         lines.append(f"  {A.CYN}{'=' * W}{A.RST}")
         lines.append(f"  {A.DIM}Press any key to go back{A.RST}")
 
-        _w("\n".join(lines) + "\n")
-        _fl()
-        _wait_any_key()
-        _w(A.CLR)  # clear before dashboard redraws
+        _wframe_lines(lines, A.CLR)
+        _wait_any_key()  # next draw() repaints from a cleared screen
 
     def handle(self, key: str) -> Optional[str]:
         sorts = ["score", "latency", "speed"]
@@ -8487,17 +9643,17 @@ class Dashboard:
             idx = sorts.index(self.sort) if self.sort in sorts else 0
             self.sort = sorts[(idx + 1) % len(sorts)]
         elif key in ("j", "down"):
-            self.offset = min(self.offset + 1, max(0, len(sorted_all(self.st, self.sort)) - 3))
+            self.offset = min(self.offset + 1, max(0, len(self.st.res) - 3))
         elif key in ("k", "up"):
             self.offset = max(0, self.offset - 1)
         elif key == "n":
             # page down
-            _, rows = term_size()
+            _, rows = _cached_term_size()
             page = max(3, rows - 18 - len(self.st.rounds))
-            self.offset = min(self.offset + page, max(0, len(sorted_all(self.st, self.sort)) - 3))
+            self.offset = min(self.offset + page, max(0, len(self.st.res) - 3))
         elif key == "p":
             # page up
-            _, rows = term_size()
+            _, rows = _cached_term_size()
             page = max(3, rows - 18 - len(self.st.rounds))
             self.offset = max(0, self.offset - page)
         elif key == "e":
@@ -8517,85 +9673,86 @@ class Dashboard:
         return None
 
 
-def save_csv(st: State, path: str, sort_by: str = "score"):
-    results = sorted_alive(st, sort_by)
+def _csv_num(v: float, spec: str = ".1f") -> str:
+    """CSV cell for a measurement: formatted when positive, blank otherwise."""
+    return format(v, spec) if v > 0 else ""
+
+
+def save_csv(st: State, path: str, sort_by: str = "score",
+             results: Optional[List[Result]] = None):
+    if results is None:
+        results = sorted_alive(st, sort_by)
+    n_rounds = len(st.rounds)
+    hdr = ["Rank", "IP", "Domains", "Domain_Count", "Ping_ms", "Conn_ms", "TTFB_ms"]
+    for i, rc in enumerate(st.rounds):
+        hdr.append(f"R{i + 1}_{rc.label}_MBps")
+    hdr += ["Best_MBps", "Colo", "Score", "Error"]
+    rows = [hdr]
+    for rank, r in enumerate(results, 1):
+        sp = r.speeds
+        rows.append([
+            rank,
+            r.ip,
+            "|".join(r.domains[:5]),
+            len(r.domains),
+            _csv_num(r.tcp_ms),
+            _csv_num(r.tls_ms),
+            _csv_num(r.ttfb_ms),
+            *[_csv_num(sp[i], ".3f") if i < len(sp) else "" for i in range(n_rounds)],
+            _csv_num(r.best_mbps, ".3f"),
+            r.colo,
+            f"{r.score:.1f}",
+            r.error,
+        ])
+    buf = io.StringIO(newline="")
+    csv.writer(buf).writerows(rows)
     with open(path, "w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        hdr = ["Rank", "IP", "Domains", "Domain_Count", "Ping_ms", "Conn_ms", "TTFB_ms"]
-        for i, rc in enumerate(st.rounds):
-            hdr.append(f"R{i + 1}_{rc.label}_MBps")
-        hdr += ["Best_MBps", "Colo", "Score", "Error"]
-        w.writerow(hdr)
-        for rank, r in enumerate(results, 1):
-            row = [
-                rank,
-                r.ip,
-                "|".join(r.domains[:5]),
-                len(r.domains),
-                f"{r.tcp_ms:.1f}" if r.tcp_ms > 0 else "",
-                f"{r.tls_ms:.1f}" if r.tls_ms > 0 else "",
-                f"{r.ttfb_ms:.1f}" if r.ttfb_ms > 0 else "",
-            ]
-            for i in range(len(st.rounds)):
-                row.append(
-                    f"{r.speeds[i]:.3f}"
-                    if i < len(r.speeds) and r.speeds[i] > 0
-                    else ""
-                )
-            row += [
-                f"{r.best_mbps:.3f}" if r.best_mbps > 0 else "",
-                r.colo,
-                f"{r.score:.1f}",
-                r.error,
-            ]
-            w.writerow(row)
+        f.write(buf.getvalue())  # one write, not one per buffer-full of rows
+
 
+def _ip_ref_line(r: Result) -> str:
+    """Reference line for JSON input, which has no URIs: IP, score and domains."""
+    doms = ", ".join(r.domains[:3])
+    extra = f" (+{len(r.domains) - 3} more)" if len(r.domains) > 3 else ""
+    return f"{r.ip}  # score={r.score:.1f} domains={doms}{extra}"
+
+
+def _write_lines(path: str, lines: List[str]):
+    """Write lines to path, newline-terminated, in a single write call."""
+    with open(path, "w", encoding="utf-8") as f:
+        if lines:
+            f.write("\n".join(lines) + "\n")
 
-def save_configs(st: State, path: str, top: int = 50, sort_by: str = "score"):
+
+def save_configs(st: State, path: str, top: int = 50, sort_by: str = "score",
+                 results: Optional[List[Result]] = None):
     """Save top configs. Use top=0 for ALL configs sorted best to worst."""
-    results = sorted_alive(st, sort_by)
+    if results is None:
+        results = sorted_alive(st, sort_by)
     has_uris = any(r.uris for r in results)
     limit = top if top > 0 else len(results)
-    with open(path, "w", encoding="utf-8") as f:
-        n = 0
-        for r in results:
-            if n >= limit:
-                break
-            if has_uris:
-                for uri in r.uris:
-                    f.write(uri + "\n")
-                    n += 1
-                    if n >= limit:
-                        break
-            else:
-                # JSON input: write IP and domains as a reference list
-                doms = ", ".join(r.domains[:3])
-                extra = f" (+{len(r.domains) - 3} more)" if len(r.domains) > 3 else ""
-                f.write(f"{r.ip}  # score={r.score:.1f} domains={doms}{extra}\n")
-                n += 1
+    if has_uris:
+        uris = itertools.chain.from_iterable(r.uris for r in results)
+        lines = list(itertools.islice(uris, limit))
+    else:
+        lines = [_ip_ref_line(r) for r in results[:limit]]
+    _write_lines(path, lines)
 
 
-def save_all_configs_sorted(st: State, path: str, sort_by: str = "score"):
+def save_all_configs_sorted(st: State, path: str, sort_by: str = "score",
+                            results: Optional[List[Result]] = None):
     """Save ALL raw configs (every URI) sorted by their IP's score, best to worst."""
-    results = sorted_alive(st, sort_by)
+    if results is None:
+        results = sorted_alive(st, sort_by)
     dead = [r for r in st.res.values() if not r.alive]
     has_uris = any(r.uris for r in results)
-    with open(path, "w", encoding="utf-8") as f:
-        for r in results:
-            if has_uris:
-                for uri in r.uris:
-                    f.write(uri + "\n")
-            else:
-                doms = ", ".join(r.domains[:3])
-                extra = f" (+{len(r.domains) - 3} more)" if len(r.domains) > 3 else ""
-                f.write(f"{r.ip}  # score={r.score:.1f} domains={doms}{extra}\n")
-        for r in dead:
-            if has_uris:
-                for uri in r.uris:
-                    f.write(uri + "\n")
-            else:
-                doms = ", ".join(r.domains[:3])
-                f.write(f"{r.ip}  # DEAD domains={doms}\n")
+    if has_uris:
+        lines = [uri for r in results for uri in r.uris]
+        lines += [uri for r in dead for uri in r.uris]
+    else:
+        lines = [_ip_ref_line(r) for r in results]
+        lines += [f"{r.ip}  # DEAD domains={', '.join(r.domains[:3])}" for r in dead]
+    _write_lines(path, lines)
 
 
 RESULTS_DIR = "results"
@@ -8610,6 +9767,7 @@ def _results_path(filename: str) -> str:
 def do_export(
     st: State, base_path: str, sort_by: str = "score", top: int = 50,
     output_csv: str = "", output_configs: str = "",
+    results: Optional[List[Result]] = None,
 ) -> Tuple[str, str, str]:
     stem = os.path.basename(base_path).rsplit(".", 1)[0] if base_path else "scan"
     csv_path = output_csv if output_csv else _results_path(stem + "_results.csv")
@@ -8620,11 +9778,12 @@ def do_export(
     else:
         cfg_path = _results_path(stem + f"_top{top}.txt")
     full_path = _results_path(stem + "_full_sorted.txt")
-    save_csv(st, csv_path, sort_by)
-    save_configs(st, cfg_path, top, sort_by)
-    save_all_configs_sorted(st, full_path, sort_by)
+    # Sorted once (or by the caller) and shared by every export file below
+    results_alive = sorted_alive(st, sort_by) if results is None else results
+    save_csv(st, csv_path, sort_by, results_alive)
+    save_configs(st, cfg_path, top, sort_by, results_alive)
+    save_all_configs_sorted(st, full_path, sort_by, results_alive)
     try:
-        results_alive = sorted_alive(st, sort_by)
         with open(_results_path(stem + "_singbox.json"), "w", encoding="utf-8") as f: f.write(export_singbox_json(results_alive, top))
         with open(_results_path(stem + "_clash.yaml"), "w", encoding="utf-8") as f: f.write(export_clash_meta_yaml(results_alive, top))
         with open(_results_path(stem + "_telegram.txt"), "w", encoding="utf-8") as f: f.write(export_telegram_links(results_alive, top))
@@ -8635,9 +9794,10 @@ def do_export(
 
 
 async def _refresh_loop(dash: Dashboard, st: State):
+    clock = asyncio.get_running_loop().time  # CLOCK_MONOTONIC, as is time.monotonic()
     while not st.finished:
         try:
-            dash.draw()
+            dash.draw(clock())
         except Exception:
             pass
         await asyncio.sleep(0.3)
@@ -8663,10 +9823,7 @@ async def run_scan(st: State, workers: int, speed_workers: int, timeout: float,
 
     preset = PRESETS.get(st.mode, PRESETS["normal"])
 
-    alive = sorted(
-        (ip for ip, r in st.res.items() if r.alive),
-        key=lambda ip: st.res[ip].tls_ms,
-    )
+    alive = [r.ip for r in sorted_alive(st, "latency")]
 
     cut_pct = preset.get("latency_cut", 0)
     if cut_pct > 0 and len(alive) > 50:
@@ -8703,8 +9860,9 @@ async def run_scan(st: State, workers: int, speed_workers: int, timeout: float,
                 st, rc, cands, speed_workers, speed_timeout,
                 rlim=rlim, cdn_host=cdn_host, cdn_path=cdn_path,
             )
-            calc_scores(st)
 
+    # Scores for round i are computed once: by the next round's candidate
+    # ranking, or by this final pass after the last round
     st.finished = True
     calc_scores(st)
     if getattr(st, "geo_tag", False):
@@ -8723,6 +9881,19 @@ def attach_state_args(st: State, args):
     st.measure_jitter = getattr(args, "jitter", False)
 
 
+def state_from_args(args, input_file: str = "", mode: str = "") -> State:
+    """Fresh State with mode, rounds and option flags taken from args."""
+    st = State()
+    st.input_file = input_file
+    st.mode = mode or args.mode
+    attach_state_args(st, args)
+    if args.rounds:
+        st.rounds = parse_rounds_str(args.rounds)
+    elif args.skip_download:
+        st.rounds = []
+    return st
+
+
 async def _tui_warp_gen(args):
     _w(A.CLR + A.HOME + A.SHOW)
     _w(f"\n {A.BOLD}{A.CYN}Cloudflare WARP WireGuard Generator{A.RST}\n")
@@ -8753,6 +9924,7 @@ async def _tui_serve_sub(args):
     target_f = res_top if os.path.isfile(res_top) else (res_full if os.path.isfile(res_full) else (files[0][0] if files else ""))
     if not target_f:
         _w(f" {A.YEL}No configs or scanned results found.{A.RST}\n")
+        _fl()
         time.sleep(2)
         return
     _w(f" {A.GRN}Loading configs from: {target_f}{A.RST}\n")
@@ -8760,6 +9932,7 @@ async def _tui_serve_sub(args):
         uris = [l.strip() for l in f if l.strip().startswith(("vless://", "vmess://"))]
     if not uris:
         _w(f" {A.RED}No valid VLESS/VMess links found in {target_f}{A.RST}\n")
+        _fl()
         time.sleep(2)
         return
     st = State()
@@ -8778,6 +9951,7 @@ async def _tui_clean_subs(args):
     src = _tui_prompt_text("Source:")
     if not src: return
     _w(f"\n {A.DIM}Deduplicating & validating...{A.RST}\n")
+    _fl()
     loop = asyncio.get_running_loop()
     tot, uniq, out_p = await loop.run_in_executor(None, clean_subscriptions, src, "")
     if tot > 0:
@@ -8807,7 +9981,14 @@ async def _tui_inspect(args):
 async def run_tui(args, deploy_mode=False):
     """TUI mode: interactive startup + dashboard."""
     enable_ansi()
+    orig_stdout = _tui_stdout_begin()
+    try:
+        return await _run_tui(args, deploy_mode)
+    finally:
+        _tui_stdout_end(orig_stdout)
+
 
+async def _run_tui(args, deploy_mode=False):
     # Determine initial input source from CLI args
     input_method = None  # "file", "sub", or "template"
     input_value = None
@@ -8916,15 +10097,8 @@ async def run_tui(args, deploy_mode=False):
                 mode = picked
             break
 
-        st = State()
-        st.mode = mode
+        st = state_from_args(args, mode=mode)
         st.top = args.top
-        attach_state_args(st, args)
-
-        if args.rounds:
-            st.rounds = parse_rounds_str(args.rounds)
-        elif args.skip_download:
-            st.rounds = []
 
         # Determine display label for loading screen
         if input_method == "sub":
@@ -8992,23 +10166,14 @@ async def run_tui(args, deploy_mode=False):
             run_scan(st, args.workers, args.speed_workers, args.timeout, args.speed_timeout)
         )
 
-        old_sigint = signal.getsignal(signal.SIGINT)
-
-        def _sig(sig, frame):
-            st.interrupted = True
-            st.finished = True
-            scan_task.cancel()
-        signal.signal(signal.SIGINT, _sig)
-
-        try:
-            await scan_task
-        except asyncio.CancelledError:
-            st.interrupted = True
-            st.finished = True
-            calc_scores(st)
-
-        # Restore original SIGINT so Ctrl+C works in post-scan loop
-        signal.signal(signal.SIGINT, old_sigint)
+        # Original SIGINT comes back on exit so Ctrl+C works in post-scan loop
+        with _intercept_sigint(scan_task, st):
+            try:
+                await scan_task
+            except asyncio.CancelledError:
+                st.interrupted = True
+                st.finished = True
+                calc_scores(st)
 
         if refresh:
             refresh.cancel()
@@ -9075,15 +10240,17 @@ async def run_tui(args, deploy_mode=False):
                         st.notify = f"Export error: {e}"
                     st.notify_until = time.monotonic() + 4
                 elif act == "configs":
-                    results = sorted_all(st, dash.sort)
+                    results = dash.sorted_results()
                     if results:
                         n = _prompt_number(f"{A.CYN}Enter rank # to view configs (1-{len(results)}):{A.RST} ", len(results))
+                        dash.invalidate()
                         if n is not None:
                             dash.draw_config_popup(results[n - 1])
                 elif act == "domains":
-                    results = sorted_all(st, dash.sort)
+                    results = dash.sorted_results()
                     if results:
                         n = _prompt_number(f"{A.CYN}Enter rank # to view domains (1-{len(results)}):{A.RST} ", len(results))
+                        dash.invalidate()
                         if n is not None:
                             dash.draw_domain_popup(results[n - 1])
                 elif act == "help":
@@ -9108,17 +10275,23 @@ async def run_tui(args, deploy_mode=False):
         break
 
 
+_HEADLESS_HDR_HEAD = f"{'#':>4} {'IP':<16} {'Dom':>4} {'Ping ms':>7} {'Conn ms':>7}"
+_HEADLESS_HDR_TAIL = f" {'Colo':>5} {'Score':>6}\n"
+
+
+@functools.lru_cache(maxsize=None)
+def _headless_header(n_rounds: int) -> str:
+    """Column header line of the headless results table."""
+    return "".join((
+        _HEADLESS_HDR_HEAD,
+        *[" {:>9}".format(f"R{i} MB/s") for i in range(1, n_rounds + 1)],
+        _HEADLESS_HDR_TAIL,
+    ))
+
+
 async def run_headless(args):
     """Headless mode (--no-tui)."""
-    st = State()
-    st.input_file = args.input
-    st.mode = args.mode
-    attach_state_args(st, args)
-
-    if args.rounds:
-        st.rounds = parse_rounds_str(args.rounds)
-    elif args.skip_download:
-        st.rounds = []
+    st = state_from_args(args, args.input)
 
     print(f"CF Config Scanner v{VERSION}")
     st.configs, src = load_configs_from_args(args)
@@ -9137,53 +10310,47 @@ async def run_headless(args):
         run_scan(st, args.workers, args.speed_workers, args.timeout, args.speed_timeout)
     )
 
-    old_sigint = signal.getsignal(signal.SIGINT)
-
-    def _sig(sig, frame):
-        st.interrupted = True
-        st.finished = True
-        scan_task.cancel()
-    signal.signal(signal.SIGINT, _sig)
-
-    try:
-        await scan_task
-    except asyncio.CancelledError:
-        st.interrupted = True
-        st.finished = True
-        calc_scores(st)
-        print("\n  Interrupted! Exporting partial results...")
-
-    signal.signal(signal.SIGINT, old_sigint)
+    with _intercept_sigint(scan_task, st):
+        try:
+            await scan_task
+        except asyncio.CancelledError:
+            st.interrupted = True
+            st.finished = True
+            calc_scores(st)
+            print("\n  Interrupted! Exporting partial results...")
 
     results = sorted_alive(st, "score")
     elapsed = _fmt_elapsed(time.monotonic() - st.start_time)
-    print(f"\nDone in {elapsed}. {st.alive_n} alive IPs.\n")
-    print(f"{'=' * 95}")
-    hdr = f"{'#':>4} {'IP':<16} {'Dom':>4} {'Ping ms':>7} {'Conn ms':>7}"
-    for i in range(len(st.rounds)):
-        hdr += f" {'R' + str(i + 1) + ' MB/s':>9}"
-    hdr += f" {'Colo':>5} {'Score':>6}"
-    print(hdr)
-    print("=" * 95)
+    # Table is built in memory and written once, not a print() per row
+    buf = io.StringIO()
+    wr = buf.write
+    wr(f"\nDone in {elapsed}. {st.alive_n} alive IPs.\n\n")
+    wr(f"{'=' * 95}\n")
+    n_rounds = len(st.rounds)
+    wr(_headless_header(n_rounds))
+    wr("=" * 95 + "\n")
     for rank, r in enumerate(results[:50], 1):
-        tcp = f"{r.tcp_ms:7.1f}" if r.tcp_ms > 0 else "      -"
-        tls = f"{r.tls_ms:7.1f}" if r.tls_ms > 0 else "      -"
-        row = f"{rank:>4} {r.ip:<16} {len(r.domains):>4} {tcp} {tls}"
-        for j in range(len(st.rounds)):
-            if j < len(r.speeds) and r.speeds[j] > 0:
-                row += f" {r.speeds[j]:>9.2f}"
-            else:
-                row += "         -"
-        cl = f"{r.colo:>5}" if r.colo else "    -"
-        sc = f"{r.score:>6.1f}" if r.score > 0 else "     -"
-        row += f" {cl} {sc}"
-        print(row)
+        sp = r.speeds
+        wr("".join((
+            f"{rank:>4} {r.ip:<16} {len(r.domains):>4} ",
+            f"{r.tcp_ms:7.1f}" if r.tcp_ms > 0 else "      -",
+            " ",
+            f"{r.tls_ms:7.1f}" if r.tls_ms > 0 else "      -",
+            *[f" {sp[j]:>9.2f}" if j < len(sp) and sp[j] > 0 else "         -"
+              for j in range(n_rounds)],
+            f" {r.colo:>5} " if r.colo else "     - ",
+            f"{r.score:>6.1f}" if r.score > 0 else "     -",
+            "\n",
+        )))
+    _w(buf.getvalue())
+    _fl()
 
     try:
         csv_p, cfg_p, full_p = do_export(
             st, args.input or "scan", top=args.top,
-            output_csv=getattr(args, "output", "") or "",
-            output_configs=getattr(args, "output_configs", "") or "",
+            output_csv=args.output or "",
+            output_configs=args.output_configs or "",
+            results=results,
         )
         print(f"\nResults saved:")
         print(f"  CSV:     {csv_p}")
@@ -9195,75 +10362,71 @@ async def run_headless(args):
 
 async def run_headless_clean(args):
     """Headless clean IP finder (--find-clean --no-tui)."""
-    scan_cfg = CLEAN_MODES.get(getattr(args, "clean_mode", "normal"), CLEAN_MODES["normal"])
+    scan_cfg = CLEAN_MODES.get(args.clean_mode, CLEAN_MODES["normal"])
 
-    subnets = CF_SUBNETS
-    if getattr(args, "subnets", None):
-        if os.path.isfile(args.subnets):
-            with open(args.subnets, encoding="utf-8") as f:
-                subnets = [ln.strip() for ln in f if ln.strip() and not ln.startswith("#")]
-        else:
-            subnets = [s.strip() for s in args.subnets.split(",") if s.strip()]
+    # --subnets is parsed into a tuple of CIDRs by _load_subnets at argv time
+    subnets = CF_SUBNETS if args.subnets is None else args.subnets
 
     ports = scan_cfg.get("ports", [443])
     print(f"CF Config Scanner v{VERSION} — Clean IP Finder")
     print(f"Ranges: {len(subnets)}  |  Sample: {scan_cfg['sample'] or 'all'}  |  Workers: {scan_cfg['workers']}  |  Ports: {', '.join(str(p) for p in ports)}")
 
     ips = generate_cf_ips(subnets, scan_cfg["sample"])
-    total_probes = len(ips) * len(ports)
-    print(f"Scanning {len(ips):,} IPs × {len(ports)} port(s) = {total_probes:,} probes...")
+    n_ips = count_cf_ips(subnets, scan_cfg["sample"])
+    total_probes = n_ips * len(ports)
+    print(f"Scanning {n_ips:,} IPs × {len(ports)} port(s) = {total_probes:,} probes...")
 
-    cs = CleanScanState()
+    cs = CleanScanState(progress_evt=asyncio.Event())
     start = time.monotonic()
 
     scan_task = asyncio.ensure_future(
         scan_clean_ips(
             ips, workers=scan_cfg["workers"], timeout=3.0,
-            validate=scan_cfg["validate"], cs=cs, ports=ports,
+            validate=scan_cfg["validate"], cs=cs, ports=ports, total=n_ips,
         )
     )
 
-    old_sigint = signal.getsignal(signal.SIGINT)
-    def _sig(sig, frame):
-        cs.interrupted = True
-        scan_task.cancel()
-    signal.signal(signal.SIGINT, _sig)
-
-    last_pct = -1
-    try:
-        while not scan_task.done():
-            pct = cs.done * 100 // max(1, cs.total)
-            if pct != last_pct and pct % 5 == 0:
-                print(f"  {pct}%  ({cs.done:,}/{cs.total:,})  found {cs.found:,} clean")
-                last_pct = pct
-            await asyncio.sleep(1)
-    except (asyncio.CancelledError, Exception):
-        pass
-    finally:
-        signal.signal(signal.SIGINT, old_sigint)
+    # Woken by the scan every ~1% of probes instead of polling; the
+    # timeout only matters before the first probes finish
+    evt = cs.progress_evt
+    last_pct = -5
+    with _intercept_sigint(scan_task, cs, finish=False):
+        try:
+            while not scan_task.done():
+                evt.clear()
+                pct = cs.done * 100 // max(1, cs.total)
+                if pct - last_pct >= 5:
+                    print(f"  {pct}%  ({cs.done:,}/{cs.total:,})  found {cs.found:,} clean")
+                    last_pct = pct - pct % 5
+                try:
+                    await asyncio.wait_for(evt.wait(), timeout=2.0)
+                except asyncio.TimeoutError:
+                    pass
+        except (asyncio.CancelledError, Exception):
+            pass
 
     try:
         results = await scan_task
     except (asyncio.CancelledError, Exception):
-        results = sorted(cs.all_results or cs.results, key=lambda x: x[1])
+        results = _clean_partial_results(cs)
 
     elapsed = _fmt_elapsed(time.monotonic() - start)
-    print(f"\nDone in {elapsed}. Found {len(results):,} clean IPs.\n")
-    print(f"{'='*50}")
-    print(f"{'#':>4} {'Address':<22} {'Latency':>8}")
-    print(f"{'='*50}")
-    for i, (ip, lat) in enumerate(results[:30]):
-        print(f"{i+1:>4} {ip:<22} {lat:>6.0f}ms")
+    buf = io.StringIO()
+    wr = buf.write
+    wr(f"\nDone in {elapsed}. Found {len(results):,} clean IPs.\n\n")
+    wr(f"{'='*50}\n")
+    wr(f"{'#':>4} {'Address':<22} {'Latency':>8}\n")
+    wr(f"{'='*50}\n")
+    for i, (ip, lat) in enumerate(itertools.islice(results, 30)):
+        wr(f"{i+1:>4} {ip:<22} {lat:>6.0f}ms\n")
     if len(results) > 30:
-        print(f"     ...and {len(results)-30:,} more")
+        wr(f"     ...and {len(results)-30:,} more\n")
+    _w(buf.getvalue())
+    _fl()
 
     if results:
         try:
-            os.makedirs(RESULTS_DIR, exist_ok=True)
-            path = os.path.abspath(_results_path("clean_ips.txt"))
-            with open(path, "w", encoding="utf-8") as f:
-                for ip, lat in results:
-                    f.write(f"{ip}\n")
+            path = _save_clean_ips(results)
             print(f"\nSaved {len(results):,} IPs to {path}")
         except Exception as e:
             print(f"\nSave error: {e}")
@@ -9273,21 +10436,14 @@ async def run_headless_clean(args):
         path = ""
 
     # If --template also given, proceed to speed test
-    if getattr(args, "template", None) and results:
+    if args.template and results:
         print(f"\nContinuing to speed test with template...")
-        addrs = [ip for ip, _ in results]
+        addrs = list(results.iter_addrs())
         configs = generate_from_template(args.template, addrs)
         if configs:
             args.input = path
-            st = State()
-            st.input_file = f"clean ({len(results)} IPs)"
-            st.mode = args.mode
+            st = state_from_args(args, f"clean ({len(results)} IPs)")
             st.configs = configs
-            attach_state_args(st, args)
-            if args.rounds:
-                st.rounds = parse_rounds_str(args.rounds)
-            elif args.skip_download:
-                st.rounds = []
             print(f"Generated {len(configs)} configs")
             print("Resolving DNS...")
             await resolve_all(st)
@@ -9297,28 +10453,26 @@ async def run_headless_clean(args):
                 scan2 = asyncio.ensure_future(
                     run_scan(st, args.workers, args.speed_workers, args.timeout, args.speed_timeout)
                 )
-                old2 = signal.getsignal(signal.SIGINT)
-                def _sig2(sig, frame):
-                    st.interrupted = True
-                    st.finished = True
-                    scan2.cancel()
-                signal.signal(signal.SIGINT, _sig2)
-                try:
-                    await scan2
-                except asyncio.CancelledError:
-                    st.interrupted = True
-                    st.finished = True
-                    calc_scores(st)
-                signal.signal(signal.SIGINT, old2)
+                with _intercept_sigint(scan2, st):
+                    try:
+                        await scan2
+                    except asyncio.CancelledError:
+                        st.interrupted = True
+                        st.finished = True
+                        calc_scores(st)
 
                 alive_results = sorted_alive(st, "score")
                 elapsed2 = _fmt_elapsed(time.monotonic() - start2)
-                print(f"\nSpeed test done in {elapsed2}. {st.alive_n} alive.")
-                print(f"{'='*80}")
+                buf = io.StringIO()
+                wr = buf.write
+                wr(f"\nSpeed test done in {elapsed2}. {st.alive_n} alive.\n")
+                wr(f"{'='*80}\n")
                 for rank, r in enumerate(alive_results[:20], 1):
                     spd = f"{r.best_mbps:.2f}" if r.best_mbps > 0 else "    -"
                     lat_s = f"{r.tls_ms:.0f}" if r.tls_ms > 0 else "  -"
-                    print(f"{rank:>3} {r.ip:<16} {lat_s:>6}ms  {spd:>8} MB/s  score={r.score:.1f}")
+                    wr(f"{rank:>3} {r.ip:<16} {lat_s:>6}ms  {spd:>8} MB/s  score={r.score:.1f}\n")
+                _w(buf.getvalue())
+                _fl()
                 try:
                     csv_p, cfg_p, full_p = do_export(st, path, top=args.top)
                     print(f"\nSaved: {csv_p}  |  {cfg_p}  |  {full_p}")
@@ -9326,6 +10480,130 @@ async def run_headless_clean(args):
                     print(f"Export error: {e}")
 
 
+def _use_uvloop():
+    """Run asyncio on uvloop when it happens to be installed (never required).
+
+    The scans open tens of thousands of short TCP/TLS connections, and
+    libuv's reactor handles that fan-out with less per-connection overhead
+    than the default selector loop. Windows keeps the stock loop.
+    """
+    if sys.platform == "win32":
+        return
+    try:
+        import uvloop
+    except ImportError:
+        return
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+
+# /proc/interrupts names of NIC and NVMe queues (last column)
+_IRQ_DEVICES = ("eth", "en", "wl", "mlx", "virtio", "nvme")
+
+
+def _irq_cpus() -> Set[int]:
+    """CPUs that have serviced NIC/NVMe interrupts, per /proc/interrupts."""
+    try:
+        with open("/proc/interrupts") as f:
+            header = f.readline().split()
+            rows = f.readlines()
+    except OSError:
+        return set()
+    cpus = [int(c[3:]) for c in header if c.startswith("CPU") and c[3:].isdigit()]
+    busy: Set[int] = set()
+    for line in rows:
+        parts = line.split()
+        if len(parts) <= len(cpus) or not parts[-1].startswith(_IRQ_DEVICES):
+            continue
+        for cpu, n in zip(cpus, parts[1:]):
+            if n != "0":
+                busy.add(cpu)
+    return busy
+
+
+def _pin_away_from_irqs():
+    """Opt-in (CFRAY_PIN=1): keep this process off the CPUs that take
+    network/storage interrupts, so mega scans' connect storms don't share
+    a core with the softirq work they generate.
+
+    Linux only. Works from the current affinity mask, so cgroup/cpuset
+    limits are respected; if every allowed CPU takes such IRQs nothing
+    changes. In small containers this can leave few cores, and xray
+    child processes inherit the mask, which is why it is off by default.
+    """
+    if os.environ.get("CFRAY_PIN") != "1" or not hasattr(os, "sched_setaffinity"):
+        return
+    try:
+        allowed = os.sched_getaffinity(0)
+        keep = allowed - _irq_cpus()
+        if keep and keep != allowed:
+            os.sched_setaffinity(0, keep)
+    except OSError:
+        pass
+
+
+def _cli_xray_install(args):
+    path = xray_install()
+    if path:
+        print(f"Installed: {path}")
+
+
+def _cli_uninstall(args):
+    ok, msg = _uninstall_all()
+    print(msg)
+
+
+def _cli_warp(args):
+    print("🔄 Registering anonymous Cloudflare WARP client...")
+    ok, conf, err = generate_warp_config()
+    if ok:
+        print(conf)
+        os.makedirs("results", exist_ok=True)
+        out_p = os.path.join("results", "warp.conf")
+        with open(out_p, "w") as f: f.write(conf)
+        print(f"\n✅ Saved WARP config to {out_p} ({err})")
+    else:
+        print(f"❌ Error: {err}")
+
+
+def _cli_serve_sub(args):
+    port = args.serve_sub or 8080
+    st = State()
+    files = find_config_files()
+    res_top = os.path.join("results", "scan_top50.txt")
+    target_f = res_top if os.path.isfile(res_top) else (files[0][0] if files else "")
+    if target_f:
+        with open(target_f, encoding="utf-8", errors="replace") as f:
+            uris = [l.strip() for l in f if l.strip().startswith(("vless://", "vmess://"))]
+        st.res["localhost"] = Result(ip="localhost", uris=uris, alive=True)
+        st.top = len(uris)
+    run_sub_server(st, port)
+
+
+def _cli_clean_subs(args):
+    tot, uniq, out_p = clean_subscriptions(args.clean_subs, "")
+    if tot > 0:
+        print(f"✅ Cleaned {tot} inputs -> Kept {uniq} unique links. Saved to: {out_p}")
+    else:
+        print(f"❌ Could not load any valid VLESS/VMess subscription links from '{args.clean_subs}'.")
+
+
+def _cli_inspect(args):
+    ok, diag = inspect_uri(args.inspect)
+    print(diag)
+
+
+# One-shot commands that exit without scanning, checked in this order;
+# the first flag that is set (not None/False/"") runs and main() returns
+_CLI_ACTIONS = (
+    ("xray_install", _cli_xray_install),
+    ("uninstall", _cli_uninstall),
+    ("warp", _cli_warp),
+    ("serve_sub", _cli_serve_sub),  # --serve-sub 0 still counts as set
+    ("clean_subs", _cli_clean_subs),
+    ("inspect", _cli_inspect),
+)
+
+
 def main():
     if hasattr(sys.stdout, "reconfigure"):
         try:
@@ -9372,7 +10650,8 @@ Examples:
     p.add_argument("--find-clean", action="store_true", help="Find clean Cloudflare IPs")
     p.add_argument("--clean-mode", choices=["quick", "normal", "full", "mega"], default="normal",
                    help="Clean IP scan scope (quick=~4K, normal=~12K, full=~1.5M, mega=~3M multi-port)")
-    p.add_argument("--subnets", help="Custom subnets file or comma-separated CIDRs")
+    p.add_argument("--subnets", type=_load_subnets,
+                   help="Custom subnets file or comma-separated CIDRs")
     # Xray Proxy Testing
     p.add_argument("--xray", metavar="URI",
                    help="VLESS/VMess URI to test through Xray-core proxy")
@@ -9424,63 +10703,25 @@ Examples:
             pass
 
     try:
-        if getattr(args, "xray_install", False):
-            path = xray_install()
-            if path:
-                print(f"Installed: {path}")
-            return
-        if getattr(args, "uninstall", False):
-            ok, msg = _uninstall_all()
-            print(msg)
-            return
-        if getattr(args, "warp", False):
-            print("🔄 Registering anonymous Cloudflare WARP client...")
-            ok, conf, err = generate_warp_config()
-            if ok:
-                print(conf)
-                os.makedirs("results", exist_ok=True)
-                out_p = os.path.join("results", "warp.conf")
-                with open(out_p, "w") as f: f.write(conf)
-                print(f"\n✅ Saved WARP config to {out_p} ({err})")
-            else:
-                print(f"❌ Error: {err}")
-            return
-        if getattr(args, "serve_sub", None) is not None:
-            port = args.serve_sub or 8080
-            st = State()
-            files = find_config_files()
-            res_top = os.path.join("results", "scan_top50.txt")
-            target_f = res_top if os.path.isfile(res_top) else (files[0][0] if files else "")
-            if target_f:
-                with open(target_f, encoding="utf-8", errors="replace") as f:
-                    uris = [l.strip() for l in f if l.strip().startswith(("vless://", "vmess://"))]
-                st.res["localhost"] = Result(ip="localhost", uris=uris, alive=True)
-                st.top = len(uris)
-            run_sub_server(st, port)
-            return
-        if getattr(args, "clean_subs", None):
-            tot, uniq, out_p = clean_subscriptions(args.clean_subs, "")
-            if tot > 0:
-                print(f"✅ Cleaned {tot} inputs -> Kept {uniq} unique links. Saved to: {out_p}")
-            else:
-                print(f"❌ Could not load any valid VLESS/VMess subscription links from '{args.clean_subs}'.")
-            return
-        if getattr(args, "inspect", None):
-            ok, diag = inspect_uri(args.inspect)
-            print(diag)
-            return
-        if getattr(args, "deploy", None):
+        for flag, action in _CLI_ACTIONS:
+            val = getattr(args, flag)
+            if val is not None and val is not False and val != "":
+                action(args)
+                return
+        _use_uvloop()
+        _pin_away_from_irqs()
+        if args.deploy:
             if sys.platform != "linux":
                 print("Error: --deploy is only supported on Linux.")
                 return
             asyncio.run(run_tui(args, deploy_mode=True))
             return
-        if getattr(args, "find_clean", False) and args.no_tui:
+        if args.find_clean and args.no_tui:
             asyncio.run(run_headless_clean(args))
         elif args.no_tui:
             if not args.input and not args.sub and not args.template:
                 p.error("--input, --sub, or --template is required in --no-tui mode")
-            if getattr(args, "watch", None) and args.watch > 0:
+            if args.watch and args.watch > 0:
                 print(f"⏱️ Watchdog Daemon running: re-scanning every {args.watch}s...")
                 while True:
                     asyncio.run(run_headless(args))